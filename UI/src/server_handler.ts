@@ -4,13 +4,31 @@
 import * as net from 'net';
 import * as vscode from 'vscode';
 
+// Every message is a 4 byte big-endian payload length followed by the payload.
+const HEADER_SIZE = 4;
+
+interface PendingRequest {
+    event: string;
+    notebook;
+    resolve: (value) => void;
+    reject: (reason?) => void;
+}
+
 export class ServerHandler {
     diagnosticCollection: vscode.DiagnosticCollection;
+    client: net.Socket = undefined;
+    buffer: Buffer = Buffer.alloc(0);
+    nextId: number = 0;
+    pending: Map<number, PendingRequest> = new Map();
+
     constructor(diagnosticCollection: vscode.DiagnosticCollection) {
         this.diagnosticCollection = diagnosticCollection;
     }
-    serializeMessage(action: string, parameters?, notebookUri?): string {
+    serializeMessage(action: string, parameters?, notebookUri?, id?: number): string {
         let message = {event: action};
+        if (id != undefined) {
+            message["id"] = id;
+        }
         if(parameters){
             message["params"] = parameters;
         }
@@ -20,9 +38,78 @@ export class ServerHandler {
         return JSON.stringify(message);
     }
 
+    frameMessage(message: string): Buffer {
+        let payload = Buffer.from(message, 'utf-8');
+        let header = Buffer.alloc(HEADER_SIZE);
+        header.writeUInt32BE(payload.length, 0);
+        return Buffer.concat([header, payload]);
+    }
+
+    getClient(): net.Socket {
+        if (this.client) {
+            return this.client;
+        }
+        let client = new net.Socket();
+        client.on('error', (err) => {
+            console.log(err.message)
+            this.failPending(client);
+        });
+        client.on('close', () => {
+            this.failPending(client);
+        });
+        client.on('data', (data) => {
+            this.buffer = Buffer.concat([this.buffer, data]);
+            while (this.buffer.length >= HEADER_SIZE) {
+                let length = this.buffer.readUInt32BE(0);
+                if (this.buffer.length < HEADER_SIZE + length) {
+                    break;
+                }
+                let payload = this.buffer.subarray(HEADER_SIZE, HEADER_SIZE + length);
+                this.buffer = this.buffer.subarray(HEADER_SIZE + length);
+                this.response_handler(payload);
+            }
+        });
+        client.connect(9999, 'localhost');
+        this.client = client;
+        return client;
+    }
+
+    failPending(client: net.Socket) {
+        if (this.client != client) {
+            return;
+        }
+        client.destroy();
+        this.client = undefined;
+        this.buffer = Buffer.alloc(0);
+        let pending = this.pending;
+        this.pending = new Map();
+        pending.forEach((request) => {
+            if (request.event == "open_notebook") {
+                request.reject("Server isn't running.");
+            }
+            else if (request.event != "close") {
+                vscode.window.showErrorMessage("Nblyzer server stopped unexpectedly. Please close all notebooks and start NBLyzer again.")
+                request.resolve(undefined);
+            }
+            else {
+                request.resolve(undefined);
+            }
+        });
+    }
+
+    response_handler(payload: Buffer) {
+        let data_json = JSON.parse(payload.toString('utf-8'));
+        let request = this.pending.get(data_json.id);
+        if (!request) {
+            return;
+        }
+        this.pending.delete(data_json.id);
+        this.result_handler(data_json, request.notebook);
+        request.resolve(payload);
+    }
+
     postToServer(event: string, notebook?, params?) {
         return new Promise((resolve, reject) => {
-            var client = new net.Socket();
             let notebook_path;
             if(notebook == undefined) {
                 notebook_path = undefined;
@@ -30,24 +117,9 @@ export class ServerHandler {
             else {
                 notebook_path = notebook.uri.path;
             }
-            client.on('error', (err) => {
-                client.destroy()
-                console.log(err.message)
-                if (event == "open_notebook") {
-                    reject("Server isn't running.");
-                }
-                else {
-                    vscode.window.showErrorMessage("Nblyzer server stopped unexpectedly. Please close all notebooks and start NBLyzer again.")
-                }
-            });
-            client.on('data', (data) => {
-                this.result_handler(data, notebook);
-                resolve(data);
-                client.destroy();
-            });
-            client.connect(9999, 'localhost', () => {
-                client.write(this.serializeMessage(event, params, notebook_path));
-            });
+            let id = this.nextId++;
+            this.pending.set(id, {event: event, notebook: notebook, resolve: resolve, reject: reject});
+            this.getClient().write(this.frameMessage(this.serializeMessage(event, params, notebook_path, id)));
         });
     }
 
@@ -67,9 +139,8 @@ export class ServerHandler {
         return contents;
     }
 
-    result_handler(data, notebook) {
-        console.log(`server response: ${data}`);
-        var data_json = JSON.parse(data.toString('utf-8'));
+    result_handler(data_json, notebook) {
+        console.log(`server response: ${JSON.stringify(data_json)}`);
         if (data_json.status == "success") {
             try {
                 notebook.getCells().forEach(cell => {
@@ -0,0 +1,229 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from simple_cfg.cfg_factory import get_cfg
+import gast as ast
+import ast as ast_for_cfg
+import hashlib
+from threading import RLock
+from .visitors import *
+from .. import timing
+
+# Bump whenever the layout of CodeRepresentations changes so stale cache entries are never reused.
+IR_VERSION = 6
+
+def source_hash(cell_code: str) -> str:
+    return hashlib.sha1(cell_code.encode("utf-8")).hexdigest()
+
+def reverse_postorder(cfg) -> dict:
+    '''
+    Rank of every CFG node in reverse postorder of a depth-first search from the entry node.
+    Successors are searched last to first, so that a loop body is ranked before the code after
+    the loop and an if branch before the else branch. Nodes that are not reachable from the entry
+    are ranked last, in CFG order.
+    '''
+    entry = cfg.nodes[0]
+    visited = {entry}
+    postorder = []
+    stack = [(entry, reversed(entry.outgoing))]
+    while stack:
+        node, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, reversed(successor.outgoing)))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+    order = postorder[::-1] + [node for node in cfg.nodes if node not in visited]
+    return {node: rank for rank, node in enumerate(order)}
+
+def assign_summaries(cfg) -> dict:
+    '''
+    Defined and used variables of every assignment node of the CFG, as frozensets.
+    '''
+    summaries = {}
+    for node in cfg.nodes:
+        if isinstance(node.ast_node, ast_for_cfg.Assign):
+            assign_parser = AssignParserVisitor()
+            assign_parser.parse_assign(node.ast_node)
+            summaries[node] = (frozenset(assign_parser.def_variables), frozenset(assign_parser.assigned_variables))
+    return summaries
+
+def statement_hashes(cfg) -> dict:
+    '''
+    Merkle hash of the statement of every CFG node that has one. A tree hashes its node type together
+    with the hashes of its fields, so two statements have the same hash exactly when their ast.dump
+    is the same, and subtrees shared between nodes (e.g. the body of a loop and the assignments in it)
+    are hashed once.
+    '''
+    digests = {}
+
+    def digest(value) -> bytes:
+        if isinstance(value, ast_for_cfg.AST):
+            if id(value) not in digests:
+                h = hashlib.blake2b(type(value).__name__.encode("utf-8"), digest_size=16)
+                for field in value._fields:
+                    h.update(digest(getattr(value, field, None)))
+                digests[id(value)] = h.digest()
+            return digests[id(value)]
+        if isinstance(value, list):
+            h = hashlib.blake2b(b"list %d" % len(value), digest_size=16)
+            for element in value:
+                h.update(digest(element))
+            return h.digest()
+        return hashlib.blake2b(repr(value).encode("utf-8"), digest_size=16).digest()
+
+    return {node: digest(node.ast_node) for node in cfg.nodes if node.ast_node is not None}
+
+class CodeRepresentations:
+    '''
+    Cell independent representations (AST, CFG, UDA summaries) of a magic-free cell source.
+    Instances are shared through the IR cache by all cells with the same source, so they must not be mutated.
+
+    The cell is parsed eagerly so syntax errors surface when the notebook is loaded. The AST, the CFG and
+    what is derived from it (reverse postorder, statement hashes, assignment summaries) and the UDA
+    summaries are built on first access and memoized, e.g. idle and isolated cell checks never build a CFG.
+    Sessions share instances across threads, so the lazy builds hold a per-instance lock: building the CFG
+    rewrites the parsed tree in place and must not run while another thread converts the same tree.
+    '''
+    def __init__(self, cell_code = "") -> None:
+        self._lock = RLock()
+        self.cell_code = cell_code
+        self.source_hash = source_hash(cell_code)
+        with timing.timed(timing.PARSE):
+            self._tree = ast_for_cfg.parse(self.cell_code)
+        self._AST = None
+        self._CFG = None
+        self._RPO = None
+        self._HASHES = None
+        self._ASSIGNS = None
+        self._UDA = None
+        self._interface = None
+
+    @property
+    def AST(self):
+        if self._AST is None:
+            with self._lock:
+                if self._AST is None:
+                    self.update_AST(self._tree)
+        return self._AST
+
+    @property
+    def CFG(self):
+        if self._CFG is None:
+            with self._lock:
+                if self._CFG is None:
+                    # simple_cfg consumes the parsed tree, so the gast AST is derived from it first.
+                    if self._AST is None:
+                        self.update_AST(self._tree)
+                    self.update_cfg(self._tree)
+                    self._tree = None
+        return self._CFG
+
+    @property
+    def RPO(self):
+        '''
+        Reverse postorder rank of the CFG nodes, the order in which the intra cell fixpoint transforms them.
+        '''
+        if self._RPO is None:
+            cfg = self.CFG
+            with self._lock:
+                if self._RPO is None:
+                    self._RPO = reverse_postorder(cfg)
+        return self._RPO
+
+    @property
+    def HASHES(self):
+        '''
+        Structural hash of the statement of every CFG node, used to diff a cell against its last run.
+        '''
+        if self._HASHES is None:
+            cfg = self.CFG
+            with self._lock:
+                if self._HASHES is None:
+                    self._HASHES = statement_hashes(cfg)
+        return self._HASHES
+
+    @property
+    def ASSIGNS(self):
+        '''
+        (defined variables, used variables) of every assignment node of the CFG, so transformers do not
+        walk the assignment again on every visit.
+        '''
+        if self._ASSIGNS is None:
+            cfg = self.CFG
+            with self._lock:
+                if self._ASSIGNS is None:
+                    self._ASSIGNS = assign_summaries(cfg)
+        return self._ASSIGNS
+
+    @property
+    def UDA(self):
+        if self._UDA is None:
+            with self._lock:
+                if self._UDA is None:
+                    self.update_assigns()
+        return self._UDA
+
+    @property
+    def interface(self):
+        '''
+        Names the cell reads before defining them, defines, imports and calls, i.e. everything the analysis of
+        other cells reads from this cell without transforming it.
+        '''
+        if self._interface is None:
+            uda = self.UDA
+            self._interface = (
+                frozenset(uda.def_use_chains.unbound_names),
+                frozenset(uda.unbound_final),
+                frozenset(uda.defined_vars.keys()),
+                frozenset(uda.imports),
+                frozenset(uda.funcs)
+            )
+        return self._interface
+
+    def update_AST(self, tree = None):
+        '''
+        Converts an already parsed stdlib tree to gast instead of parsing the cell again.
+        '''
+        with timing.timed(timing.PARSE):
+            self._AST = ast.ast_to_gast(tree) if tree is not None else ast.parse(self.cell_code)
+
+    def update_cfg(self, tree = None):
+        '''
+        simple_cfg rewrites the tree in place, so a shared tree must be converted by update_AST first.
+        '''
+        if tree is None:
+            with timing.timed(timing.PARSE):
+                tree = ast_for_cfg.parse(self.cell_code)
+        with timing.timed(timing.CFG):
+            self._CFG = get_cfg(tree, None)
+
+    def update_assigns(self):
+        tree = self.AST
+        with timing.timed(timing.BENIGET):
+            defUseChains = DefUseVisitor()
+            defUseChains.visit(tree)
+        with timing.timed(timing.UDA):
+            uda = AssignsVisitor(defUseChains)
+            uda.visit(tree)
+            uda.combine()
+        # Published only once complete, threads reading UDA without the lock never see a partial summary.
+        self._UDA = uda
+
+    def __getstate__(self):
+        '''
+        Pickled IR (disk cache, worker processes) always carries the CFG and UDA summaries.
+        The AST is only read while building those, so it is dropped and re-parsed on access, and the
+        reverse postorder, statement hashes and assignment summaries are cheap to recompute from the CFG,
+        as is the interface from the UDA summaries.
+        '''
+        state = dict(self.__dict__, _CFG=self.CFG, _UDA=self.UDA, _tree=None, _AST=None, _RPO=None, _HASHES=None, _ASSIGNS=None, _interface=None)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = RLock()
@@ -1,10 +1,8 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from simple_cfg.cfg_factory import get_cfg
-import gast as ast
-import ast as ast_for_cfg
-from .visitors import *
+from .code_representations import CodeRepresentations
+from .ir_cache import ir_cache
 import re
 
 class IntermediateRepresentations:
@@ -12,11 +10,10 @@ class IntermediateRepresentations:
         self.cell_id = cell_id
         self.cell_code = self.remove_magic(cell_code)
         self.last_ran_code = last_ran_code
-        self.update_AST()
-        self.update_cfg()
-        self.update_assigns()
+        self.code_IR: CodeRepresentations = ir_cache.get(self.cell_code)
 
-    def remove_magic(self, cell_code):
+    @staticmethod
+    def remove_magic(cell_code):
         new_cell_code = ""
         pat1 = "^[!\\%]"
         for ds in cell_code.splitlines():
@@ -26,19 +23,30 @@ class IntermediateRepresentations:
                 else:
                     new_cell_code = new_cell_code + "\n" + ds
         return new_cell_code
-        
-    def update_AST(self):
-        self.AST = ast.parse(self.cell_code)
-
-    def update_cfg(self):
-        self.CFG = get_cfg(ast_for_cfg.parse(self.cell_code), self.cell_id) 
-
-    def update_assigns(self):
-        defUseChains = DefUseVisitor()
-        defUseChains.visit(self.AST)        
-        self.UDA = AssignsVisitor(defUseChains)
-        self.UDA.visit(self.AST)
-        self.UDA.combine()
+
+    @property
+    def AST(self):
+        return self.code_IR.AST
+
+    @property
+    def CFG(self):
+        return self.code_IR.CFG
+
+    @property
+    def RPO(self):
+        return self.code_IR.RPO
+
+    @property
+    def HASHES(self):
+        return self.code_IR.HASHES
+
+    @property
+    def ASSIGNS(self):
+        return self.code_IR.ASSIGNS
+
+    @property
+    def UDA(self):
+        return self.code_IR.UDA
 
     def __eq__(self, __o: object) -> bool:
         return self.cell_id == __o.cell_id and self.cell_code == __o.cell_code
@@ -0,0 +1,154 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import multiprocessing
+import os
+from .code_representations import CodeRepresentations, IR_VERSION, source_hash
+from . import serialization
+from ..constants import NBLYZER_VERSION
+
+def process_pool(workers: int, **kwargs) -> ProcessPoolExecutor:
+    """
+    Pool of worker processes forked from this one where fork is available (spawned otherwise), so that
+    workers start fast, inherit the loaded IR and iterate sets in the same order as a serial run.
+    Forking is only safe from a single threaded process: a child forked while another thread holds a lock
+    (of the IR cache, of a CodeRepresentations) waits for it forever. The server, which runs events in
+    threads, therefore refuses events with more than one worker.
+    """
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method), **kwargs)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize", "disk_hits"])
+
+class IRCache:
+    """
+    Size-bounded LRU cache mapping (cell source hash, IR version) to shared CodeRepresentations.
+    Re-running or re-opening a cell with unchanged source reuses its IR instead of parsing it again.
+    If a directory is set, IR is also persisted there so batch runs can skip parsing across processes.
+    Hits are served from memory, disk hits from the directory and misses are the sources actually parsed.
+    """
+
+    def __init__(self, maxsize: int = 2048, directory: str = None) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.entries: OrderedDict[tuple[str, int], CodeRepresentations] = OrderedDict()
+        self.lock = Lock()
+        self.set_directory(directory)
+
+    def set_directory(self, directory: str = None) -> None:
+        """
+        Enables the on-disk cache in the given directory, or disables it if None.
+        Entries are stored per NBLyzer and IR version, so upgrades never read stale IR.
+        """
+        self.directory = None
+        if directory:
+            self.directory = os.path.join(directory, f"{NBLYZER_VERSION}-{IR_VERSION}")
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, cell_code: str) -> CodeRepresentations:
+        """
+        Returns the representations of a magic-free cell source, building and caching them on a miss.
+
+        Parameters
+        ----------
+        cell_code: str
+            Source of the cell, already stripped of magic commands
+
+        Returns
+        ----------
+            CodeRepresentations shared by every cell with the same source.
+        """
+        key = (source_hash(cell_code), IR_VERSION)
+        with self.lock:
+            code_IR = self.entries.get(key)
+            if code_IR is not None and code_IR.cell_code == cell_code:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return code_IR
+
+        code_IR = self._load(key[0], cell_code)
+        if code_IR is None:
+            with self.lock:
+                self.misses += 1
+            code_IR = CodeRepresentations(cell_code)
+            self._store(key[0], code_IR)
+        self.put(key, code_IR)
+        return code_IR
+
+    def prefetch(self, cell_codes: list[str], workers: int) -> None:
+        """
+        Builds the representations of all uncached sources in a pool of worker processes.
+        The IR is pickled back to this process and inserted in the cache, so the following
+        get calls for these sources are hits.
+
+        Parameters
+        ----------
+        cell_codes: list[str]
+            Magic-free cell sources
+        workers: int
+            Number of worker processes
+        """
+        with self.lock:
+            missing = list(dict.fromkeys(
+                code for code in cell_codes if (source_hash(code), IR_VERSION) not in self.entries
+            ))
+        if not missing:
+            return
+
+        with process_pool(min(workers, len(missing))) as pool:
+            for code_IR in pool.map(_build_code_IR, missing, chunksize=max(1, len(missing) // (4 * workers))):
+                self.put((code_IR.source_hash, IR_VERSION), code_IR)
+
+    def put(self, key: tuple[str, int], code_IR: CodeRepresentations) -> None:
+        with self.lock:
+            self.entries[key] = code_IR
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def _entry_path(self, key_hash: str) -> str:
+        return os.path.join(self.directory, key_hash + ".ir")
+
+    def _load(self, key_hash: str, cell_code: str) -> CodeRepresentations:
+        if not self.directory:
+            return None
+        try:
+            with open(self._entry_path(key_hash), "rb") as f:
+                code_IR = serialization.loads(f.read())
+        except Exception:
+            # Missing, truncated or incompatible entries are rebuilt from source.
+            return None
+        if code_IR.cell_code != cell_code:
+            return None
+        with self.lock:
+            self.disk_hits += 1
+        return code_IR
+
+    def _store(self, key_hash: str, code_IR: CodeRepresentations) -> None:
+        if not self.directory:
+            return
+        tmp_path = self._entry_path(key_hash) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(serialization.dumps(code_IR))
+        os.replace(tmp_path, self._entry_path(key_hash))
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries), self.disk_hits)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.disk_hits = 0
+
+
+def _build_code_IR(cell_code: str) -> CodeRepresentations:
+    return ir_cache.get(cell_code)
+
+ir_cache: IRCache = IRCache()
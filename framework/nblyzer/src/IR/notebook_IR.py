@@ -0,0 +1,254 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import weakref
+from collections import defaultdict
+from .intermediate_representations import IntermediateRepresentations
+
+class SymbolTable:
+    '''
+    Names that the code cells of a notebook define (UDA.defined_vars, with the ids of the defining
+    cells), read before any definition (unbound names of the def-use chains) and import (reference
+    counts). A name is in a table as long as at least one cell has it, so the set of names of a kind is
+    a dict keys view that stays up to date as cells are added and removed.
+
+    Incremental analyses subscribe to the names that start or stop being unbound anywhere in the notebook
+    and take the ones that changed since their last run. Every subscriber has its own set of pending names,
+    so what is kept is bounded by the names of the notebook, and is dropped with the subscriber.
+    '''
+    def __init__(self) -> None:
+        self.definitions: dict[str, set[int]] = {}
+        self.unbound: dict[str, int] = {}
+        self.imports: dict[str, int] = {}
+        self.unbound_changes: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def subscribe(self, subscriber) -> None:
+        '''
+        Starts collecting the unbound changes for the subscriber, any pending ones are discarded.
+        '''
+        self.unbound_changes[subscriber] = set()
+
+    def take_unbound_changes(self, subscriber) -> set[str]:
+        '''
+        Names that started or stopped being unbound since the subscriber last took them.
+        '''
+        changes = self.unbound_changes[subscriber]
+        self.unbound_changes[subscriber] = set()
+        return changes
+
+    def add_cell(self, cell_id: int, cell_IR: IntermediateRepresentations) -> None:
+        for name in cell_IR.UDA.defined_vars.keys():
+            self.definitions.setdefault(name, set()).add(cell_id)
+        self._count(self.unbound, cell_IR.UDA.def_use_chains.unbound_names, 1, self.unbound_changes.values())
+        self._count(self.imports, cell_IR.UDA.imports, 1)
+
+    def remove_cell(self, cell_id: int, cell_IR: IntermediateRepresentations) -> None:
+        for name in cell_IR.UDA.defined_vars.keys():
+            cells = self.definitions[name]
+            cells.discard(cell_id)
+            if not cells:
+                del self.definitions[name]
+        self._count(self.unbound, cell_IR.UDA.def_use_chains.unbound_names, -1, self.unbound_changes.values())
+        self._count(self.imports, cell_IR.UDA.imports, -1)
+
+    def defined_names(self):
+        return self.definitions.keys()
+
+    def unbound_names(self):
+        return self.unbound.keys()
+
+    def imported_names(self):
+        return self.imports.keys()
+
+    @staticmethod
+    def _count(table: dict[str, int], names, delta: int, changes = ()) -> None:
+        changed = []
+        for name in names:
+            count = table.get(name, 0) + delta
+            if count:
+                if count == delta:
+                    changed.append(name)
+                table[name] = count
+            else:
+                del table[name]
+                changed.append(name)
+        if changed:
+            for pending in changes:
+                pending.update(changed)
+
+class NotebookIR(dict):
+    '''
+    Maps stable cell ids to IntermediateRepresentations of code cells.
+
+    The notebook order of all cells (code or not) is kept in a separate list of ids. Ids are
+    allocated once and never renumbered, so inserting or removing a cell leaves the IR of the
+    other cells and the stored results untouched. Ids of a freshly loaded notebook are equal to
+    cell positions; positions are otherwise only computed when results are serialized.
+    '''
+    def __init__(self) -> None:
+        super().__init__()
+        self.order: list[int] = []
+        self.next_id: int = 0
+        self._positions: dict[int, int] = None
+        self._code_cells: list[int] = None
+        self._consumers: dict[str, set[int]] = None
+        self._symbols: SymbolTable = None
+        self._derived: dict[str, tuple] = {}
+
+    def add_cell(self, position: int = None) -> int:
+        '''
+        Allocates an id for a new cell at the given position (appended if None).
+        The IR of a code cell has to be set separately under the returned id.
+        '''
+        cell_id = self.next_id
+        self.next_id += 1
+        if position is None:
+            self.order.append(cell_id)
+        else:
+            self.order.insert(position, cell_id)
+        self._invalidate()
+        return cell_id
+
+    def remove_cell(self, position: int) -> int:
+        '''
+        Removes the cell at the given position together with its IR and returns its id.
+        '''
+        cell_id = self.order.pop(position)
+        cell_IR = super().pop(cell_id, None)
+        if cell_IR and self._consumers is not None:
+            self._remove_consumer(cell_id, cell_IR)
+        if cell_IR and self._symbols is not None:
+            self._symbols.remove_cell(cell_id, cell_IR)
+        self._invalidate()
+        return cell_id
+
+    def cell_id_at(self, position: int) -> int:
+        if 0 <= position < len(self.order):
+            return self.order[position]
+        return None
+
+    def positions(self) -> dict[int, int]:
+        '''
+        Mapping of cell ids to current cell positions, recomputed only after structural edits.
+        '''
+        if self._positions is None:
+            self._positions = {cell_id: position for position, cell_id in enumerate(self.order)}
+        return self._positions
+
+    def code_cells(self) -> list[int]:
+        '''
+        Ids of code cells in notebook order.
+        '''
+        if self._code_cells is None:
+            self._code_cells = [cell_id for cell_id in self.order if cell_id in self]
+        return self._code_cells
+
+    def consumers(self) -> dict[str, set[int]]:
+        '''
+        Index of variables to the cells that read them before defining them (UDA.unbound_final).
+        Built on first use and kept up to date when cells are set or removed.
+        '''
+        if self._consumers is None:
+            self._consumers = defaultdict(set)
+            for cell_id, cell_IR in self.items():
+                self._add_consumer(cell_id, cell_IR)
+        return self._consumers
+
+    def symbols(self) -> SymbolTable:
+        '''
+        Symbol table of the notebook. Built on first use and kept up to date when cells are set or removed.
+        '''
+        if self._symbols is None:
+            self._symbols = SymbolTable()
+            for cell_id, cell_IR in self.items():
+                self._symbols.add_cell(cell_id, cell_IR)
+        return self._symbols
+
+    def derived(self, name: str, key, build):
+        '''
+        Value derived from the code cells by build(), memoized under name until a cell is set, added or
+        removed, or until it is asked for with a different key (state besides the cells it depends on).
+        '''
+        entry = self._derived.get(name)
+        if entry is None or entry[0] != key:
+            entry = self._derived[name] = (key, build())
+        return entry[1]
+
+    def __setitem__(self, cell_id: int, cell_IR: IntermediateRepresentations) -> None:
+        self._derived.clear()
+        if cell_id not in self:
+            self._code_cells = None
+        else:
+            if self._consumers is not None:
+                self._remove_consumer(cell_id, self[cell_id])
+            if self._symbols is not None:
+                self._symbols.remove_cell(cell_id, self[cell_id])
+        super().__setitem__(cell_id, cell_IR)
+        if self._consumers is not None:
+            self._add_consumer(cell_id, cell_IR)
+        if self._symbols is not None:
+            self._symbols.add_cell(cell_id, cell_IR)
+
+    def _add_consumer(self, cell_id: int, cell_IR: IntermediateRepresentations) -> None:
+        for var in cell_IR.UDA.unbound_final:
+            self._consumers[var].add(cell_id)
+
+    def _remove_consumer(self, cell_id: int, cell_IR: IntermediateRepresentations) -> None:
+        for var in cell_IR.UDA.unbound_final:
+            cells = self._consumers[var]
+            cells.discard(cell_id)
+            if not cells:
+                del self._consumers[var]
+
+    def _invalidate(self) -> None:
+        self._positions = None
+        self._code_cells = None
+        self._derived.clear()
+
+def code_cell_order(notebook_IR: dict[int, IntermediateRepresentations]) -> list[int]:
+    '''
+    Ids of code cells in notebook order, also for plain dicts keyed by cell position.
+    '''
+    if isinstance(notebook_IR, NotebookIR):
+        return notebook_IR.code_cells()
+    return list(notebook_IR.keys())
+
+def variable_consumers(notebook_IR: dict[int, IntermediateRepresentations]) -> dict[str, set[int]]:
+    '''
+    Index of variables to the cells that read them before defining them, also for plain dicts.
+    '''
+    if isinstance(notebook_IR, NotebookIR):
+        return notebook_IR.consumers()
+    consumers = defaultdict(set)
+    for cell_id, cell_IR in notebook_IR.items():
+        for var in cell_IR.UDA.unbound_final:
+            consumers[var].add(cell_id)
+    return consumers
+
+def symbol_table(notebook_IR: dict[int, IntermediateRepresentations]) -> SymbolTable:
+    '''
+    Symbol table of the notebook, also for plain dicts.
+    '''
+    if isinstance(notebook_IR, NotebookIR):
+        return notebook_IR.symbols()
+    symbols = SymbolTable()
+    for cell_id, cell_IR in notebook_IR.items():
+        symbols.add_cell(cell_id, cell_IR)
+    return symbols
+
+def derived(notebook_IR: dict[int, IntermediateRepresentations], name: str, key, build):
+    '''
+    Value built by build() from the cells of the notebook, memoized on a NotebookIR and rebuilt for plain dicts.
+    '''
+    if isinstance(notebook_IR, NotebookIR):
+        return notebook_IR.derived(name, key, build)
+    return build()
+
+def cell_positions(notebook_IR: dict[int, IntermediateRepresentations], cell_ids: list[int]) -> list[int]:
+    '''
+    Current positions of the given cells, for messages shown to the user.
+    '''
+    if isinstance(notebook_IR, NotebookIR):
+        positions = notebook_IR.positions()
+        return [positions[cell_id] for cell_id in cell_ids if cell_id in positions]
+    return list(cell_ids)
@@ -0,0 +1,61 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import copyreg
+import io
+import pickle
+import zlib
+from simple_cfg.cfg_factory import CFG
+from simple_cfg.cfg_nodes import Node
+
+'''
+Binary format of the cached IR: zlib compressed pickle of CodeRepresentations.
+
+CFG nodes point at each other through ingoing/outgoing lists, so pickling them directly
+recurses once per node and overflows the stack on long cells. CFGs are therefore reduced
+to a flat list of node states in which references to other nodes are replaced by node indices.
+'''
+
+class _NodePickler(pickle.Pickler):
+    def __init__(self, file, nodes):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.node_index = {id(node): i for i, node in enumerate(nodes)}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Node):
+            return self.node_index.get(id(obj))
+        return None
+
+class _NodeUnpickler(pickle.Unpickler):
+    def __init__(self, file):
+        super().__init__(file)
+        self.nodes = []
+
+    def persistent_load(self, pid):
+        return self.nodes[pid]
+
+def _dump_nodes(nodes, blackbox_assignments) -> bytes:
+    buffer = io.BytesIO()
+    pickler = _NodePickler(buffer, nodes)
+    pickler.dump([type(node) for node in nodes])
+    pickler.dump(([node.__dict__ for node in nodes], blackbox_assignments))
+    return buffer.getvalue()
+
+def _rebuild_cfg(nodes_data: bytes, filename) -> CFG:
+    unpickler = _NodeUnpickler(io.BytesIO(nodes_data))
+    unpickler.nodes = [node_type.__new__(node_type) for node_type in unpickler.load()]
+    states, blackbox_assignments = unpickler.load()
+    for node, state in zip(unpickler.nodes, states):
+        node.__dict__.update(state)
+    return CFG(unpickler.nodes, blackbox_assignments, filename)
+
+def _reduce_cfg(cfg: CFG):
+    return _rebuild_cfg, (_dump_nodes(cfg.nodes, cfg.blackbox_assignments), cfg.filename)
+
+copyreg.pickle(CFG, _reduce_cfg)
+
+def dumps(code_IR) -> bytes:
+    return zlib.compress(pickle.dumps(code_IR, pickle.HIGHEST_PROTOCOL), 1)
+
+def loads(data: bytes):
+    return pickle.loads(zlib.decompress(data))
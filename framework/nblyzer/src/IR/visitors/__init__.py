@@ -1,5 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+from .assign_parser_visitor import AssignParserVisitor
 from .assigns_visitor import AssignsVisitor
 from .def_use_visitor import DefUseVisitor
\ No newline at end of file
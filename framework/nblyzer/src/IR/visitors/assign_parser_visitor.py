@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import ast
+
+class AssignParserVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.def_variables = set[str]()
+        self.assigned_variables = set[str]()
+    
+    def visit_Name(self, node: ast.Name):
+        if node.id.find("__chain_tmp") == -1:
+            self.assigned_variables.add(node.id)
+
+    def visit_arguments(self, node: ast.arguments) -> None:
+        if isinstance(node, ast.Name) and node.id.find("__chain_tmp") == -1:
+            self.assigned_variables.add(node.id)
+    
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        for n in ast.walk(node.value):
+            if isinstance(n, ast.Name) and n.id.find("__chain_tmp") == -1:
+                self.assigned_variables.add(n.id)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        for n in ast.walk(node.func):
+            if isinstance(n, ast.Name) and n.id.find("__chain_tmp") == -1:
+                self.assigned_variables.add(n.id)
+        for arg in node.args:
+            self.visit(arg)
+
+    def parse_target(self, node):
+        if isinstance(node, ast.Name) and node.id.find("__chain_tmp") == -1:
+            self.def_variables.add(node.id)
+        elif isinstance(node, ast.Call):
+            for n in ast.walk(node.func):
+                if isinstance(n, ast.Name) and n.id.find("__chain_tmp") == -1:
+                    self.def_variables.add(n.id)
+        elif isinstance(node, ast.Attribute):
+            for n in ast.walk(node.value):
+                if isinstance(n, ast.Name) and n.id.find("__chain_tmp") == -1:
+                    self.def_variables.add(n.id)
+        elif isinstance(node, ast.Subscript):
+            if isinstance(node.value, ast.Name) and node.value.id.find("__chain_tmp") == -1:
+                self.def_variables.add(node.value.id)
+            elif isinstance(node.value, ast.Attribute):
+                for n in ast.walk(node.value):
+                    if isinstance(n, ast.Name) and n.id.find("__chain_tmp") == -1:
+                        self.def_variables.add(n.id)   
+        elif isinstance(node, ast.List) or isinstance(node, ast.Tuple):
+                for element in node.elts:
+                    for n in ast.walk(element):
+                        if isinstance(n, ast.Name):
+                            self.def_variables.add(n.id)   
+
+    def parse_assign(self, node):
+        if isinstance(node, ast.Assign):
+            if isinstance(node.targets, list):
+                for target in node.targets:
+                    self.parse_target(target)
+            else:
+                self.parse_target(node.targets)
+
+            self.visit(node.value)
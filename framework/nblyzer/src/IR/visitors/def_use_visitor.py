@@ -10,4 +10,11 @@ class DefUseVisitor(beniget.DefUseChains):
         super().__init__(filename=filename)
         
     def unbound_identifier(self, name, node):
-        self.unbound_names.add(name)
\ No newline at end of file
+        self.unbound_names.add(name)
+
+    def __getstate__(self):
+        '''
+        Only the unbound names are read once the UDA summary is built, so the chains
+        themselves are dropped when the IR is pickled.
+        '''
+        return {"unbound_names": self.unbound_names}
\ No newline at end of file
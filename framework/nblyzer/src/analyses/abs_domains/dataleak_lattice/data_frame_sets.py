@@ -34,7 +34,7 @@ class DataFrameSet:
         '''
         Iterate over the other dict and perform reduction as soon as overlapping is detected.
         '''
-        product: DataFrameSet = DataFrameSet(dict(self.frames))
+        product: DataFrameSet = DataFrameSet({source: list(l_df) for source, l_df in self.frames.items()})
 
         for source, l_o_df in other.frames.items():
             for o_df in l_o_df:
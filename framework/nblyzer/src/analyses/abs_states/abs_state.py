@@ -37,6 +37,13 @@ class AbstractState(ABC):
     def contains(self, other: AbstractState) -> bool:
         pass
     
+    def fingerprint(self):
+        '''
+        Hashable value that determines how the state is transformed and what errors it leads to,
+        used to memoize explored cells. None disables memoization for the state.
+        '''
+        return None
+
     @abstractmethod
     def condition(self, cell_IR, node) -> list:
         '''
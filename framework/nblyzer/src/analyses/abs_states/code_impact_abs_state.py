@@ -3,21 +3,33 @@
 
 from __future__ import annotations
 import ast
-from copy import deepcopy
 
 from simple_cfg.cfg_nodes import EntryOrExitNode
 from ....src.IR.intermediate_representations import IntermediateRepresentations
 from .abs_state import AbstractState
+from .cow_dict import CowDict
 from ..runner.analysis_results import ErrorInfo, ErrorType
 from ast import Name, NodeVisitor, arguments
 
 class CodeImpactAS(AbstractState):
     def __init__(self, impacted_variables: dict[str: int] = {}, K: int = 2):
-        self.impacted_variables: dict[str, int] = deepcopy(impacted_variables)
+        if isinstance(impacted_variables, CowDict):
+            self.impacted_variables: CowDict = impacted_variables.copy()
+        else:
+            self.impacted_variables: CowDict = CowDict(impacted_variables)
         self.K: int = K
 
+    def __deepcopy__(self, memo) -> CodeImpactAS:
+        return CodeImpactAS(self.impacted_variables, self.K)
+
     def __eq__(self, other: CodeImpactAS) -> bool:
-        return self.impacted_variables.keys() == other.impacted_variables.keys() and self.K == other.K
+        '''
+        Compares the levels too, so the intra cell fixpoint propagates a raised level around a loop and
+        reaches the same states in any transform order.
+        '''
+        if self.impacted_variables.shares(other.impacted_variables):
+            return self.K == other.K
+        return self.impacted_variables.items() == other.impacted_variables.items() and self.K == other.K
 
     def projection(self) -> set[str]:
         if not len(self.impacted_variables):
@@ -33,8 +45,13 @@ class CodeImpactAS(AbstractState):
         self.K = max(self.K, other.K)
     
     def contains(self, other: CodeImpactAS) -> bool:
+        if self.impacted_variables.shares(other.impacted_variables):
+            return True
         return other.impacted_variables.keys() <= self.impacted_variables.keys()
 
+    def fingerprint(self):
+        return frozenset(self.impacted_variables.items()), self.K
+
     def condition(self, cell_IR: IntermediateRepresentations, node, errors) -> list:
         for var, level in self.impacted_variables.items():
             new_error = ErrorInfo(cell_IR.cell_id, node.line_number, var.split("_usage")[0], ErrorType.CRITICAL, "Variable uses outdated values.")
@@ -47,9 +64,8 @@ class CodeImpactAS(AbstractState):
         return errors
 
     def set_var_level(self, var: str, level: int):
-        if var in self.impacted_variables:
-            self.impacted_variables[var] = max(self.impacted_variables[var], level)
-        else:
+        current = self.impacted_variables.get(var)
+        if current is None or level > current:
             self.impacted_variables[var] = level
 
     def __str__(self) -> str:        
@@ -0,0 +1,99 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from __future__ import annotations
+
+class CowDict:
+    '''
+    Copy-on-write dict backing the abstract states. Copies share one dict together with a count
+    of the CowDicts referencing it, and a CowDict writing to a shared dict first takes a private
+    copy of it. Copying a state is therefore O(1) and a transformer only pays for a flat copy of
+    the dict when it actually changes the state.
+
+    Values are shared between copies, so they have to be replaced rather than mutated in place.
+    '''
+    __slots__ = ("_data", "_refs")
+
+    def __init__(self, data = None) -> None:
+        self._refs: list[int] = [1]
+        self._data: dict = dict(data) if data else {}
+
+    def copy(self) -> CowDict:
+        copied = CowDict.__new__(CowDict)
+        copied._data = self._data
+        copied._refs = self._refs
+        self._refs[0] += 1
+        return copied
+
+    def __copy__(self) -> CowDict:
+        return self.copy()
+
+    def __deepcopy__(self, memo) -> CowDict:
+        return self.copy()
+
+    def __reduce__(self):
+        return CowDict, (self._data,)
+
+    def __del__(self) -> None:
+        self._refs[0] -= 1
+
+    def shares(self, other: CowDict) -> bool:
+        '''
+        True if both CowDicts are backed by the same dict, so they are equal without comparing items.
+        '''
+        return self._data is other._data
+
+    def _own(self) -> None:
+        if self._refs[0] > 1:
+            self._refs[0] -= 1
+            self._data = dict(self._data)
+            self._refs = [1]
+
+    def __setitem__(self, key, value) -> None:
+        if self._refs[0] > 1:
+            self._own()
+        self._data[key] = value
+
+    def __delitem__(self, key) -> None:
+        self._own()
+        del self._data[key]
+
+    def pop(self, key, *default):
+        if key not in self._data:
+            return self._data.pop(key, *default)
+        self._own()
+        return self._data.pop(key)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default = None):
+        return self._data.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CowDict):
+            return self._data is other._data or self._data == other._data
+        return self._data == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(self._data)
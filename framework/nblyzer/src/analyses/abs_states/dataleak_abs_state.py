@@ -6,6 +6,7 @@ import ast
 from simple_cfg.cfg_nodes import Node, AssignmentNode
 from ....src.IR.intermediate_representations import IntermediateRepresentations
 from .abs_state import AbstractState
+from .cow_dict import CowDict
 from ..abs_domains.dataleak_lattice.data_frame_sets import DataFrameSet
 from ..runner.analysis_results import ErrorInfo, ErrorType
 from itertools import product
@@ -45,10 +46,16 @@ class DataLeakAbstractState(AbstractState):
     def __init__(self) -> None:
         '''
         Object that maps variables to corresponding Abstract Domain element.
+        Transformers only mutate domains they have just cloned into the state, so copies of
+        the state share the domains of the variables neither of them reassigned.
         '''
-        self.state: dict[str, DataLeakAbstractDomain] = dict()
+        self.state: CowDict = CowDict()
         super().__init__()
-        
+
+    def __deepcopy__(self, memo) -> DataLeakAbstractState:
+        copied = DataLeakAbstractState()
+        copied.state = self.state.copy()
+        return copied
 
     def __getitem__(self, key: str) -> DataLeakAbstractDomain:
         return self.state[key]
@@ -68,7 +75,7 @@ class DataLeakAbstractState(AbstractState):
             
             if test_dfs.dfs.cartesian_overlap(train_dfs.dfs, weak=True) and test_dfs.taint and train_dfs.taint:
                 if isinstance(node, AssignmentNode):
-                    if isinstance(node.ast_node, ast.Call):
+                    if isinstance(node.ast_node, ast.Call) and node.ast_node.args and isinstance(node.ast_node.args[0], ast.Name):
                         errors.append(ErrorInfo(cell_IR.cell_id, node.line_number, node.ast_node.args[0].id, ErrorType.TERMINAL, "Training model with data leak."))
                 else:
                     errors.append(ErrorInfo(cell_IR.cell_id, node.line_number, node.label, ErrorType.TERMINAL, "Training model with data leak."))
@@ -95,6 +102,8 @@ class DataLeakAbstractState(AbstractState):
         return self
 
     def contains(self, other: DataLeakAbstractState) -> bool:
+        if self.state.shares(other.state):
+            return True
         self_filtered = {k:v for k, v in self.state.items() if k[0] != '~'}
         other_filtered = {k:v for k, v in other.state.items() if k[0] != '~'}
         return other_filtered.items() <= self_filtered.items() 
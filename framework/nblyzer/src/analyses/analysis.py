@@ -3,12 +3,16 @@
 
 from abc import ABC
 from .runner.analysis_results import Result
+from .runner.cancellation import CancellationToken
 
 class Analysis(ABC):
     def __init__(self):
         self.abstract_state = None
         self.stats = []
         self.necessary: set[int] = set[int]()
+        self.cancellation: CancellationToken = None
+        self.worklist: bool = False
+        self.visited_cells: set[int] = set()
 
     def analyze_notebook(self, notebook_IR, old_cell_IR, level, filename=""):
         pass
@@ -25,11 +29,49 @@ class Analysis(ABC):
     def phi_condition(self, current: set, pre: set, cell_IR):
         pass
 
+    def propagates_from(self, cell_IR) -> bool:
+        '''
+        Part of phi_condition that only depends on the propagating cell. phi_condition(current, pre, cell_IR)
+        has to hold exactly when propagates_from(cell_IR) holds and pre <= current, so that the runners can
+        test the pre-summaries of all cells at once.
+        '''
+        return True
+
     def calculate_pre(self, cell_IR):
         pass
 
     def summarize_result(self, result: Result) -> Result:
         return result
 
+    def run_inter_fixpoint(self, runner, cell_id, abstract_state, K) -> Result:
+        '''
+        Runs the inter-cell fixpoint from the given cell with the engine selected by self.worklist.
+        The cells it transformed are kept in self.visited_cells.
+        '''
+        if self.worklist:
+            result = runner.inter_worklist_runner(self, cell_id, abstract_state, K, Result())
+        else:
+            result = runner.inter_fixpoint_runner(self, cell_id, abstract_state=abstract_state, K=K, cpath=[], results=Result())
+        self.visited_cells = runner.visited
+        return result
+
+    def cache_state(self):
+        '''
+        State of the analysis, besides the notebook, that the result of analyze_notebook depends on. It is
+        compared with == to tell whether a cached result still holds, None if results are never cached.
+        '''
+        return None
+
+    def restore_state(self, state) -> None:
+        '''
+        Puts the analysis back in the state a run left it in when its result is taken from the cache,
+        given cache_state() right after that run.
+        '''
+        pass
+
+    def check_cancelled(self) -> None:
+        if self.cancellation:
+            self.cancellation.check()
+
     def find_necessary_cells(self, notebook_IR) -> None:
         self.necessary = set(notebook_IR.keys())
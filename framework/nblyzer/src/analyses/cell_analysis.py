@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from .runner.analysis_results import Result, PathResult, ErrorInfo, ErrorType
+from .runner.analyses_utils import get_all_unbound_vars
+from .analysis import Analysis
+from ..IR.intermediate_representations import IntermediateRepresentations
+from ..IR.notebook_IR import NotebookIR, code_cell_order
+
+class CellAnalysis(Analysis):
+    '''
+    Base of the analyses that report single cells given the names read before being defined anywhere in
+    the notebook (idle and isolated cells).
+
+    The report of a cell only depends on its IR and on which of the names it defines are unbound
+    elsewhere. On a NotebookIR the reports are therefore kept between runs, and a run only checks the
+    cells whose IR was replaced and the cells defining a name that became bound or unbound since the
+    previous run, as collected by the symbol table.
+    '''
+    message: str = ""
+
+    def __init__(self):
+        super().__init__()
+        self.notebook_IR: NotebookIR = None
+        self.reports: dict[int, tuple[IntermediateRepresentations, PathResult]] = {}
+
+    def check_cell(self, cell_id: int, cell_IR: IntermediateRepresentations, unbound_vars) -> PathResult:
+        '''
+        Report of the cell, None if the cell is fine.
+        '''
+        pass
+
+    def report_cell(self, cell_id: int, cell_IR: IntermediateRepresentations) -> PathResult:
+        '''
+        Reports every variable defined by the cell at the line of its definition.
+        '''
+        error_infos: list[ErrorInfo] = [
+            ErrorInfo(cell_id, line, label, ErrorType.TERMINAL, self.message) for label, line in cell_IR.UDA.defined_vars.items()
+        ]
+        if not len(error_infos):
+            error_infos.append(ErrorInfo(cell_id, 1, "", ErrorType.TERMINAL, self.message))
+        return PathResult([cell_id], error_infos)
+
+    def analyze_notebook(self, notebook_IR, old_cell_IR = None, level = 20, filename=""):
+        result: Result = Result()
+        if not isinstance(notebook_IR, NotebookIR):
+            unbound_vars = get_all_unbound_vars(notebook_IR)
+            for cell_id in code_cell_order(notebook_IR):
+                path_result = self.check_cell(cell_id, notebook_IR[cell_id], unbound_vars)
+                if path_result is not None:
+                    result.add_path_results([path_result])
+            return result
+
+        symbols = notebook_IR.symbols()
+        if self.notebook_IR is not notebook_IR:
+            self.notebook_IR = notebook_IR
+            self.reports = {}
+            symbols.subscribe(self)
+        rechecked: set[int] = set()
+        for name in symbols.take_unbound_changes(self):
+            rechecked.update(symbols.definitions.get(name, ()))
+
+        code_cells = code_cell_order(notebook_IR)
+        for cell_id in code_cells:
+            cell_IR = notebook_IR[cell_id]
+            report = self.reports.get(cell_id)
+            if report is None or report[0] is not cell_IR or cell_id in rechecked:
+                report = (cell_IR, self.check_cell(cell_id, cell_IR, symbols.unbound_names()))
+                self.reports[cell_id] = report
+            if report[1] is not None:
+                result.add_path_results([report[1]])
+        if len(self.reports) > len(code_cells):
+            self.reports = {cell_id: self.reports[cell_id] for cell_id in code_cells}
+        return result
@@ -11,7 +11,8 @@ from .abs_states.dataleak_abs_state import (
 )
 from .abs_domains.dataleak_lattice.data_frame import DataFrame, Rows, Columns
 from ..IR.intermediate_representations import IntermediateRepresentations
-from .runner.analysis_results import Result, ErrorType
+from ..IR.notebook_IR import cell_positions
+from .runner.analysis_results import Result, PathResult, ErrorType
 from .runner.runners import Runner
 from .runner.stats import Stats
 
@@ -31,6 +32,7 @@ class DataLeakAnalysis(Analysis):
         self.tts_count = 0
         self.necessary = set[int]()
         self.abstract_state = DataLeakAbstractState()
+        self.state_version = 0
 
 
     def F_transformer(self, cfg_node, a_state: DataLeakAbstractState, cell_IR):
@@ -350,7 +352,18 @@ class DataLeakAnalysis(Analysis):
         return (pre <= current)
 
     def update_abstract_state(self, cell_IR, notebook_IR):
-        self.abstract_state, _ = Runner(self.stats, defaultdict(DataLeakAbstractState), notebook_IR).intra_fixpoint_runner(cell_IR, self, self.abstract_state)
+        self.abstract_state, _ = Runner(Stats(cell_IR.cell_id), defaultdict(DataLeakAbstractState), notebook_IR).intra_fixpoint_runner(cell_IR, self, self.abstract_state)
+        self.state_version += 1
+
+    def cache_state(self):
+        '''
+        Data leak states have no exact equality, so the state counts as changed whenever a cell ran.
+        The train_test_split counter carries over between runs.
+        '''
+        return self.state_version, self.tts_count
+
+    def restore_state(self, state) -> None:
+        self.tts_count = state[1]
 
     def combine_states(self, states: list[DataLeakAbstractState]):
         if len(states) == 1:
@@ -391,26 +404,20 @@ class DataLeakAnalysis(Analysis):
         stat = Stats(old_cell_IR.cell_id, filename) 
         stat.log_start()
 
-        result = Runner(stat, defaultdict(DataLeakAbstractState), notebook_IR).inter_fixpoint_runner(
-            self,
-            old_cell_IR.cell_id,
-            abstract_state=self.abstract_state,
-            K=level,
-            cpath=[],
-            results = Result()
-        )
+        result = self.run_inter_fixpoint(Runner(stat, defaultdict(DataLeakAbstractState), notebook_IR), old_cell_IR.cell_id, self.abstract_state, level)
 
         stat.log_end()
         self.stats.append(stat)
         return result
 
     def summarize_result(self, result: Result) -> Result:
-        summarized_result: Result = result.distinct_errors()
+        summarized_result: Result = Result()
         for path_result in result.distinct_errors().path_results:
-            for err in path_result.error_infos:
-                if err.error_type == ErrorType.TERMINAL:
-                    err.error_message += " Path that will lead to this: " + str(path_result.path)
-        
+            path_message = " Path that will lead to this: " + str(cell_positions(self.notebook_IR, path_result.path))
+            summarized_result.add_path_result(PathResult(path_result.path, [
+                err.with_message(err.error_message + path_message) if err.error_type == ErrorType.TERMINAL else err
+                for err in path_result.error_infos
+            ]))
         return summarized_result
 
     def calculate_pre(self, cell_IR):
@@ -2,98 +2,214 @@
 # Licensed under the MIT license.
 
 from __future__ import annotations
-from copy import deepcopy
+import io
+import json
 from enum import Enum
+from typing import NamedTuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 class ErrorType(Enum):
     CRITICAL = "CRITICAL"
     TERMINAL = "TERMINAL"
 
-class ErrorInfo(dict):
-    def __init__(self, cell_id, line, label, error_type, error_message):
-        self.cell_id = cell_id
-        self.line = line
-        self.label = label
-        self.error_type = error_type
-        self.error_message = error_message
+class ErrorInfo(NamedTuple):
+    '''
+    An error reported at a line of a cell. Errors are immutable and hashable, so results share them
+    instead of copying them and index path results by them.
+    '''
+    cell_id: int
+    line: int
+    label: str
+    error_type: ErrorType
+    error_message: str
 
     def __repr__(self):
-        return "line: " + str(self.line) + " in cell " + str(self.cell_id) + " label " + str(self.label) + " type " + self.error_type + " msg " + self.error_message
+        return "line: " + str(self.line) + " in cell " + str(self.cell_id) + " label " + str(self.label) + " type " + str(self.error_type) + " msg " + self.error_message
 
-    def __eq__(self, other):
-        if (isinstance(other, ErrorInfo)):
-            return self.cell_id == other.cell_id and self.line == other.line and self.label == other.label and self.error_message == other.error_message and self.error_type == other.error_type
-        return False
+    def with_message(self, error_message: str) -> ErrorInfo:
+        return self._replace(error_message=error_message)
+
+def error_json(err: ErrorInfo) -> str:
+    '''
+    JSON object of an error. Labels and messages are escaped, but non-ASCII characters are kept as they are.
+    '''
+    label = json.dumps(str(err.label), ensure_ascii=False)
+    message = json.dumps(str(err.error_message), ensure_ascii=False)
+    return f'{{"line":{json.dumps(err.line)},"label":{label}, "error_type":"{err.error_type}", "message":{message}}}'
 
 class PathResult:
+    '''
+    Errors reported at the last cell of a path. Path results are immutable, the path and the errors
+    are stored as tuples.
+    '''
+    __slots__ = ("path", "error_infos")
+
     def __init__(self, path, error_infos):
-        self.path = path
-        self.error_infos:list[ErrorInfo] = error_infos
+        self.path: tuple[int] = tuple(path)
+        self.error_infos: tuple[ErrorInfo] = tuple(error_infos)
 
     def __repr__(self):
-        return "Path: " + str(self.path) + "Errors: " + str(self.error_infos)
+        return "Path: " + str(list(self.path)) + "Errors: " + str(list(self.error_infos))
 
     def __eq__(self, __o: PathResult) -> bool:
-        path_flag = self.path == __o.path 
-        err_flag = True 
-        for e in self.error_infos:
-            err_flag = err_flag and (e in __o.error_infos)
+        '''
+        A path result equals another one if all its errors are errors of the other one, whatever the paths.
+        '''
+        return all(e in __o.error_infos for e in self.error_infos)
 
-        return err_flag
+    def __copy__(self) -> PathResult:
+        return self
+
+    def __deepcopy__(self, memo) -> PathResult:
+        return self
 
 class Result:
+    '''
+    Path results in the order they were found, indexed by the last cell of their path (the first path
+    result ending at a cell) and by their errors, so lookups by cell, joins, deduplication and membership
+    tests do not scan the path results.
+    '''
     def __init__(self) -> None:
-        self.path_results = list[PathResult]()
+        self.path_results: list[PathResult] = []
+        self.by_cell: dict[int, int] = {}
+        self.by_error: dict[ErrorInfo, set[int]] = {}
+        self.error_counts: list[int] = []
+        self.errorless: int = 0
 
     def add_path_results(self, opath_results: list[PathResult]) -> None:
-        self.path_results += opath_results
+        for path_result in opath_results:
+            self.add_path_result(path_result)
 
     def add_path_result(self, path_result: PathResult) -> None:
+        index = len(self.path_results)
         self.path_results.append(path_result)
-    
+        self.by_cell.setdefault(path_result.path[-1], index)
+        self.error_counts.append(0)
+        self.errorless += 1
+        self._index_errors(index, path_result.error_infos)
+
+    def _index_errors(self, index: int, error_infos) -> None:
+        for err in error_infos:
+            indices = self.by_error.setdefault(err, set())
+            if index not in indices:
+                indices.add(index)
+                if not self.error_counts[index]:
+                    self.errorless -= 1
+                self.error_counts[index] += 1
+
     def join_results(self, result: Result) -> None:
         self.add_path_results(result.path_results)
 
     def has_path_with_error_cell(self, cell_id: int):
-        if not len(self.path_results):
-            return None
-
-        for path_result in self.path_results:
-            if path_result.path[-1] == cell_id:
-                return path_result
-        return None
+        index = self.by_cell.get(cell_id)
+        return None if index is None else self.path_results[index]
+
+    def __contains__(self, path_result: PathResult) -> bool:
+        '''
+        Whether a path result of the result equals the given one as list membership compares them, i.e.
+        whether all errors of a path result of the result are errors of the given one. Path results are
+        counted down by the given errors they report until one has none left.
+        '''
+        if self.errorless:
+            return True
+        found: dict[int, int] = {}
+        for err in set(path_result.error_infos):
+            for index in self.by_error.get(err, ()):
+                found[index] = found.get(index, 0) + 1
+                if found[index] == self.error_counts[index]:
+                    return True
+        return False
 
     def distinct_errors(self) -> Result:
         result: Result = Result()
         for path_result in self.path_results:
-            if not result.has_path_with_error_cell(path_result.path[-1]):
-                result.add_path_results([path_result])
+            if path_result.path[-1] not in result.by_cell:
+                result.add_path_result(path_result)
         return result
 
-    def dumps(self, with_path: bool = False) -> str:
-        if not len(self.path_results):
-            return ''
-        resultJSON = "["
-        for path_result in self.path_results:
-            error_json = f'{{"cell_id":{path_result.path[-1]},"errors":['
-            for err in path_result.error_infos:
-                errty = err.error_type
-                error_json += f'{{"line":{err.line},"label":"{err.label}", "error_type":"{errty}", "message":"{err.error_message}"}},'
-            error_json = error_json[:-1] + ']'
+    def mapped_path_results(self, positions: dict[int, int] = None) -> list[PathResult]:
+        '''
+        Path results with cell ids replaced by cell positions if positions are given. Removed cells are
+        left out of paths and errors of removed cells are dropped.
+        '''
+        if positions is None:
+            return self.path_results
+        return [
+            PathResult([positions[cell_id] for cell_id in path_result.path if cell_id in positions], path_result.error_infos)
+            for path_result in self.path_results if path_result.path[-1] in positions
+        ]
+
+    def dump(self, fp, with_path: bool = False, positions: dict[int, int] = None, ndjson: bool = False) -> None:
+        '''
+        Writes the result as JSON to a text file-like object, one path result at a time. With ndjson every
+        path result is written as an object on its own line instead of as an element of one array.
+        Nothing is written for an empty result.
+        '''
+        path_results = self.mapped_path_results(positions)
+        if not len(path_results):
+            return
+        separator = "\n" if ndjson else ","
+        if not ndjson:
+            fp.write("[")
+        for index, path_result in enumerate(path_results):
+            if index and not ndjson:
+                fp.write(separator)
+            fp.write(f'{{"cell_id":{path_result.path[-1]},"errors":[')
+            fp.write(",".join(map(error_json, path_result.error_infos)))
+            fp.write("]")
+            if with_path:
+                fp.write(f',"path":{json.dumps(path_result.path, separators=(", ", ":"))}')
+            fp.write("}")
+            if ndjson:
+                fp.write(separator)
+        if not ndjson:
+            fp.write("]")
+
+    def dumps(self, with_path: bool = False, positions: dict[int, int] = None, ndjson: bool = False) -> str:
+        '''
+        Dumps the result as JSON, see dump.
+        '''
+        buffer = io.StringIO()
+        self.dump(buffer, with_path, positions, ndjson)
+        return buffer.getvalue()
+
+    def records(self, with_path: bool = False, positions: dict[int, int] = None) -> list[dict]:
+        '''
+        The objects dumped as JSON, as plain dicts.
+        '''
+        records = []
+        for path_result in self.mapped_path_results(positions):
+            record = {"cell_id": path_result.path[-1], "errors": [
+                {"line": err.line, "label": str(err.label), "error_type": str(err.error_type), "message": str(err.error_message)}
+                for err in path_result.error_infos
+            ]}
             if with_path:
-                error_json += f',"path":{path_result.path}'
-            resultJSON += error_json + '},'
-        resultJSON = resultJSON[:-1] + "]"
-        return resultJSON
-    
+                record["path"] = list(path_result.path)
+            records.append(record)
+        return records
+
+    def packb(self, with_path: bool = False, positions: dict[int, int] = None) -> bytes:
+        '''
+        Dumps the records of the result as msgpack, which is only available if msgpack is installed.
+        '''
+        if msgpack is None:
+            raise ImportError("msgpack is not installed")
+        return msgpack.packb(self.records(with_path, positions))
+
     def join_by_cell_id(self) -> Result:
         new_result = Result()
         for path_res in self.path_results:
-            match_pr = new_result.has_path_with_error_cell(path_res.path[-1])
-            if match_pr:
-                match_pr.error_infos += deepcopy(path_res.error_infos)
+            index = new_result.by_cell.get(path_res.path[-1])
+            if index is None:
+                new_result.add_path_result(path_res)
             else:
-                new_result.add_path_results([deepcopy(path_res)])
+                match_pr = new_result.path_results[index]
+                new_result.path_results[index] = PathResult(match_pr.path, match_pr.error_infos + path_res.error_infos)
+                new_result._index_errors(index, path_res.error_infos)
         return new_result
 
     def __eq__(self, __o: Result) -> bool:
@@ -102,3 +218,15 @@ class Result:
             return ret
         return self.path_results == __o.path_results 
 
+
+    def __deepcopy__(self, memo) -> Result:
+        '''
+        Path results are immutable, so a copy only copies the lists and indexes.
+        '''
+        result = Result()
+        result.path_results = list(self.path_results)
+        result.by_cell = dict(self.by_cell)
+        result.by_error = {err: set(indices) for err, indices in self.by_error.items()}
+        result.error_counts = list(self.error_counts)
+        result.errorless = self.errorless
+        return result
@@ -0,0 +1,26 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from threading import Event
+
+class AnalysisCancelled(Exception):
+    pass
+
+class CancellationToken:
+    '''
+    Cooperative cancellation of a running analysis. The token is cancelled from another
+    thread and the fixpoint runners check it between transfer steps.
+    '''
+    def __init__(self) -> None:
+        self._cancelled = Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise AnalysisCancelled()
@@ -0,0 +1,24 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from __future__ import annotations
+
+class CellPath:
+    '''
+    Path of cells as a parent-pointer chain. Paths that share a prefix share its nodes,
+    so extending a path is O(1) and a list is only built when an error is reported.
+    '''
+    __slots__ = ("cell_id", "parent", "length")
+
+    def __init__(self, cell_id: int, parent: CellPath = None) -> None:
+        self.cell_id = cell_id
+        self.parent = parent
+        self.length = parent.length + 1 if parent else 1
+
+    def to_list(self) -> list[int]:
+        path = [None] * self.length
+        node = self
+        for i in range(self.length - 1, -1, -1):
+            path[i] = node.cell_id
+            node = node.parent
+        return path
@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class PhiIndex:
+    '''
+    Pre-summaries of all cells of a run over interned variable ids, answering which cells a
+    projection enables (non-empty pre-summary contained in the projection) in a single query.
+
+    With NumPy the cells x variables incidence matrix is stored by column, as the array of rows
+    reading each variable, and a query counts for every cell the pre-summary variables in the
+    projection with one bincount over the projection's columns. Without NumPy pre-summaries are
+    integer bitsets and only cells reading a variable of the projection are tested.
+    '''
+    def __init__(self, cells: list[int], pre_summaries: list[set[str]], enabled: list[bool], consumers: dict[str, set[int]]) -> None:
+        self.cells = cells
+        self.rank: dict[int, int] = {cell_id: rank for rank, cell_id in enumerate(cells)}
+        self.var_ids: dict[str, int] = {}
+        for pre_summary in pre_summaries:
+            for var in pre_summary:
+                self.var_ids.setdefault(var, len(self.var_ids))
+        self.pre_bits: list[int] = [self.bits(pre_summary) for pre_summary in pre_summaries]
+        self.enabled: list[bool] = [bool(pre_summary) and enable for pre_summary, enable in zip(pre_summaries, enabled)]
+        self.consumers = consumers
+
+        if np is not None:
+            columns: dict[str, list[int]] = {var: [] for var in self.var_ids}
+            for row, pre_summary in enumerate(pre_summaries):
+                for var in pre_summary:
+                    columns[var].append(row)
+            self.columns = {var: np.array(rows, dtype=np.intp) for var, rows in columns.items()}
+            self.pre_sizes = np.array([len(pre_summary) for pre_summary in pre_summaries], dtype=np.intp)
+            self.enabled_rows = np.array(self.enabled, dtype=bool)
+
+    def bits(self, variables) -> int:
+        bits = 0
+        for var in variables:
+            if var in self.var_ids:
+                bits |= 1 << self.var_ids[var]
+        return bits
+
+    def enabled_cells(self, projection, exclude = None) -> list[int]:
+        '''
+        Cells enabled by the projection in notebook order, leaving out the cell exclude.
+        '''
+        if np is not None:
+            columns = [self.columns[var] for var in projection if var in self.columns]
+            if not columns:
+                return []
+            counts = np.bincount(np.concatenate(columns), minlength=len(self.cells))
+            rows = np.flatnonzero(self.enabled_rows & (counts == self.pre_sizes))
+            return [self.cells[row] for row in rows.tolist() if self.cells[row] != exclude]
+
+        projection_bits = self.bits(projection)
+        candidates = set()
+        for var in projection:
+            if var in self.consumers:
+                candidates |= self.consumers[var]
+        candidates.discard(exclude)
+        enabled = []
+        for cell_id in candidates:
+            row = self.rank[cell_id]
+            if self.enabled[row] and not self.pre_bits[row] & ~projection_bits:
+                enabled.append(cell_id)
+        return sorted(enabled, key=self.rank.__getitem__)
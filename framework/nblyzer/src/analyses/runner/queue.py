@@ -1,23 +1,57 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from queue import Queue
+from collections import deque
+from heapq import heappush, heappop
 
 class FifoQueue():
+    '''
+    Single-threaded FIFO worklist. An element that is already waiting is not queued again.
+    '''
     def __init__(self) -> None:
-        self.q: Queue = Queue()
+        self.q: deque = deque()
+        self.queued: set = set()
 
     def pop(self):
-        return self.q.get_nowait()
+        e = self.q.popleft()
+        self.queued.discard(e)
+        return e
 
     def push(self, e):
-        self.q.put_nowait(e)
+        if e not in self.queued:
+            self.queued.add(e)
+            self.q.append(e)
 
     def populate(self, l: list) -> None:
         for e in l:
             self.push(e)
 
     def empty(self) -> bool:
-        return self.q.empty()
+        return not self.q
+
+class RankedQueue():
+    '''
+    Single-threaded worklist that pops the waiting element of lowest rank, e.g. the reverse postorder
+    number of a CFG node, so that a node is transformed after its forward predecessors.
+    An element that is already waiting is not queued again.
+    '''
+    def __init__(self, rank: dict) -> None:
+        self.rank: dict = rank
+        self.heap: list[int] = []
+        self.queued: dict = {}
 
+    def pop(self):
+        return self.queued.pop(heappop(self.heap))
+
+    def push(self, e):
+        rank = self.rank[e]
+        if rank not in self.queued:
+            self.queued[rank] = e
+            heappush(self.heap, rank)
+
+    def populate(self, l: list) -> None:
+        for e in l:
+            self.push(e)
 
+    def empty(self) -> bool:
+        return not self.heap
@@ -0,0 +1,66 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from copy import deepcopy
+from .analysis_results import Result
+from ....src.IR.notebook_IR import code_cell_order
+
+class CachedResult:
+    '''
+    Result of one run together with everything it depends on: the interface of every code cell in
+    notebook order (what the phi tests and pre-summaries read), the source of the cells the fixpoint
+    transformed, the state of the analysis before the run and its state after the run.
+    '''
+    __slots__ = ("layout", "sources", "state", "state_after", "result")
+
+    def __init__(self, layout: tuple, sources: dict[int, str], state, state_after, result: Result) -> None:
+        self.layout = layout
+        self.sources = sources
+        self.state = state
+        self.state_after = state_after
+        self.result = result
+
+class ResultCache:
+    '''
+    Results of analysis runs keyed by (analysis, start cell, level), kept until the cells they depend on
+    are edited. A cached result is returned for a run from the same start as long as no cell it
+    transformed changed its source, no cell changed its interface or moved, and the analysis is in the
+    same state, so running a cell again after unrelated edits does not run the fixpoint again.
+    '''
+    def __init__(self) -> None:
+        self.entries: dict[tuple, CachedResult] = {}
+        self.hits: int = 0
+
+    @staticmethod
+    def layout(notebook_IR, necessary: set[int], start_IR) -> tuple:
+        return (
+            tuple((cell_id, notebook_IR[cell_id].code_IR.interface) for cell_id in code_cell_order(notebook_IR)),
+            frozenset(necessary),
+            start_IR.code_IR.source_hash
+        )
+
+    def get(self, key: tuple, layout: tuple, state, notebook_IR) -> CachedResult:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.state != state or entry.layout != layout or any(
+            cell_id not in notebook_IR or notebook_IR[cell_id].code_IR.source_hash != source
+            for cell_id, source in entry.sources.items()
+        ):
+            del self.entries[key]
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, layout: tuple, cells: set[int], notebook_IR, state, state_after, result: Result) -> None:
+        sources = {cell_id: notebook_IR[cell_id].code_IR.source_hash for cell_id in cells}
+        self.entries[key] = CachedResult(layout, sources, state, state_after, deepcopy(result))
+
+    def invalidate(self, cell_id: int) -> None:
+        '''
+        Drops the results that depend on the source of the cell.
+        '''
+        self.entries = {key: entry for key, entry in self.entries.items() if cell_id not in entry.sources}
+
+    def clear(self) -> None:
+        self.entries = {}
@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import time
 from copy import deepcopy
 from unittest import result
 from ..abs_states.abs_state import AbstractState
@@ -12,44 +13,57 @@ from simple_cfg.cfg_nodes import Node
 from collections import defaultdict
 
 from ....src.IR.intermediate_representations import IntermediateRepresentations
-from .queue import FifoQueue
+from ....src.IR.notebook_IR import code_cell_order, variable_consumers, derived
+from .queue import RankedQueue
+from .cell_path import CellPath
+from .phi_index import PhiIndex
+from .stats import Stats
 
 class Runner:
-    def __init__(self, stats, cell_state_map: dict[int, AbstractState], cells_summary_map: dict[int, IntermediateRepresentations]):
+    def __init__(self, stats: Stats, cell_state_map: dict[int, AbstractState], cells_summary_map: dict[int, IntermediateRepresentations]):
         self.stats = stats
         self.cell_state_map: dict[int, AbstractState] = deepcopy(cell_state_map)
         self.error_states: list[AbstractState] = list()
         self.cells_summary_map: dict[int, IntermediateRepresentations] = cells_summary_map
+        self.phi_index: PhiIndex = None
+        self.visited: set[int] = set()
     
     def intra_fixpoint_runner(self, cell_IR: IntermediateRepresentations, analysis: Analysis, as_init: AbstractState, K = None, imports = set()):
         cfg: CFG = cell_IR.CFG
         node_state_map = defaultdict(type(as_init))
-        transform_order: FifoQueue = FifoQueue()
+        transform_order: RankedQueue = RankedQueue(cell_IR.RPO)
         transform_order.populate(cfg.nodes[0].outgoing)
         errors = []
         as_entry = deepcopy(as_init)
+        start = time.perf_counter_ns()
+        visits = 0
 
-        while not transform_order.empty():
-            next_node: Node = transform_order.pop()
-            states_of_ingoing = self.get_states_of_ingoing(next_node.ingoing, node_state_map)
+        try:
+            while not transform_order.empty():
+                analysis.check_cancelled()
+                next_node: Node = transform_order.pop()
+                visits += 1
+                states_of_ingoing = self.get_states_of_ingoing(next_node.ingoing, node_state_map)
 
-            if cfg.nodes[0] in next_node.ingoing:
-                states_of_ingoing.append(as_entry)
-            as_entry = analysis.combine_states(states_of_ingoing)
+                if cfg.nodes[0] in next_node.ingoing:
+                    states_of_ingoing.append(as_entry)
+                as_combined = analysis.combine_states(states_of_ingoing)
 
-            as_transformed: AbstractState = analysis.F_transformer(next_node, as_entry, cell_IR)
-            as_transformed.condition(cell_IR, next_node, errors)
+                as_transformed: AbstractState = analysis.F_transformer(next_node, as_combined, cell_IR)
+                as_transformed.condition(cell_IR, next_node, errors)
 
-            as_prev = node_state_map[next_node]
-        
-            if as_prev != as_transformed:
-                for node in next_node.outgoing:
-                    transform_order.push(node)
-                node_state_map[next_node] = as_transformed
-            
-            for err in errors:
-                if err.error_type == ErrorType.TERMINAL:
-                    return as_transformed, errors
+                as_prev = node_state_map[next_node]
+
+                if as_prev != as_transformed:
+                    for node in next_node.outgoing:
+                        transform_order.push(node)
+                    node_state_map[next_node] = as_transformed
+
+                for err in errors:
+                    if err.error_type == ErrorType.TERMINAL:
+                        return as_transformed, errors
+        finally:
+            self.stats.log_cell(time.perf_counter_ns() - start, visits)
 
         cell_post_state = node_state_map[cfg.nodes[-1]]
         return cell_post_state, errors
@@ -57,11 +71,39 @@ class Runner:
     def get_states_of_ingoing(self, nodes, node_state_map) -> list[AbstractState]:
         return [node_state_map[node] for node in nodes if node in node_state_map]
 
+    def successors(self, analysis: Analysis, cell_id, abstract_state: AbstractState) -> list:
+        '''
+        Cells the state of cell_id propagates to, in notebook order. Cells are enabled when
+        analysis.propagates_from(cell_id) holds and their pre-summary is non-empty and contained in the
+        projection, which PhiIndex answers for all cells at once; every other cell is logged as a failed test.
+
+        The index is kept on the notebook IR per analysis, so following events reuse it until a cell is edited.
+        '''
+        start = time.perf_counter_ns()
+        if self.phi_index is None:
+            cells = code_cell_order(self.cells_summary_map)
+            enabled = [c in analysis.necessary for c in cells]
+            self.phi_index = derived(self.cells_summary_map, type(analysis).__name__, enabled, lambda: PhiIndex(
+                cells,
+                [analysis.calculate_pre(self.cells_summary_map[c]) for c in cells],
+                enabled,
+                variable_consumers(self.cells_summary_map)
+            ))
+        successors = []
+        if analysis.propagates_from(self.cells_summary_map[cell_id]):
+            successors = self.phi_index.enabled_cells(abstract_state.projection(), cell_id)
+        self.stats.log_phi(True, len(successors))
+        self.stats.log_phi(False, len(self.phi_index.cells) - 1 - len(successors))
+        self.stats.log_phi_time(time.perf_counter_ns() - start)
+        return successors
+
     def inter_fixpoint_runner(self, analysis: Analysis, cell_id, abstract_state: AbstractState, K, cpath=[], results: Result = Result()):
         assert(cell_id is not None)
+        analysis.check_cancelled()
         swap = None
         if K:
             abstract_state_pre = abstract_state
+            self.visited.add(cell_id)
             abstract_state, errors = self.intra_fixpoint_runner(self.cells_summary_map[cell_id], analysis, abstract_state_pre, len(cpath))
             if cell_id in self.cell_state_map and abstract_state.contains(abstract_state_pre): 
                 self.stats.log_fp(len(cpath))
@@ -72,21 +114,15 @@ class Runner:
             if errors != []:
                 for err in errors:
                     path_result: PathResult = PathResult(cpath, errors)
-                    if path_result not in results.path_results:
+                    if path_result not in results:
                         results.add_path_results([path_result])
                         self.error_states += [abstract_state]
                         if err.error_type == ErrorType.TERMINAL:
                             return results
             swap = deepcopy(self.cell_state_map[cell_id]) if cell_id in self.cell_state_map else None
             self.cell_state_map[cell_id] = abstract_state
-            for c in self.cells_summary_map.keys():
-                if c != cell_id:
-                    pre_summary = analysis.calculate_pre(self.cells_summary_map[c])
-                    if bool(pre_summary) and c in analysis.necessary and analysis.phi_condition(abstract_state.projection(), pre_summary, self.cells_summary_map[cell_id]):
-                        self.stats.log_phi(True)
-                        results = self.inter_fixpoint_runner(analysis, c, abstract_state, K - 1, deepcopy(cpath), results)
-                    else:
-                        self.stats.log_phi(False)
+            for c in self.successors(analysis, cell_id, abstract_state):
+                results = self.inter_fixpoint_runner(analysis, c, abstract_state, K - 1, deepcopy(cpath), results)
 
             if swap:
                 self.cell_state_map[cell_id] = swap
@@ -94,3 +130,108 @@ class Runner:
                 self.cell_state_map.pop(cell_id)
 
         return results
+
+    def inter_worklist_runner(self, analysis: Analysis, cell_id, abstract_state: AbstractState, K, results: Result = None) -> Result:
+        '''
+        Explores the same cell paths in the same order as inter_fixpoint_runner and returns the same result,
+        but keeps the exploration on an explicit stack instead of recursing and shares paths as CellPath chains.
+
+        A finished subtree is memoized on (cell, fingerprint of the entry state) when its exploration
+        did not depend on the path leading to it, i.e. it raised no TERMINAL error and never visited a cell
+        of that path. Reaching the same pair again with at most the same K on a path avoiding the visited
+        cells would only rediscover errors that are already in the result, so the subtree is skipped.
+        '''
+        results = results if results is not None else Result()
+        memo: dict[tuple, tuple[int, frozenset]] = {}
+        on_path: dict[int, int] = defaultdict(int)
+        stack: list[_Frame] = []
+
+        def finish(key, K, touched, clean, parent: _Frame) -> None:
+            if parent:
+                parent.touched |= touched
+                parent.clean = parent.clean and clean
+            if key is not None and clean and not any(on_path[c] for c in touched):
+                entry = memo.get(key)
+                if not entry or entry[0] <= K:
+                    memo[key] = (K, frozenset(touched))
+
+        def visit(cell_id, abstract_state_pre: AbstractState, K, parent: _Frame) -> None:
+            analysis.check_cancelled()
+            if not K:
+                return
+            key = None
+            fingerprint = abstract_state_pre.fingerprint()
+            if fingerprint is not None:
+                key = (cell_id, fingerprint)
+                entry = memo.get(key)
+                if entry and K <= entry[0] and not any(on_path[c] for c in entry[1]):
+                    if parent:
+                        parent.touched |= entry[1]
+                    return
+
+            parent_path = parent.path if parent else None
+            depth = parent_path.length if parent_path else 0
+            self.visited.add(cell_id)
+            abstract_state, errors = self.intra_fixpoint_runner(self.cells_summary_map[cell_id], analysis, abstract_state_pre, depth)
+            touched = {cell_id}
+            clean = all(err.error_type != ErrorType.TERMINAL for err in errors)
+            if cell_id in self.cell_state_map and abstract_state.contains(abstract_state_pre):
+                self.stats.log_fp(depth)
+                finish(key, K, touched, clean, parent)
+                return
+
+            path = CellPath(cell_id, parent_path)
+            if errors != []:
+                path_result: PathResult = PathResult(path.to_list(), errors)
+                if path_result not in results:
+                    results.add_path_results([path_result])
+                    self.error_states += [abstract_state]
+                    if errors[0].error_type == ErrorType.TERMINAL:
+                        finish(key, K, touched, clean, parent)
+                        return
+
+            frame = _Frame(cell_id, abstract_state, K, path, key, touched, clean, self.successors(analysis, cell_id, abstract_state))
+            if cell_id in self.cell_state_map:
+                frame.swap = self.cell_state_map[cell_id]
+            self.cell_state_map[cell_id] = abstract_state
+            on_path[cell_id] += 1
+            stack.append(frame)
+
+        visit(cell_id, abstract_state, K, None)
+        while stack:
+            frame = stack[-1]
+            depth = len(stack)
+            while frame.next_child < len(frame.successors) and len(stack) == depth:
+                c = frame.successors[frame.next_child]
+                frame.next_child += 1
+                visit(c, frame.abstract_state, frame.K - 1, frame)
+            if len(stack) != depth:
+                continue
+
+            stack.pop()
+            on_path[frame.cell_id] -= 1
+            if frame.swap:
+                self.cell_state_map[frame.cell_id] = frame.swap
+            else:
+                self.cell_state_map.pop(frame.cell_id)
+            finish(frame.key, frame.K, frame.touched, frame.clean, stack[-1] if stack else None)
+
+        return results
+
+class _Frame:
+    '''
+    Cell of the current path in inter_worklist_runner, with the position of the next successor to try.
+    '''
+    __slots__ = ("cell_id", "abstract_state", "K", "path", "key", "touched", "clean", "successors", "swap", "next_child")
+
+    def __init__(self, cell_id, abstract_state: AbstractState, K, path: CellPath, key, touched: set, clean: bool, successors: list) -> None:
+        self.cell_id = cell_id
+        self.abstract_state = abstract_state
+        self.K = K
+        self.path = path
+        self.key = key
+        self.touched = touched
+        self.clean = clean
+        self.successors = successors
+        self.swap: AbstractState = None
+        self.next_child = 0
@@ -3,6 +3,7 @@
 
 import time
 import statistics
+from ...timing import current_timings, INTRA_FIXPOINT, PHI
 
 class Stats:
     def __init__(self, start_cell = 0, filename = ""):
@@ -11,8 +12,10 @@ class Stats:
         self.errors = []
         self.fps = []
         self.cell_times = []
+        self.node_visits = []
         self.phi_true = 0
         self.phi_false = 0
+        self.phi_ns = 0
         self.total_prop = 0
         self.execute_time = 0
 
@@ -25,16 +28,32 @@ class Stats:
         self.fps.append(K)
 
     def log_start(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter_ns()
 
-    def log_phi(self, branch: bool):
+    def log_phi(self, branch: bool, count: int = 1):
         if branch:
-            self.phi_true = self.phi_true + 1
+            self.phi_true = self.phi_true + count
         else:
-            self.phi_false = self.phi_false + 1
+            self.phi_false = self.phi_false + count
+
+    def log_phi_time(self, ns: int):
+        self.phi_ns += ns
+        timings = current_timings()
+        if timings is not None:
+            timings.add(PHI, ns)
+
+    def log_cell(self, ns: int, visits: int):
+        '''
+        Logs an intra cell fixpoint run that took ns nanoseconds and visited as many CFG nodes.
+        '''
+        self.cell_times.append(ns / 1e9)
+        self.node_visits.append(visits)
+        timings = current_timings()
+        if timings is not None:
+            timings.add(INTRA_FIXPOINT, ns, visits)
 
     def log_end(self):
-        self.execute_time =  time.time() - self.start_time 
+        self.execute_time = (time.perf_counter_ns() - self.start_time) / 1e9
 
     def log_error(self, K):
         self.errors.append(K)
@@ -46,7 +65,8 @@ class Stats:
         phi_rate = -1 if (self.phi_false + self.phi_true) == 0 else self.phi_true / (self.phi_false + self.phi_true)
         min_fps = min(self.fps) if len(self.fps) > 0 else -1
         max_fps =  max(self.fps) if len(self.fps) > 0 else -1
-        return [self.filename, self.start_cell, f'{t_extime:.20f}', t_cell_extime_avg, t_cell_extime_max, len(self.errors), phi_rate, len(self.fps), min_fps, max_fps]
+        return [self.filename, self.start_cell, f'{t_extime:.20f}', t_cell_extime_avg, t_cell_extime_max, len(self.errors), phi_rate, len(self.fps), min_fps, max_fps,
+                len(self.cell_times), sum(self.node_visits), self.phi_ns / 1e9]
 
     def write_row_to_file(self):
         t_extime = self.execute_time
@@ -54,9 +74,3 @@ class Stats:
         t_cell_extime_max = max(self.cell_times)
 
         print(t_extime + "\t" + t_cell_extime_avg + "\t" + t_cell_extime_max + "\t")
-
-
-
-
-
-
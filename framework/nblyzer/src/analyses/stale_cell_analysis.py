@@ -4,8 +4,9 @@
 from collections import defaultdict
 from copy import deepcopy
 from ..IR.intermediate_representations import IntermediateRepresentations
+from ..IR.notebook_IR import symbol_table
 from .runner.runners import Runner
-from .runner.analyses_utils import find_changed_vars, AssignParserVisitor, get_all_unbound_vars
+from .runner.analyses_utils import find_changed_vars, get_all_unbound_vars
 from .analysis import Analysis
 from .abs_states.code_impact_abs_state import CodeImpactAS
 from .runner.analysis_results import Result
@@ -21,17 +22,16 @@ class StaleCellAnalysis(Analysis):
         self.stats = []
 
     def F_transformer(self, cfg_node: Node, a_state: CodeImpactAS, cell_IR: IntermediateRepresentations):
-        as_transformed: CodeImpactAS = deepcopy(a_state)
         if not cfg_node.ast_node:
             return a_state
-        if isinstance(cfg_node.ast_node, ast.Assign):
-            assign_parser = AssignParserVisitor()
-            assign_parser.parse_assign(cfg_node.ast_node)
-            def_vars = assign_parser.def_variables
-            assigned_vars = assign_parser.assigned_variables
+        as_transformed: CodeImpactAS = deepcopy(a_state)
+        assign_summary = cell_IR.ASSIGNS.get(cfg_node)
+        if assign_summary is not None:
+            def_vars, assigned_vars = assign_summary
             if len(def_vars):
+                impacting_vars = assigned_vars & as_transformed.impacted_variables.keys() - def_vars - self.imports
                 for def_var in def_vars:
-                    for var in assigned_vars & as_transformed.impacted_variables.keys() - def_vars - self.imports:
+                    for var in impacting_vars:
                         if as_transformed.impacted_variables[var] != -1:
                             if var in cell_IR.UDA.def_use_chains.unbound_names and var not in cell_IR.UDA.defined_vars:
                                 as_transformed.set_var_level(def_var, as_transformed.impacted_variables[var] + 1)
@@ -75,23 +75,14 @@ class StaleCellAnalysis(Analysis):
         stat = Stats(old_cell_IR.cell_id, filename)
         stat.log_start()
         runner: Runner = Runner(stat, defaultdict(CodeImpactAS), notebook_IR)
-        result: Result = runner.inter_fixpoint_runner(
-            self,
-            old_cell_IR.cell_id,
-            abstract_state=init_as,
-            K=level,
-            cpath=[],
-            results=Result()
-        )
+        result: Result = self.run_inter_fixpoint(runner, old_cell_IR.cell_id, init_as, level)
 
         stat.log_end()
         self.stats.append(stat)
         return runner, result, init_as
 
     def _find_all_imports(self, notebook_IR: dict[str, IntermediateRepresentations]):
-        self.imports = set()
-        for cell_IR in notebook_IR.values():
-            self.imports.update(cell_IR.UDA.imports)
+        self.imports = symbol_table(notebook_IR).imported_names()
 
     def analyze_notebook(self, notebook_IR, old_cell_IR=None, level=20, filename=""):
         return self._run_fixpoint_analysis(notebook_IR, old_cell_IR, level, filename)[1]
@@ -110,11 +101,17 @@ class StaleCellAnalysis(Analysis):
             if level == 0:
                 self.abstract_state.impacted_variables[var] = -1
 
+    def cache_state(self):
+        return self.abstract_state.fingerprint()
+
     def phi_condition(self, current: set, pre: set, cell_IR):
-        if len(self.all_unbound_vars.intersection(cell_IR.UDA.defined_vars.keys())):
+        if self.propagates_from(cell_IR):
             return pre <= current
         else:
             False
 
+    def propagates_from(self, cell_IR) -> bool:
+        return not self.all_unbound_vars.isdisjoint(cell_IR.UDA.defined_vars.keys())
+
     def calculate_pre(self, cell_IR:IntermediateRepresentations):
         return cell_IR.UDA.unbound_final - self.imports
\ No newline at end of file
@@ -1,72 +1,202 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from collections import defaultdict
-from sre_parse import fix_flags
-from nblyzer import NBlyzer
-from argparse import ArgumentParser
-from events import RunBatchEvent
-from resource_utils.rsrc_mngr import ResourceManager
-from resource_utils.utils import is_script
 import csv
-import os
-from tqdm import tqdm
 import json
-
-
-def benchmark(folder, analyses, level, output, filter, notebooks_to_run = None):
-    nb_stats = []
-    mng = ResourceManager()
-    if notebooks_to_run:
-        dir_list = notebooks_to_run
-    else:
-        dir_list = os.listdir(folder)
-    stats_analysis = defaultdict(lambda: [])
-    for f in tqdm(dir_list):
-        if not f.endswith(".ipynb"):
-            continue
-
-        print("\nfile: " + f)
-        if f in filter:
-            continue
-
-        try:
-            notebook = mng.grab_local_json(folder+f)
-        except FileNotFoundError:
-            notebook = mng.grab_local_json(folder + "\\" + f)
-        except json.decoder.JSONDecodeError:
-            print("Warning decode error ")
-            continue
-
-        nblyzer = NBlyzer(level=level, filename=f)
-        try:
-           nblyzer.load_notebook(notebook["cells"])
-        except KeyError:
-            print("Warning syntax error ")
-            continue
-        except SyntaxError:
-            print("Warning syntax error ")
-            continue
-        except Exception:
-            print('Other')
-            continue
-
-        for start in nblyzer.notebook_IR.keys():
-            nblyzer.add_analyses(analyses)
-
-            event = RunBatchEvent(start)
-            results = nblyzer.execute_event(event).dumps(True)
-
-        for akey in nblyzer.active_analyses:
-            for s in nblyzer.all_analyses[akey].stats:
-                stats_analysis[akey].append(s.get_row())
-
-        for s in stats_analysis.keys():
-            with open(output + s.replace(" ", "") + ".csv", "w+") as f:
-                writer = csv.writer(f)
-                writer.writerow(["file name", "start cell", "execute time", "avg cell exec time", "max cell exec time", "no. of errors", "true phi rate", "no. fixedpoint", "longest fixedpoint path", "shortest fixedpoint path"])
-                for rows in stats_analysis[s]:
-                    writer.writerow(rows)
+import multiprocessing
+import os
+import time
+from argparse import ArgumentParser
+from collections import deque
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+if __package__ in (None, ""):
+    # Started as a script, whose folder is on sys.path.
+    from benchmarks._script import make_importable
+    __package__ = make_importable(__file__)
+
+from .nblyzer import NBLyzer
+from .events import OpenNotebookEvent, RunAllStartsEvent
+from .resource_utils.rsrc_mngr import ResourceManager
+from .IR.ir_cache import ir_cache
+from .timing import Timings, PHASES
+
+STATS_HEADER = ["file name", "start cell", "execute time", "avg cell exec time", "max cell exec time", "no. of errors", "true phi rate", "no. fixedpoint", "longest fixedpoint path", "shortest fixedpoint path",
+                "intra fixpoint runs", "node visits", "phi scan time"]
+STATUS_HEADER = ["file name", "status", "wall time", "message"] + [f"{phase} ns" for phase in PHASES] + ["node visits"]
+STATUS_FILE = "status.csv"
+
+# Statuses of a notebook in the status CSV. Notebooks with a status are not run again when resuming.
+OK = "ok"
+DECODE_ERROR = "decode error"
+SYNTAX_ERROR = "syntax error"
+ERROR = "error"
+OUT_OF_MEMORY = "out of memory"
+TIMEOUT = "timeout"
+CRASH = "crash"
+
+def stats_path(output: str, analysis: str) -> str:
+    return output + analysis.replace(" ", "") + ".csv"
+
+def status_path(output: str) -> str:
+    return output + STATUS_FILE
+
+def analyze_notebook(path: str, analyses: list[str], level: int, cache_dir: str = None, memory_limit: int = None):
+    '''
+    Runs the analyses from every start cell of a notebook. Returns (status, message, stats rows of every analysis,
+    time spent in every phase while loading and analyzing the notebook).
+    '''
+    if cache_dir:
+        ir_cache.set_directory(cache_dir)
+    if memory_limit and resource:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        notebook = ResourceManager().grab_local_json(path)
+    except json.decoder.JSONDecodeError as e:
+        return DECODE_ERROR, str(e), {}, Timings()
+
+    nblyzer = NBLyzer(level=level, filename=os.path.basename(path))
+    try:
+        nblyzer.execute_event(OpenNotebookEvent(notebook["cells"]))
+    except (KeyError, SyntaxError) as e:
+        return SYNTAX_ERROR, f"{type(e).__name__}: {e}", {}, nblyzer.timings
+    timings = nblyzer.timings
+
+    nblyzer.add_analyses(analyses)
+    nblyzer.execute_event(RunAllStartsEvent())
+    timings.merge(nblyzer.timings)
+    return OK, "", {analysis: [s.get_row() for s in nblyzer.all_analyses[analysis].stats] for analysis in analyses}, timings
+
+def _run_notebook(connection, path: str, analyses: list[str], level: int, cache_dir: str, memory_limit: int) -> None:
+    '''
+    Entry point of the process analyzing one notebook, sends the outcome of analyze_notebook back to the runner.
+    '''
+    try:
+        outcome = analyze_notebook(path, analyses, level, cache_dir, memory_limit)
+    except MemoryError:
+        outcome = OUT_OF_MEMORY, "", {}, Timings()
+    except Exception as e:
+        outcome = ERROR, f"{type(e).__name__}: {e}", {}, Timings()
+    connection.send(outcome)
+    connection.close()
+
+class CorpusWriter:
+    '''
+    Appends the rows of every finished notebook to the per-analysis stats CSVs and to the status CSV.
+
+    The status CSV is the checkpoint of a sweep: the status row of a notebook is written after its stats
+    rows are flushed, so a resumed sweep skips exactly the notebooks with a status row, after dropping
+    the stats rows of notebooks that were interrupted before their status row was written.
+    '''
+    def __init__(self, output: str, analyses: list[str], resume: bool = False) -> None:
+        self.output = output
+        self.done: set[str] = set()
+        if resume and os.path.exists(status_path(output)):
+            with open(status_path(output), newline="") as f:
+                self.done = {row[0] for row in list(csv.reader(f))[1:] if row}
+            for analysis in analyses:
+                self._drop_unfinished(stats_path(output, analysis))
+        else:
+            for path in [status_path(output)] + [stats_path(output, analysis) for analysis in analyses]:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.status = self._open(status_path(output), STATUS_HEADER)
+        self.stats = {analysis: self._open(stats_path(output, analysis), STATS_HEADER) for analysis in analyses}
+
+    def _drop_unfinished(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows[:1] + [row for row in rows[1:] if row and row[0] in self.done])
+
+    @staticmethod
+    def _open(path: str, header: list[str]):
+        f = open(path, "a", newline="")
+        if not f.tell():
+            csv.writer(f).writerow(header)
+        return f
+
+    def write(self, filename: str, status: str, wall_time: float, message: str, stats: dict[str, list], timings: Timings) -> None:
+        for analysis, rows in stats.items():
+            csv.writer(self.stats[analysis]).writerows(rows)
+            self.stats[analysis].flush()
+        csv.writer(self.status).writerow([filename, status, f"{wall_time:.3f}", message] + timings.get_row())
+        self.status.flush()
+        self.done.add(filename)
+
+    def close(self) -> None:
+        for f in [self.status] + list(self.stats.values()):
+            f.close()
+
+def benchmark(folder, analyses, level, output, filter = (), notebooks_to_run = None, cache_dir = None,
+              workers = 1, timeout = None, memory_limit = None, resume = False):
+    '''
+    Analyzes every notebook of the folder from every start cell, each notebook in its own process with at
+    most `workers` processes at a time, and appends the stats of every analysis to <output><analysis>.csv
+    and the outcome of every notebook to <output>status.csv as soon as the notebook is done.
+
+    A notebook that runs longer than `timeout` seconds is killed, and the address space of a notebook
+    process is limited to `memory_limit` bytes where the platform supports it. Timeouts, crashes and
+    notebooks that do not load are recorded in the status CSV instead of stopping the sweep. With resume
+    the notebooks that already have a status are skipped.
+    '''
+    dir_list = notebooks_to_run if notebooks_to_run else sorted(os.listdir(folder))
+    writer = CorpusWriter(output, analyses, resume)
+    pending = deque(f for f in dir_list if f.endswith(".ipynb") and f not in filter and f not in writer.done)
+    progress = tqdm(total=len(pending)) if tqdm else None
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    running: dict = {}
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                f = pending.popleft()
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_run_notebook, args=(sender, os.path.join(folder, f), analyses, level, cache_dir, memory_limit), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (f, process, time.monotonic())
+
+            now = time.monotonic()
+            wait_time = None if timeout is None else max(0, min(started + timeout for _, _, started in running.values()) - now)
+            ready = wait(list(running.keys()), wait_time)
+            now = time.monotonic()
+            for receiver in list(running.keys()):
+                f, process, started = running[receiver]
+                if receiver in ready:
+                    try:
+                        status, message, stats, timings = receiver.recv()
+                    except EOFError:
+                        process.join()
+                        status, message, stats, timings = CRASH, f"exit code {process.exitcode}", {}, Timings()
+                elif timeout is not None and now - started >= timeout:
+                    process.kill()
+                    status, message, stats, timings = TIMEOUT, "", {}, Timings()
+                else:
+                    continue
+                process.join()
+                receiver.close()
+                del running[receiver]
+                writer.write(f, status, now - started, message, stats, timings)
+                if progress:
+                    progress.update()
+    finally:
+        for f, process, _ in running.values():
+            process.kill()
+        writer.close()
+        if progress:
+            progress.close()
 
 def main():
     parser = ArgumentParser(description="NBLyzer benchmarker version 1.0 ")
@@ -74,59 +204,16 @@ def main():
     parser.add_argument("-a", "--analyses", nargs="+", type=str, default=[], help='Analyses to perform.')
     parser.add_argument("-l", "--level", nargs="?", type=int, default=1000, help='K-depth to analyze.')
     parser.add_argument("-o", "--output",  type=str, help='Output folder')
+    parser.add_argument("-c", "--cache-dir", type=str, default=None, help='Directory of the persistent IR cache (disabled by default).')
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help='Number of notebooks analyzed in parallel (default is the number of CPUs).')
+    parser.add_argument("-t", "--timeout", type=float, default=None, help='Seconds after which a notebook is killed and recorded as a timeout (no limit by default).')
+    parser.add_argument("-m", "--memory-limit", type=int, default=None, help='Memory limit of a notebook process in MB (no limit by default).')
+    parser.add_argument("-r", "--resume", action="store_true", help='Skip the notebooks recorded in the status file of a previous sweep.')
     args = parser.parse_args()
 
-    filter = ["nb_4357163.ipynb", "nb_4207320.ipynb", "nb_3607344.ipynb", 
-               "nb_4243327.ipynb", "nb_3709448.ipynb", "nb_3607795.ipynb", 
-               "nb_3917413.ipynb", "nb_3847650.ipynb", "nb_3787548.ipynb", 
-               "nb_3928517.ipynb", "nb_4129718.ipynb", "nb_3907591.ipynb", 
-               "nb_4111798.ipynb", "nb_3953080.ipynb", "nb_3625218.ipynb", 
-               "nb_4243362.ipynb"]
-    kaggle_filter = ["183.ipynb"]
-
-    fix_filter = ["nb_3765508.ipynb", "nb_3752761.ipynb", "nb_3797858.ipynb", "nb_3953414.ipynb", 
-    "nb_4066630.ipynb", "nb_4241014.ipynb", "nb_4116288.ipynb", "nb_4377349.ipynb", "nb_3953451.ipynb", 
-    "nb_4126120.ipynb", "nb_4355681.ipynb", "nb_4309469.ipynb", "nb_4342687.ipynb", "nb_4063850.ipynb", 
-    "nb_3851656.ipynb", "nb_3911103.ipynb", "nb_3593763.ipynb", "nb_3537417.ipynb", "nb_3556019.ipynb", 
-    "nb_4036196.ipynb", "nb_3851287.ipynb", "nb_4252631.ipynb", "nb_4278445.ipynb", "nb_4171747.ipynb", 
-    "nb_4090500.ipynb", "nb_4021996.ipynb", "nb_3677219.ipynb", "nb_3692862.ipynb", "nb_3528051.ipynb",
-    " nb_3962897.ipynb", "nb_3962897.ipynb", "nb_3774776.ipynb", "nb_3746379.ipynb", "nb_4363714.ipynb",
-    "nb_3662295.ipynb", "nb_4223490.ipynb", "nb_3985266.ipynb", "nb_4233186.ipynb", "nb_4057621.ipynb", 
-    "nb_3685062.ipynb", "nb_4361427.ipynb", "nb_3771155.ipynb", "nb_3947049.ipynb", "nb_4057664.ipynb", 
-    "nb_3867357.ipynb", "nb_3801249.ipynb", "nb_4032449.ipynb", "nb_4333463.ipynb", "nb_4323936.ipynb", 
-    "nb_4099946.ipynb", "nb_4377464.ipynb", "nb_4284043.ipynb", "nb_3974446.ipynb", "nb_3953339.ipynb", 
-    "nb_4142420.ipyn", "nb_4142420.ipynb", "nb_3570808.ipynb", "nb_4133538.ipynb", "nb_4232980.ipynb", 
-    "nb_4116131.ipynb", "nb_3516916.ipynb", "nb_3823315.ipynb", "nb_4263665.ipynb", "nb_3637310.ipynb", 
-    "nb_3578363.ipynb", "nb_4157381.ipynb", "nb_4241781.ipynb", "nb_3847551.ipynb", "nb_3693099.ipynb", 
-    "nb_4298472.ipynb", "nb_4117189.ipynb"]
-
-    non_type_filter = ["nb_3815515.ipynb", "nb_3721960.ipynb", "nb_4372597.ipynb", 
-                       "nb_3794171.ipynb", "nb_4373776.ipynb", "nb_4159459.ipynb", 
-                       "nb_4094939.ipynb", "nb_3811543.ipynb", "nb_3615481.ipynb"]
-
-    call_value_filter = ["nb_3871856.ipynb", "nb_3677005.ipynb", "nb_3666513.ipynb"]
-
-    name_value = ["nb_4029245.ipynb"]
-
-    key_error_filter = ["nb_4373905.ipynb", "nb_3797472.ipynb", "nb_4225281.ipynb", 
-                        "nb_3938468.ipynb", "nb_3637011.ipynb", "nb_4366894.ipynb", 
-                        "nb_3556205.ipynb", "nb_3968929.ipynb", "nb_3938689.ipynb", 
-                        "nb_4195848.ipynb", "nb_4377916.ipynb", "nb_3895375.ipynb", 
-                        "nb_3834667.ipynb", "nb_4358502.ipynb", "nb_4342767.ipynb", 
-                        "nb_4387058.ipynb", "nb_3701251.ipynb"]
-
-    beniget_filter = ["nb_3714079.ipynb", "nb_4117445.ipynb", "nb_3595869.ipynb"]
-
-    list_range_filter = ["nb_3701309.ipynb", "nb_3895545.ipynb", "nb_3895500.ipynb", "nb_3677040.ipynb", "nb_4111584.ipynb"]
-
-    exit_lhs_filter = ["nb_3608760.ipynb"]
-
-    list_id_filter = ["nb_3983247.ipynb"]
-
-    notebooks_to_run = ["183.ipynb"]
-
-    benchmark(args.folder, args.analyses, args.level, args.output, 
-    filter+fix_filter+non_type_filter+call_value_filter+name_value+key_error_filter+beniget_filter+list_range_filter+exit_lhs_filter+list_id_filter+kaggle_filter, notebooks_to_run=None)
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit else None
+    benchmark(args.folder, args.analyses, args.level, args.output, cache_dir=args.cache_dir,
+              workers=args.workers, timeout=args.timeout, memory_limit=memory_limit, resume=args.resume)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
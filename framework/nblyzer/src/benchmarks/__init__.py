@@ -0,0 +1,23 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import json
+import os
+import sys
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(baseline: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=1)
+
+def exit_gate(regressions: int, update_baseline: bool) -> None:
+    '''
+    Exits with status 1 if a benchmark regressed, unless the run stores the new baseline.
+    '''
+    sys.exit(1 if regressions and not update_baseline else 0)
@@ -0,0 +1,19 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+import sys
+
+def make_importable(file: str) -> str:
+    '''
+    Makes the package of a module of nblyzer started as a script importable and returns the name of the
+    package. Scripts import this module from their folder, which is on sys.path, before the package is.
+    '''
+    folder = os.path.dirname(os.path.abspath(file))
+    subpackages = []
+    while os.path.basename(folder) != "src":
+        subpackages.insert(0, os.path.basename(folder))
+        folder = os.path.dirname(folder)
+    root = os.path.dirname(folder)
+    sys.path.insert(0, os.path.dirname(root))
+    return ".".join([os.path.basename(root), "src"] + subpackages)
@@ -0,0 +1,200 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import gc
+import os
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+if __package__ in (None, ""):
+    # Started as a script, whose folder is on sys.path.
+    from _script import make_importable
+    __package__ = make_importable(__file__)
+
+from . import load_baseline, save_baseline, exit_gate
+from ..analyses.abs_domains.dataleak_lattice.rows import Rows
+from ..analyses.abs_domains.dataleak_lattice.columns import Columns
+from ..analyses.abs_domains.dataleak_lattice.data_frame import DataFrame
+from ..analyses.abs_domains.dataleak_lattice.data_frame_sets import DataFrameSet
+from ..analyses.abs_states.dataleak_abs_state import DataLeakAbstractState, DataLeakAbstractDomain, Usage
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "lattice.json")
+
+# Shape of the generated lattice elements: a data frame set maps SOURCES sources to INTERVALS disjoint
+# row intervals each and every data frame has a map of COLUMNS columns. A state maps VARIABLES variables
+# to smaller data frame sets, as most variables of a notebook track a few frames only. The Rows and
+# Columns benchmarks work on ROW_PAIRS pairs of intervals and on maps of WIDE_COLUMNS columns.
+SOURCES = 8
+INTERVALS = 16
+COLUMNS = 64
+VARIABLES = 16
+VARIABLE_SOURCES = 2
+VARIABLE_INTERVALS = 4
+STRIDE = 100
+ROW_PAIRS = 1000
+WIDE_COLUMNS = 1000
+
+# Relative slowdown reported as a regression, 1 fails cases twice as slow as the baseline. On an unchanged
+# tree, on a single core VM, the median relative time of a case (9 rounds of 10 calls) varied by up to 1.5x
+# between 8 suites and was up to 1.7x off the recorded baseline, mostly through the calibration.
+THRESHOLD = 1.0
+
+def columns(shift: int = 0, width: int = COLUMNS) -> Columns:
+    '''
+    Wide column map, shifted maps share most of their columns and disagree on the presence of some.
+    '''
+    return Columns({f"c{i}": (i + shift) % 3 != 0 for i in range(shift, shift + width)})
+
+def frame_set(sources: int = SOURCES, intervals: int = INTERVALS, start: int = 0, offset: int = 0, shift: int = 0) -> DataFrameSet:
+    '''
+    Data frame set with `intervals` disjoint row intervals of width STRIDE / 2 for every source, beginning
+    at row `start`. With an offset every other interval is moved, so joining with the set without offset
+    reduces half of the frames and appends the other half.
+    '''
+    def rows(i: int) -> Rows:
+        lw = start + i * STRIDE + offset * (i % 2)
+        return Rows(lw, lw + STRIDE // 2 - 1)
+
+    return DataFrameSet({
+        f"s{source}": [DataFrame(f"s{source}", columns(shift), rows(i)) for i in range(intervals)]
+        for source in range(sources)
+    })
+
+def state(offset: int = 0) -> DataLeakAbstractState:
+    abs_state = DataLeakAbstractState()
+    for i in range(VARIABLES):
+        usages = {Usage.TRAIN} if i % 2 else {Usage.TEST}
+        dfs = frame_set(VARIABLE_SOURCES, VARIABLE_INTERVALS, offset=offset * (i % 2))
+        abs_state.state[f"v{i}"] = DataLeakAbstractDomain(dfs, bool(i % 3), usages)
+    return abs_state
+
+def _rows_pairs():
+    return [(Rows(i, i + STRIDE), Rows(i + STRIDE // 2, i + 2 * STRIDE)) for i in range(0, STRIDE * ROW_PAIRS, STRIDE)],
+
+# Benchmark name -> (setup returning the arguments of one call, operation). Setup runs before every call
+# outside of the measured time, so operations that mutate their arguments start from the same elements.
+CASES = {
+    "rows join": (_rows_pairs, lambda pairs: [a | b for a, b in pairs]),
+    "rows meet": (_rows_pairs, lambda pairs: [a & b for a, b in pairs]),
+    "rows sub": (_rows_pairs, lambda pairs: [a - b for a, b in pairs]),
+    "columns join": (lambda: (columns(0, WIDE_COLUMNS), columns(WIDE_COLUMNS // 4, WIDE_COLUMNS)), Columns.join),
+    "columns meet": (lambda: (columns(0, WIDE_COLUMNS), columns(WIDE_COLUMNS // 4, WIDE_COLUMNS)), Columns.meet),
+    "columns sub": (lambda: (columns(0, WIDE_COLUMNS), columns(WIDE_COLUMNS // 4, WIDE_COLUMNS)), Columns.__sub__),
+    "data frame overlap": (
+        lambda: (frame_set(1)["s0"], frame_set(1, offset=STRIDE // 4, shift=COLUMNS // 4)["s0"]),
+        lambda frames, o_frames: [df.overlap(o_df) for df in frames for o_df in o_frames]
+    ),
+    "data frame set join": (lambda: (frame_set(), frame_set(offset=STRIDE // 2, shift=COLUMNS // 4)), DataFrameSet.join),
+    "data frame set meet": (lambda: (frame_set(), frame_set(offset=STRIDE // 4, shift=COLUMNS // 4)), DataFrameSet.meet),
+    # Disjoint rows, respectively disjoint columns for the weak overlap, so every pair of frames is checked.
+    "data frame set cartesian overlap": (lambda: (frame_set(), frame_set(start=STRIDE // 2)), DataFrameSet.cartesian_overlap),
+    "data frame set weak overlap": (lambda: (frame_set(), frame_set(shift=COLUMNS)), lambda dfs, o_dfs: dfs.cartesian_overlap(o_dfs, weak=True)),
+    "data frame set drop rows": (lambda: (frame_set(), STRIDE + 1), DataFrameSet.drop_rows),
+    "data frame set slice rows": (lambda: (frame_set(), 10, -10), DataFrameSet.slice_rows),
+    "state aug join": (lambda: (state(), state(STRIDE // 2)), DataLeakAbstractState.aug_join),
+    "state contains": (lambda: (state(), state()), DataLeakAbstractState.contains),
+}
+
+def calibrate(repeat: int = 1000) -> int:
+    '''
+    Best time in nanoseconds of a fixed pure Python workload. Benchmark times are stored relative to it,
+    so a baseline recorded on one machine can be compared with runs on another. The workload is short
+    and repeated often, so that its best run is rarely disturbed by the machine.
+    '''
+    best = None
+    for _ in range(repeat):
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            data = {f"k{i}": i % 3 != 0 for i in range(1000)}
+            sum(1 for key, value in data.items() if value and key in data)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            gc.enable()
+        best = min(best or sys.maxsize, elapsed)
+    return best
+
+def measure(setup, operation, number: int = 10) -> int:
+    '''
+    Best time in nanoseconds of `number` calls of the operation, every call getting fresh arguments from
+    setup. The best call rather than the mean is kept, as on a loaded machine the slower calls measure
+    the machine. The garbage collector is off while the operation runs, as in timeit. A first call warms
+    up the caches and is not measured.
+    '''
+    operation(*setup())
+    best = None
+    for _ in range(number):
+        args = setup()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            operation(*args)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            gc.enable()
+        best = min(best or sys.maxsize, elapsed)
+    return best
+
+def run_suite(names: list[str] = list(CASES), number: int = 10, rounds: int = 9) -> dict:
+    '''
+    Measures the named cases, returns the calibration time and the time per call of every case both in
+    nanoseconds and relative to the calibration. The cases are measured in `rounds` interleaved rounds,
+    each calibrated on its own and running every case once, and the medians over the rounds are kept, so
+    that a round disturbed by the machine shifts neither the calibration nor a single case.
+    '''
+    calibrations = []
+    times = {name: [] for name in names}
+    relatives = {name: [] for name in names}
+    for _ in range(rounds):
+        calibration = calibrate()
+        calibrations.append(calibration)
+        for name in names:
+            ns = measure(*CASES[name], number)
+            times[name].append(ns)
+            relatives[name].append(ns / calibration)
+    cases = {name: {"ns": statistics.median(times[name]), "relative": statistics.median(relatives[name])} for name in names}
+    return {"calibration ns": statistics.median(calibrations), "cases": cases}
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list[tuple]:
+    '''
+    Compares the relative times of the cases with the baseline. A case regresses when its relative time
+    exceeds the one of the baseline by more than threshold * baseline. Returns (name, relative time,
+    baseline relative time, regressed) for every case, with None for cases missing from the baseline.
+    '''
+    rows = []
+    base_cases = baseline.get("cases", {})
+    for name, case in results["cases"].items():
+        base = base_cases.get(name)
+        if base is None:
+            rows.append((name, case["relative"], None, False))
+            continue
+        rows.append((name, case["relative"], base["relative"], case["relative"] > base["relative"] * (1 + threshold)))
+    return rows
+
+def main():
+    parser = ArgumentParser(description="NBLyzer dataleak lattice microbenchmarks")
+    parser.add_argument("-c", "--cases", nargs="+", type=str, default=list(CASES), help='Benchmarks to run (default is all).')
+    parser.add_argument("-n", "--number", type=int, default=10, help='Calls per benchmark and round, the best one is kept (default is 10).')
+    parser.add_argument("-r", "--rounds", type=int, default=9, help='Interleaved rounds, the median over the rounds is kept (default is 9).')
+    parser.add_argument("-b", "--baseline", type=str, default=BASELINE_PATH, help='Baseline to compare with (default is the stored one).')
+    parser.add_argument("-u", "--update-baseline", action="store_true", help='Store the measured times as the baseline.')
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD, help=f'Relative slowdown reported as a regression, 1 fails cases twice as slow as the baseline (default is {THRESHOLD}).')
+    args = parser.parse_args()
+
+    results = run_suite(args.cases, args.number, args.rounds)
+
+    regressions = 0
+    print(f"{'benchmark':<36}{'us per call':>14}{'relative':>12}{'baseline':>12}")
+    for name, relative, base_relative, regressed in compare(results, load_baseline(args.baseline), args.threshold):
+        base_relative = "-" if base_relative is None else f"{base_relative:.4g}"
+        print(f"{name:<36}{results['cases'][name]['ns'] / 1000:>14.1f}{relative:>12.4g}{base_relative:>12}" + ("  REGRESSION" if regressed else ""))
+        regressions += regressed
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+    exit_gate(regressions, args.update_baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import json
+import random
+
+HEADER = """import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.model_selection import train_test_split
+from sklearn.linear_model import LogisticRegression
+"""
+
+# Lines of a cell training a model on the data it scaled, which make it leak data.
+MODEL_CALLS = ("train_test_split(", "LogisticRegression(", ".fit(", ".predict(")
+
+def without_model(source: str) -> str:
+    '''
+    The code of a generated cell before the model was added to it, the cell itself if it has no model.
+    '''
+    return "\n".join(line for line in source.split("\n") if not any(call in line for call in MODEL_CALLS))
+
+def generate_notebook(cells: int = 10, variables: int = 3, fan_out: int = 2, chain: int = 5, loops: int = 0, tts_density: float = 0.0, seed: int = 0) -> dict:
+    '''
+    Generates a notebook whose code cells form independent def-use chains.
+
+    Parameters
+    ----------
+    cells: int
+        Number of code cells
+    variables: int
+        Number of variables defined by every cell
+    fan_out: int
+        Number of following cells of the chain reading the variables of a cell, i.e. a cell reads one
+        variable of each of the fan_out cells before it in its chain
+    chain: int
+        Number of cells of a chain, the first cell of every chain loads its data from a file
+    loops: int
+        Nesting depth of the loops the assignments of a cell are wrapped in
+    tts_density: float
+        Fraction of cells that scale the data loaded by the first cell of their chain before splitting it,
+        fitting and predicting on it (train_test_split and model calls), i.e. that leak data
+    seed: int
+        Seed of the choice of read variables and of the cells with model calls
+
+    Returns
+    ----------
+    notebook: dict
+        Notebook in the ipynb format, with the parameters in its metadata
+    '''
+    rng = random.Random(seed)
+    sources = []
+    for cell in range(cells):
+        position = cell % chain
+        lines = [HEADER] if cell == 0 else []
+        if position == 0:
+            lines.append(f'v{cell}_0 = np.genfromtxt("data_{cell}.csv", delimiter=",")')
+            lines += [f"v{cell}_{var} = v{cell}_0 * {var}" for var in range(1, variables)]
+            sources.append("\n".join(lines))
+            continue
+
+        read_cells = range(cell - min(fan_out, position), cell)
+        first = 0
+        if rng.random() < tts_density:
+            # The variables of the other cells are sums, which the data leak analysis does not track as data.
+            source = f"v{cell - position}_0"
+            lines += [
+                f"scaler_{cell} = MinMaxScaler()",
+                f"v{cell}_0 = scaler_{cell}.fit_transform({source})",
+                f"X_train_{cell}, X_test_{cell} = train_test_split(v{cell}_0, test_size=0.2)",
+                f"lr_{cell} = LogisticRegression()",
+                f"lr_{cell}.fit(X_train_{cell})",
+                f"pred_{cell} = lr_{cell}.predict(X_test_{cell})",
+            ]
+            first = 1
+
+        indent = ""
+        for depth in range(loops):
+            lines.append(f"{indent}for k{depth} in range(3):")
+            indent += "    "
+        for var in range(first, variables):
+            reads = [f"v{read_cell}_{rng.randrange(variables)}" for read_cell in read_cells]
+            if loops:
+                reads.append(f"k{loops - 1}")
+            lines.append(f"{indent}v{cell}_{var} = " + " + ".join(reads))
+        if loops and first == variables:
+            lines.append(f"{indent}pass")
+        sources.append("\n".join(lines))
+
+    return {
+        "cells": [{"cell_type": "code", "execution_count": None, "metadata": {}, "outputs": [], "source": source} for source in sources],
+        "metadata": {"nblyzer_generator": {
+            "cells": cells, "variables": variables, "fan_out": fan_out, "chain": chain, "loops": loops, "tts_density": tts_density, "seed": seed
+        }},
+        "nbformat": 4,
+        "nbformat_minor": 5
+    }
+
+def write_notebook(path: str, **parameters) -> None:
+    with open(path, "w") as f:
+        json.dump(generate_notebook(**parameters), f, indent=1)
@@ -0,0 +1,250 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import csv
+import math
+import os
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+if __package__ in (None, ""):
+    # Started as a script, whose folder is on sys.path.
+    from _script import make_importable
+    __package__ = make_importable(__file__)
+
+from ..nblyzer import NBLyzer
+from ..events import RunAllStartsEvent
+from ..IR.intermediate_representations import IntermediateRepresentations
+from ..constants import *
+from . import load_baseline, save_baseline, exit_gate
+from .notebook_generator import generate_notebook, without_model
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "scaling.json")
+
+# Notebook every sweep starts from, sweeps vary one parameter at a time.
+DEFAULT_SHAPE = {"cells": 16, "variables": 3, "fan_out": 2, "chain": 16, "loops": 0, "tts_density": 0.25}
+# Once the notebook ran, the data leak analysis propagates into nearly every cell, its paths grow with
+# cells^K.
+DEFAULT_LEVEL = 2
+
+SWEEPS = {
+    "cells": [4, 8, 16, 32],
+    "variables": [2, 4, 8, 16],
+    "fan_out": [1, 2, 3, 4],
+    "chain": [2, 4, 8, 16],
+    "loops": [0, 1, 2, 3],
+    "tts_density": [0.0, 0.25, 0.5, 1.0],
+    "level": [1, 2, 3],
+}
+QUICK_SWEEPS = {parameter: values[:3] for parameter, values in SWEEPS.items()}
+
+# Parameters whose values start at 0 are shifted by one before fitting on a log scale.
+SHIFTED = {"loops", "tts_density"}
+
+ANALYSES = [DATA_LEAK, STALE, IDLE, ISOLATED]
+
+# Analyses of single cells, which do not explore paths and so do not depend on the level.
+CELL_ANALYSES = {IDLE, ISOLATED}
+
+class Curve:
+    '''
+    Work, peak memory and time of an analysis over the values of one parameter, with the fitted growth.
+    The work is counted, so it is the same on every run and machine: CFG nodes visited by the intra cell
+    fixpoint and phi conditions tested by the inter cell propagation (the Stats of the analysis, none for
+    the idle and isolated cell analyses). The growth of the level sweep is the factor a measure grows by
+    per level (the inter-cell exploration is exponential in K), the growth of the other sweeps the
+    exponent of a power law.
+    '''
+    def __init__(self, analysis: str, parameter: str, values: list, seconds: list[float], peak_bytes: list[int], visits: list[int], phi_tests: list[int]) -> None:
+        self.analysis = analysis
+        self.parameter = parameter
+        self.values = values
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.visits = visits
+        self.phi_tests = phi_tests
+        if parameter == "level":
+            fit = lambda ys: fit_exponential(values, ys)
+        else:
+            xs = [value + 1 for value in values] if parameter in SHIFTED else values
+            fit = lambda ys: fit_power(xs, ys)
+        self.time_growth = fit(seconds)
+        self.memory_growth = fit(peak_bytes)
+        self.visits_growth = fit(visits)
+        self.phi_growth = fit(phi_tests)
+
+    @property
+    def key(self) -> str:
+        return f"{self.analysis}|{self.parameter}"
+
+    def gated(self) -> dict[str, float]:
+        '''
+        Growths compared with the baseline. Times are only reported: the points take milliseconds, so the
+        fitted time growth is mostly noise of the machine.
+        '''
+        growths = {"memory_growth": self.memory_growth}
+        if any(self.visits):
+            growths["visits_growth"] = self.visits_growth
+        if any(self.phi_tests):
+            growths["phi_growth"] = self.phi_growth
+        return growths
+
+    def to_dict(self) -> dict:
+        return {
+            "values": self.values, "seconds": self.seconds, "peak_bytes": self.peak_bytes, "visits": self.visits,
+            "phi_tests": self.phi_tests, "time_growth": self.time_growth, "visits_growth": self.visits_growth,
+            "phi_growth": self.phi_growth, "memory_growth": self.memory_growth
+        }
+
+def _slope(xs: list[float], ys: list[float]) -> float:
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+def fit_power(xs: list[float], ys: list[float]) -> float:
+    '''
+    Exponent b of the least squares fit of y = a * x^b on a log-log scale.
+    '''
+    return _slope([math.log(x) for x in xs], [math.log(max(y, 1e-9)) for y in ys])
+
+def fit_exponential(xs: list[float], ys: list[float]) -> float:
+    '''
+    Factor b of the least squares fit of y = a * b^x on a log scale.
+    '''
+    return math.exp(_slope(xs, [math.log(max(y, 1e-9)) for y in ys]))
+
+def prepare(analysis: str, notebook: dict, level: int) -> NBLyzer:
+    '''
+    Loads the notebook with the analysis active. The data leak analysis only starts from cells whose reads
+    are in its state, from an empty state it would analyze the first cell only. Its state is the one after
+    running every cell in notebook order, the cells training a model as they were before the model was
+    added: a leak already in the state is reported at the first node of every path. The other analyses
+    start from every cell.
+    '''
+    nblyzer = NBLyzer(level=level, cache_results=False)
+    nblyzer.load_notebook([dict(cell) for cell in notebook["cells"]])
+    nblyzer.add_analyses([analysis])
+    if analysis == DATA_LEAK:
+        for cell_id in nblyzer.notebook_IR.code_cells():
+            code = without_model(nblyzer.notebook_IR[cell_id].cell_code)
+            nblyzer.all_analyses[analysis].update_abstract_state(IntermediateRepresentations(code, cell_id), nblyzer.notebook_IR)
+            nblyzer.notebook_IR[cell_id].last_ran_code = code
+    return nblyzer
+
+def measure(analysis: str, shape: dict, level: int, repeat: int = 3) -> tuple[float, int, int, int]:
+    '''
+    Runs the analysis from every cell of the generated notebook. Returns the best time in seconds of
+    `repeat` runs, the peak memory in bytes traced by tracemalloc during one more run, and the CFG node
+    visits and phi condition tests of that run. Every run starts from a freshly prepared notebook, only
+    the analysis event is measured.
+    '''
+    notebook = generate_notebook(**shape)
+
+    seconds = []
+    for _ in range(repeat):
+        nblyzer = prepare(analysis, notebook, level)
+        start = time.perf_counter()
+        nblyzer.execute_event(RunAllStartsEvent())
+        seconds.append(time.perf_counter() - start)
+
+    nblyzer = prepare(analysis, notebook, level)
+    logged = len(nblyzer.all_analyses[analysis].stats)
+    tracemalloc.start()
+    try:
+        nblyzer.execute_event(RunAllStartsEvent())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stats = nblyzer.all_analyses[analysis].stats[logged:]
+    visits = sum(sum(stat.node_visits) for stat in stats)
+    phi_tests = sum(stat.phi_true + stat.phi_false for stat in stats)
+    return min(seconds), peak, visits, phi_tests
+
+def run_suite(analyses: list[str] = ANALYSES, sweeps: dict[str, list] = SWEEPS, shape: dict = DEFAULT_SHAPE, level: int = DEFAULT_LEVEL, repeat: int = 3) -> list[Curve]:
+    curves = []
+    for analysis in analyses:
+        for parameter, values in sweeps.items():
+            if parameter == "level" and analysis in CELL_ANALYSES:
+                continue
+            points = []
+            for value in values:
+                if parameter == "level":
+                    points.append(measure(analysis, shape, value, repeat))
+                else:
+                    points.append(measure(analysis, dict(shape, **{parameter: value}), level, repeat))
+            curves.append(Curve(analysis, parameter, values, *(list(measures) for measures in zip(*points))))
+    return curves
+
+def compare(curves: list[Curve], baseline: dict, tolerance: float = 0.5) -> list[tuple]:
+    '''
+    Compares the gated growths of the curves (work and memory, see Curve.gated) with the baseline. A curve
+    regresses when one of them exceeds the one of the baseline by more than tolerance * max(1, baseline
+    growth). Returns (key, gated growths, baseline growths, regressed) for every curve, with None as
+    baseline for curves missing from the baseline.
+    '''
+    rows = []
+    for curve in curves:
+        growths = curve.gated()
+        base = baseline.get(curve.key)
+        if base is None:
+            rows.append((curve.key, growths, None, False))
+            continue
+        base_growths = {name: base.get(name) for name in growths}
+        regressed = any(
+            base_growths[name] is not None and growth > base_growths[name] + tolerance * max(1, abs(base_growths[name]))
+            for name, growth in growths.items()
+        )
+        rows.append((curve.key, growths, base_growths, regressed))
+    return rows
+
+def curves_baseline(curves: list[Curve]) -> dict:
+    return {curve.key: curve.to_dict() for curve in curves}
+
+def write_curves(curves: list[Curve], path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["analysis", "parameter", "value", "seconds", "peak bytes", "node visits", "phi tests"])
+        for curve in curves:
+            for value, seconds, peak, visits, phi_tests in zip(curve.values, curve.seconds, curve.peak_bytes, curve.visits, curve.phi_tests):
+                writer.writerow([curve.analysis, curve.parameter, value, f"{seconds:.6f}", peak, visits, phi_tests])
+
+def main():
+    parser = ArgumentParser(description="NBLyzer scaling benchmark")
+    parser.add_argument("-a", "--analyses", nargs="+", type=str, default=ANALYSES, help='Analyses to measure (default is all).')
+    parser.add_argument("-p", "--parameters", nargs="+", type=str, default=list(SWEEPS), help='Parameters to sweep (default is all).')
+    parser.add_argument("-r", "--repeat", type=int, default=3, help='Timed runs per point, the best time is kept (default is 3).')
+    parser.add_argument("-q", "--quick", action="store_true", help='Sweep the first three values of every parameter only.')
+    parser.add_argument("-b", "--baseline", type=str, default=BASELINE_PATH, help='Baseline to compare with (default is the stored one).')
+    parser.add_argument("-u", "--update-baseline", action="store_true", help='Store the measured curves as the baseline.')
+    parser.add_argument("-t", "--tolerance", type=float, default=0.5, help='Growth increase, relative to max(1, baseline growth), reported as a regression (default is 0.5).')
+    parser.add_argument("-o", "--output", type=str, default=None, help='CSV file the measured points are written to.')
+    args = parser.parse_args()
+
+    sweeps = QUICK_SWEEPS if args.quick else SWEEPS
+    curves = run_suite(args.analyses, {parameter: sweeps[parameter] for parameter in args.parameters}, repeat=args.repeat)
+    if args.output:
+        write_curves(curves, args.output)
+
+    regressions = 0
+    names = ["visits_growth", "phi_growth", "memory_growth"]
+    print(f"{'curve':<40}{'time growth':>12}" + "".join(f"{name:>16}{'baseline':>10}" for name in names))
+    times = {curve.key: curve.time_growth for curve in curves}
+    for key, growths, base_growths, regressed in compare(curves, load_baseline(args.baseline), args.tolerance):
+        row = f"{key:<40}{times[key]:>12.2f}"
+        for name in names:
+            growth = "-" if name not in growths else f"{growths[name]:.2f}"
+            base = "-" if base_growths is None or base_growths.get(name) is None else f"{base_growths[name]:.2f}"
+            row += growth.rjust(16) + base.rjust(10)
+        print(row + ("  REGRESSION" if regressed else ""))
+        regressions += regressed
+
+    if args.update_baseline:
+        save_baseline(curves_baseline(curves), args.baseline)
+    exit_gate(regressions, args.update_baseline)
+
+if __name__ == "__main__":
+    main()
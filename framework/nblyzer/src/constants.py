@@ -6,4 +6,5 @@ STALE = "Stale Cells Analysis"
 FRESH = "Fresh Cells Analysis"
 IDLE = "Idle Cells Analysis"
 ISOLATED = "Isolated Cells Analysis"
-SAFE_PATH = "Safe Path Analysis"
\ No newline at end of file
+SAFE_PATH = "Safe Path Analysis"
+NBLYZER_VERSION = "0.0.1"
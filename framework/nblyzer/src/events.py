@@ -1,27 +1,43 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from collections import defaultdict
-from copy import deepcopy
 from .IR.intermediate_representations import IntermediateRepresentations
 from .nblyzer import NBLyzer
 from .constants import *
 
-def reindex_results(nblyzer: NBLyzer, updated_index: int, added = True):
-    for result in nblyzer.results.values():
-        for path_result in result.path_results:
-            for error in path_result.error_infos:
-                if added and error.cell_id >= updated_index:
-                    error.cell_id += 1
-                    path_result.path = [error.cell_id]
-                if not added and error.cell_id > updated_index:
-                    error.cell_id -= 1
-                    path_result.path = [error.cell_id]
+def start_cell_id(nblyzer, position: int) -> int:
+    '''
+    Id of the cell at the position analyses start from. Positions past the notebook have no cell whose
+    error could be reported, so they are rejected.
+    '''
+    cell_id = nblyzer.notebook_IR.cell_id_at(position)
+    if cell_id is None:
+        raise ValueError(f"Cannot start from cell with no code, there is no cell at position {position}")
+    return cell_id
 
 class Event:
     def execute(self):
         pass
 
+    def coalesce(self, newer):
+        '''
+        Returns a single event with the effect of this event followed by the newer one,
+        or None if the two have to be executed separately.
+        '''
+        return None
+
+    def supersedes(self, running) -> bool:
+        '''
+        True if this event makes the result of the running event stale, so the running analysis is cancelled.
+        '''
+        return False
+
+    def depends_on(self, cell_index: int) -> bool:
+        '''
+        True if the result of this event changes when the cell at the index is changed or removed.
+        '''
+        return False
+
 class AddActiveAnalysesEvent(Event):
     def __init__(self, active_analyses):
         self.active_analyses = active_analyses
@@ -31,29 +47,63 @@ class AddActiveAnalysesEvent(Event):
         return nblyzer.run_analyses(-1, [IDLE, ISOLATED]).join_by_cell_id()
 
 class OpenNotebookEvent(Event):
-    def __init__(self, notebook_json):
+    def __init__(self, notebook_json, workers: int = 1):
         self.notebook_json = notebook_json
+        self.workers = int(workers)
 
     def execute(self, nblyzer):
-        nblyzer.load_notebook(self.notebook_json)
+        nblyzer.load_notebook(self.notebook_json, self.workers)
+
+    def supersedes(self, running) -> bool:
+        return True
 
 class RunCellEvent(Event):
     def __init__(self, cell_index):
         self.cell_index = cell_index
 
     def execute(self, nblyzer):
-        results = nblyzer.run_analyses(self.cell_index, [STALE, DATA_LEAK])
-        nblyzer.update_abstract_states(self.cell_index)
-        nblyzer.notebook_IR[self.cell_index].last_ran_code = nblyzer.notebook_IR[self.cell_index].cell_code
+        cell_id = start_cell_id(nblyzer, self.cell_index)
+        try:
+            results = nblyzer.run_analyses(cell_id, [STALE, DATA_LEAK])
+        finally:
+            # The cell ran in the kernel even if its analysis was cancelled.
+            nblyzer.update_abstract_states(cell_id)
+            nblyzer.notebook_IR[cell_id].last_ran_code = nblyzer.notebook_IR[cell_id].cell_code
         return results.join_by_cell_id()
 
+    def supersedes(self, running) -> bool:
+        return isinstance(running, (RunCellEvent, RunBatchEvent, RunAllStartsEvent))
+
+    def depends_on(self, cell_index: int) -> bool:
+        return cell_index == self.cell_index
+
 class RunBatchEvent(Event):
     def __init__(self, start_cell):
         self.start_cell = start_cell
 
     def execute(self, nblyzer):
-        return nblyzer.run_analyses(self.start_cell, detailed = True)
-    
+        return nblyzer.run_analyses(start_cell_id(nblyzer, self.start_cell), detailed = True)
+
+    def supersedes(self, running) -> bool:
+        return isinstance(running, (RunCellEvent, RunBatchEvent, RunAllStartsEvent))
+
+    def depends_on(self, cell_index: int) -> bool:
+        # Paths from the start cell can go through any cell of the notebook.
+        return True
+
+class RunAllStartsEvent(Event):
+    def __init__(self, workers: int = 1):
+        self.workers = int(workers)
+
+    def execute(self, nblyzer):
+        return nblyzer.run_all_starts(self.workers)
+
+    def supersedes(self, running) -> bool:
+        return isinstance(running, (RunCellEvent, RunBatchEvent, RunAllStartsEvent))
+
+    def depends_on(self, cell_index: int) -> bool:
+        return True
+
 class AddCellEvent(Event):
     def __init__(self, position: int, kind: int, content: str) -> None:
         self.position: int = int(position)
@@ -61,43 +111,23 @@ class AddCellEvent(Event):
         self.content = str(content)
 
     def execute(self, nblyzer: NBLyzer):
-        new_notebook_IR: dict[int, IntermediateRepresentations] = defaultdict()
-        all_keys = list(nblyzer.notebook_IR.keys())
-        max_key = max(all_keys)
-        for i in range(len(all_keys)):
-            if all_keys[i] >= self.position:
-                new_notebook_IR[all_keys[i] + 1] = nblyzer.notebook_IR[all_keys[i]]
-                new_notebook_IR[all_keys[i] + 1].cell_id = all_keys[i] + 1
-            if all_keys[i] < self.position:
-                new_notebook_IR[all_keys[i]] = nblyzer.notebook_IR[all_keys[i]]
-        
-        if self.position <= max_key:
-            new_notebook_IR[max_key + 1] = nblyzer.notebook_IR[max_key]
-            new_notebook_IR[max_key + 1].cell_id = max_key + 1
-        
+        cell_id = nblyzer.notebook_IR.add_cell(self.position)
         if self.kind == 2:
-            new_notebook_IR[self.position] = IntermediateRepresentations(self.content, self.position)
-        nblyzer.notebook_IR = new_notebook_IR
-        reindex_results(nblyzer, self.position)
+            nblyzer.notebook_IR[cell_id] = IntermediateRepresentations(self.content, cell_id)
         return nblyzer.run_analyses(-1, [IDLE, ISOLATED]).join_by_cell_id()
 
 class RemoveCellEvent(Event):
     def __init__(self, position: int) -> None:
-        self.position: int = position
+        self.position: int = int(position)
 
     def execute(self, nblyzer: NBLyzer):
-        new_notebook_IR: dict[int, IntermediateRepresentations] = defaultdict()
-        for index in nblyzer.notebook_IR.keys():
-            if index > self.position:
-                new_notebook_IR[index - 1] = nblyzer.notebook_IR[index]
-                new_notebook_IR[index - 1].cell_id = index - 1
-            if index < self.position:
-                new_notebook_IR[index] = nblyzer.notebook_IR[index]
-        
-        nblyzer.notebook_IR = deepcopy(new_notebook_IR)
-        reindex_results(nblyzer, self.position, False)
+        if nblyzer.notebook_IR.cell_id_at(self.position) is not None:
+            nblyzer.result_cache.invalidate(nblyzer.notebook_IR.remove_cell(self.position))
         return nblyzer.run_analyses(-1, [IDLE, ISOLATED]).join_by_cell_id()
 
+    def supersedes(self, running) -> bool:
+        return running.depends_on(self.position)
+
 class ChangeCellCodeEvent(Event):
     def __init__(self, new_code: str, cell_index: int, with_result: bool) -> None:
         self.new_code: str = new_code
@@ -105,12 +135,25 @@ class ChangeCellCodeEvent(Event):
         self.with_result: bool = with_result
 
     def execute(self, nblyzer: NBLyzer):
-        if self.cell_index in nblyzer.notebook_IR.keys():
-            last_ran_code = nblyzer.notebook_IR[self.cell_index].last_ran_code
-            nblyzer.notebook_IR[self.cell_index] = IntermediateRepresentations(self.new_code, self.cell_index, last_ran_code)
+        cell_id = nblyzer.notebook_IR.cell_id_at(self.cell_index)
+        if cell_id in nblyzer.notebook_IR:
+            last_ran_code = nblyzer.notebook_IR[cell_id].last_ran_code
+            nblyzer.notebook_IR[cell_id] = IntermediateRepresentations(self.new_code, cell_id, last_ran_code)
+            nblyzer.result_cache.invalidate(cell_id)
         if self.with_result:
             return nblyzer.run_analyses(-1, [IDLE, ISOLATED]).join_by_cell_id()
+
+    def coalesce(self, newer):
+        if isinstance(newer, ChangeCellCodeEvent) and newer.cell_index == self.cell_index:
+            return ChangeCellCodeEvent(newer.new_code, newer.cell_index, self.with_result or newer.with_result)
+        return None
+
+    def supersedes(self, running) -> bool:
+        return running.depends_on(self.cell_index)
         
 class CloseNotebookEvent(Event):
     def execute(self, nblyzer):
-        nblyzer.reset()
\ No newline at end of file
+        nblyzer.reset()
+
+    def supersedes(self, running) -> bool:
+        return True
\ No newline at end of file
@@ -2,17 +2,47 @@
 # Licensed under the MIT license.
 
 from collections import defaultdict
+from copy import deepcopy
+import multiprocessing
+import time
 from .analyses.dataleak_analysis import DataLeakAnalysis
 from .analyses.stale_cell_analysis import StaleCellAnalysis
 from .analyses.idle_cell_analysis import IdleCellAnalysis
 from .analyses.isolated_cell_analysis import IsolatedCellAnalysis
-from nblyzer.src.constants import *
+from .constants import *
 
 from .IR.intermediate_representations import IntermediateRepresentations
+from .IR.notebook_IR import NotebookIR
+from .IR.ir_cache import ir_cache, process_pool
 from .analyses.runner.analysis_results import Result, PathResult, ErrorType, ErrorInfo
+from .analyses.runner.cancellation import CancellationToken
+from .analyses.runner.result_cache import ResultCache
+from .timing import Timings, current_timings, set_timings, timed, NECESSARY, SUMMARIZE, SERIALIZE
+
+# NBLyzer of the process, inherited from the parent when a worker process is forked by run_all_starts.
+_worker_nblyzer = None
+
+# Seconds between two checks of the cancellation token while waiting for worker processes.
+CANCELLATION_POLL = 0.05
+
+def _init_worker(nblyzer) -> None:
+    global _worker_nblyzer
+    _worker_nblyzer = nblyzer
+
+def _run_starts_in_worker(starts: list[int], states: dict) -> list[tuple[dict, dict, Timings]]:
+    runs = []
+    for start in starts:
+        timings = Timings()
+        previous = set_timings(timings)
+        try:
+            runs.append(_worker_nblyzer.run_start(start, states) + (timings,))
+        finally:
+            set_timings(previous)
+    return runs
 
 class NBLyzer():
-    def __init__(self, level=5, filename=""):
+    def __init__(self, level=5, filename="", worklist=False, cache_results=True):
+        self.cache_results = cache_results
         self.reset()
         self.all_analyses = {
             DATA_LEAK: DataLeakAnalysis(),
@@ -20,18 +50,22 @@ class NBLyzer():
             IDLE: IdleCellAnalysis(),
             ISOLATED: IsolatedCellAnalysis()
         }
+        for analysis in self.all_analyses.values():
+            analysis.worklist = worklist
         self.level = level
         self.results: dict[str, Result] = defaultdict(Result)
         self.filename = filename
+        self.cancellation: CancellationToken = None
+        self.timings: Timings = None
 
     def load_script(self, notebook_str):
         if not self.notebook_IR:
-            self.notebook_IR = {}
-            self.notebook_IR[0] = IntermediateRepresentations(notebook_str, 0)
+            self.notebook_IR = NotebookIR()
+            self.notebook_IR[self.notebook_IR.add_cell()] = IntermediateRepresentations(notebook_str, 0)
         else:
             Exception("A script has already been loaded.")
 
-    def load_notebook(self, notebook_json):
+    def load_notebook(self, notebook_json, workers: int = 1):
         '''
         Creates an Abstract Syntax Tree (AST) objects from a notebook in JSON format.
 
@@ -39,25 +73,34 @@ class NBLyzer():
         ----------
         old_notebook_json: str
             A string in the format '[{cell_type: code, language: python, source: some code}, {...}, ...]
+        workers: int
+            Number of processes building the IR of code cells in parallel (serial build if 1)
 
         Returns
         ----------
-        notebook_IR: dict[int] = AST
-            Dictionary where key is cell_id and value is AST of the code in the cell
+        notebook_IR: NotebookIR
+            Dictionary where key is a stable cell_id and value is the IR of the code in the cell
         notebook_code: dict[int] = str
             Dictionary where key is cell_id and value is the code in the cell
         '''    
         self.results: dict[str, Result] = defaultdict(Result)
+        self.result_cache.clear()
         if not self.notebook_IR:
-            self.notebook_IR = {}
+            self.notebook_IR = NotebookIR()
             if notebook_json:
-                for cnt, cell in enumerate(notebook_json):
+                code_cells: dict[int, str] = {}
+                for cell in notebook_json:
+                    cnt = self.notebook_IR.add_cell()
                     if (cell["cell_type"] != "code"):
                         continue
                     if isinstance(cell["source"], list):
                         cell["source"]  = "".join(cell["source"])
+                    code_cells[cnt] = cell["source"]
 
-                    self.notebook_IR[cnt] = IntermediateRepresentations(cell["source"], cnt)
+                if workers > 1:
+                    ir_cache.prefetch([IntermediateRepresentations.remove_magic(code) for code in code_cells.values()], workers)
+                for cnt, code in code_cells.items():
+                    self.notebook_IR[cnt] = IntermediateRepresentations(code, cnt)
             else:
                 Exception("A notebook has already been loaded.")
 
@@ -77,8 +120,21 @@ class NBLyzer():
         for analysis in self.all_analyses.values():
             analysis.update_abstract_state(self.notebook_IR[cell_index], self.notebook_IR)
 
-    def execute_event(self, event):
-        return event.execute(self)
+    def execute_event(self, event, cancellation: CancellationToken = None):
+        '''
+        Executes an event. If the cancellation token is cancelled meanwhile, running
+        analyses stop with AnalysisCancelled and keep their previous results.
+        The time spent in every phase of the event is kept in self.timings until the next event,
+        serializing its result included.
+        '''
+        self.cancellation = cancellation
+        self.timings = Timings()
+        previous = set_timings(self.timings)
+        try:
+            return event.execute(self)
+        finally:
+            set_timings(previous)
+            self.cancellation = None
 
     def join_analyses_results(self):
         new_results: Result = Result()
@@ -100,14 +156,157 @@ class NBLyzer():
             analyses = self.active_analyses
         for analysis_str in analyses:
             if analysis_str in self.active_analyses:
-                self.all_analyses[analysis_str].find_necessary_cells(self.notebook_IR)
-                self.results[analysis_str] = self.all_analyses[analysis_str].analyze_notebook(self.notebook_IR, changed_cell_IR, self.level, self.filename)
-                if not detailed:
-                    self.results[analysis_str] = self.all_analyses[analysis_str].summarize_result(self.results[analysis_str])
+                analysis = self.all_analyses[analysis_str]
+                analysis.cancellation = self.cancellation
+                try:
+                    with timed(NECESSARY):
+                        analysis.find_necessary_cells(self.notebook_IR)
+                    result = self.analyze_notebook(analysis_str, analysis, changed_cell_IR)
+                finally:
+                    analysis.cancellation = None
+                if detailed:
+                    self.results[analysis_str] = result
+                else:
+                    with timed(SUMMARIZE):
+                        self.results[analysis_str] = analysis.summarize_result(result)
         return self.join_analyses_results()
 
+    def run_start(self, start: int, states: dict) -> tuple[dict[str, Result], dict[str, list]]:
+        '''
+        Runs the active analyses in detail from the start cell after putting them back in the given states
+        (cache_state() of every analysis). Returns the result and the stats of every active analysis, the
+        stats are taken out of the analyses.
+        '''
+        for analysis_str, analysis in self.all_analyses.items():
+            analysis.restore_state(states[analysis_str])
+        logged = {analysis_str: len(analysis.stats) for analysis_str, analysis in self.all_analyses.items()}
+        self.run_analyses(start, detailed=True)
+        results: dict[str, Result] = {}
+        stats: dict[str, list] = {}
+        for analysis_str in self.active_analyses:
+            analysis = self.all_analyses[analysis_str]
+            results[analysis_str] = self.results[analysis_str]
+            stats[analysis_str] = analysis.stats[logged[analysis_str]:]
+            del analysis.stats[logged[analysis_str]:]
+        return results, stats
+
+    def run_all_starts(self, workers: int = 1) -> Result:
+        '''
+        Runs the active analyses in detail from every code cell, as RunBatchEvent does from one cell.
+
+        Every start is analyzed from the state the analyses are in before the call, and the analyses are
+        left in that state, so the starts are independent of each other. With more than one worker the
+        starts are spread in chunks over a pool of processes forked from this one, which share the loaded IR
+        copy-on-write (serial where fork is not available, see process_pool for when forking is safe).
+        Cancellation is checked while waiting for the workers, and a cancelled run does not wait for the
+        remaining chunks. Results and stats are merged in notebook order of the start cells whatever the
+        number of workers: the returned result holds the results of the first start followed by those of the
+        second and so on, and the stats of every start are appended to the stats of the analyses.
+
+        Parameters
+        ----------
+        workers: int
+            Number of worker processes (serial if 1)
+        '''
+        starts = list(self.notebook_IR.code_cells())
+        states = {analysis_str: analysis.cache_state() for analysis_str, analysis in self.all_analyses.items()}
+        workers = min(workers, len(starts))
+        try:
+            if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+                runs = self._run_starts_in_pool(starts, states, workers)
+            else:
+                runs = [self.run_start(start, states) for start in starts]
+        finally:
+            for analysis_str, analysis in self.all_analyses.items():
+                analysis.restore_state(states[analysis_str])
+
+        merged: Result = Result()
+        for analysis_str in self.active_analyses:
+            self.results[analysis_str] = Result()
+        for results, stats in runs:
+            for analysis_str, result in results.items():
+                merged.join_results(result)
+                self.results[analysis_str].join_results(result)
+                self.all_analyses[analysis_str].stats += stats[analysis_str]
+        return merged
+
+    def _run_starts_in_pool(self, starts: list[int], states: dict, workers: int) -> list[tuple[dict, dict]]:
+        chunksize = max(1, len(starts) // (4 * workers))
+        pool = process_pool(workers, initializer=_init_worker, initargs=(self,))
+        finished = False
+        try:
+            futures = [pool.submit(_run_starts_in_worker, starts[i:i + chunksize], states) for i in range(0, len(starts), chunksize)]
+            runs = []
+            for future in futures:
+                while True:
+                    if self.cancellation:
+                        self.cancellation.check()
+                    try:
+                        chunk = future.result(timeout=CANCELLATION_POLL)
+                        break
+                    except TimeoutError:
+                        pass
+                for results, stats, timings in chunk:
+                    if current_timings() is not None:
+                        current_timings().merge(timings)
+                    runs.append((results, stats))
+            finished = True
+            return runs
+        finally:
+            # On cancellation chunks that did not start are dropped and running ones are not waited for.
+            pool.shutdown(wait=finished, cancel_futures=True)
+
+    def analyze_notebook(self, analysis_str: str, analysis, changed_cell_IR: IntermediateRepresentations) -> Result:
+        '''
+        Runs the analysis from the changed cell, or takes its result from the result cache if none of
+        what the previous run from that cell depended on changed.
+        '''
+        state = analysis.cache_state() if self.cache_results and changed_cell_IR is not None else None
+        if state is None:
+            return analysis.analyze_notebook(self.notebook_IR, changed_cell_IR, self.level, self.filename)
+
+        key = (analysis_str, changed_cell_IR.cell_id, self.level)
+        layout = self.result_cache.layout(self.notebook_IR, analysis.necessary, changed_cell_IR)
+        entry = self.result_cache.get(key, layout, state, self.notebook_IR)
+        if entry is not None:
+            analysis.restore_state(entry.state_after)
+            return deepcopy(entry.result)
+
+        analysis.visited_cells = set()
+        result = analysis.analyze_notebook(self.notebook_IR, changed_cell_IR, self.level, self.filename)
+        self.result_cache.put(key, layout, analysis.visited_cells | {changed_cell_IR.cell_id}, self.notebook_IR, state, analysis.cache_state(), result)
+        return result
+
+    def positions(self) -> dict[int, int]:
+        return None if self.notebook_IR is None else self.notebook_IR.positions()
+
+    def serialize(self, result: Result, with_path: bool = False, ndjson: bool = False) -> str:
+        '''
+        Dumps a result with cell ids translated to current cell positions.
+        '''
+        start = time.perf_counter_ns()
+        dumped = result.dumps(with_path, self.positions(), ndjson)
+        self.log_serialize(start)
+        return dumped
+
+    def dump(self, result: Result, fp, with_path: bool = False, ndjson: bool = False) -> None:
+        '''
+        Writes a result with cell ids translated to current cell positions to a text file-like object.
+        '''
+        start = time.perf_counter_ns()
+        result.dump(fp, with_path, self.positions(), ndjson)
+        self.log_serialize(start)
+
+    def log_serialize(self, start: int) -> None:
+        '''
+        Results are serialized after their event, so the time is added to the timings of the last event.
+        '''
+        if self.timings is not None:
+            self.timings.add(SERIALIZE, time.perf_counter_ns() - start)
+
     def reset(self):
         self.notebook_IR = None
+        self.result_cache: ResultCache = ResultCache()
         self.active_analyses: list[str] = []
 
     def __str__(self) -> str:
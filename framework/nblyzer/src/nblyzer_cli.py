@@ -7,9 +7,12 @@ from .nblyzer import NBLyzer
 from .events import RunBatchEvent
 from .resource_utils.rsrc_mngr import ResourceManager
 from .resource_utils.utils import is_script
+from .IR.ir_cache import ir_cache
 
-def nblyzer(filename, notebook,  analyses,  start, level=5):
-    code_nblyzer = NBLyzer(level = level)
+def nblyzer(filename, notebook,  analyses,  start, level=5, cache_dir=None, workers=1, worklist=False, ndjson=False):
+    if cache_dir:
+        ir_cache.set_directory(cache_dir)
+    code_nblyzer = NBLyzer(level = level, worklist = worklist)
     assert(not (filename and notebook))
     mng = ResourceManager()
     if (notebook is None):
@@ -19,13 +22,13 @@ def nblyzer(filename, notebook,  analyses,  start, level=5):
             code_nblyzer.load_script(notebook)
         else:
             notebook = mng.grab_local_json(filename)
-            code_nblyzer.load_notebook(notebook["cells"])
+            code_nblyzer.load_notebook(notebook["cells"], workers)
     else:
-        code_nblyzer.load_notebook(notebook["cells"])
+        code_nblyzer.load_notebook(notebook["cells"], workers)
     
     code_nblyzer.add_analyses(analyses)
     event = RunBatchEvent(start)
-    results = code_nblyzer.execute_event(event).dumps(True)
+    results = code_nblyzer.serialize(code_nblyzer.execute_event(event), True, ndjson)
 
     return results
 
@@ -38,10 +41,17 @@ def main():
     parser.add_argument("-a", "--analyses", nargs="+", type=str, default=[], help='Analyses to perform.')
     parser.add_argument("-s", "--start", type=int, default=0, help='Starting cell ID (default is 0).')
     parser.add_argument("-l", "--level", nargs="?", type=int, default=5, help='Depth level of the analysis (default is inf).')
+    parser.add_argument("-c", "--cache-dir", type=str, default=None, help='Directory of the persistent IR cache (disabled by default).')
+    parser.add_argument("-w", "--workers", type=int, default=1, help='Number of processes building the notebook IR (default is 1).')
+    parser.add_argument("--worklist", action="store_true", help='Use the non-recursive worklist engine for inter-cell analysis.')
+    parser.add_argument("--ndjson", action="store_true", help='Print one JSON object per line for every path result.')
     args = parser.parse_args()
 
-    results = nblyzer(args.filename, args.notebook, args.analyses, args.start, args.level)
-    print(results)
+    try:
+        results = nblyzer(args.filename, args.notebook, args.analyses, args.start, args.level, args.cache_dir, args.workers, args.worklist, args.ndjson)
+    except ValueError as e:
+        parser.error(str(e))
+    print(results, end="" if args.ndjson else "\n")
 
 if __name__ == "__main__":
     main()
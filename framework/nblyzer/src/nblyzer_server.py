@@ -1,105 +1,272 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import socket
+import asyncio
 import json
-from events import *
-from nblyzer import NBlyzer
+import os
+import struct
+import sys
+from collections import deque
+
+if __package__ in (None, ""):
+    # Started as a script by the editor extension, make the package importable.
+    _src_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(_src_dir)))
+    __package__ = os.path.basename(os.path.dirname(_src_dir)) + ".src"
+
+from .events import *
+from .nblyzer import NBLyzer
+from .analyses.runner.cancellation import CancellationToken, AnalysisCancelled
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 hostname = 'localhost'
 port_no = 9999
 
+# Every message is a 4 byte big-endian payload length followed by the payload.
+HEADER = struct.Struct(">I")
+
+# Encodings of server messages a client can ask for with the "format" field of any message. Messages
+# to the client are JSON until it asks for msgpack, which is only offered if msgpack is installed.
+JSON = "json"
+MSGPACK = "msgpack"
+
+async def read_message(reader: asyncio.StreamReader) -> bytes:
+    try:
+        header = await reader.readexactly(HEADER.size)
+        return await reader.readexactly(HEADER.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+def frame_message(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
+def server_message(status: str, message_id = None, result_json: str = '', error: str = None) -> str:
+    message = '{'
+    if message_id is not None:
+        message += '"id":' + json.dumps(message_id) + ','
+    message += '"status":"' + status + '"'
+    if result_json:
+        message += ',"result":' + result_json
+    if error:
+        message += ',"message":' + json.dumps(error)
+    return message + '}'
+
+def packed_server_message(status: str, message_id = None, result_records: list = None, error: str = None) -> bytes:
+    message = {}
+    if message_id is not None:
+        message["id"] = message_id
+    message["status"] = status
+    if result_records:
+        message["result"] = result_records
+    if error:
+        message["message"] = error
+    return msgpack.packb(message)
+
 def parse_client_message(msg):
     msg_json = json.loads(msg)
     try:
         event = msg_json["event"]
     except:
-        return Exception("Invalid message format")
+        raise ValueError("Invalid message format")
 
-    try:
-        params = msg_json["params"]
-    except:
-        params = None
-    try:
-        notebook_name = msg_json["notebook_name"]
-    except:
-        notebook_name = None
-
-    return event, params, notebook_name
-
-def serve():
-    nblyzer_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM, proto=0, fileno=None)
-    nblyzer_socket.bind((hostname, port_no))
-    nblyzer_socket.listen(5)
-    nblyzer = defaultdict(NBlyzer)
-    shutdown_condition = False
-
-    while True:
-        client, client_addr = nblyzer_socket.accept()
-        client_message = client.recv(1048576).decode()
-        event_str, params, notebook_name = parse_client_message(client_message)
-        event = get_event(event_str, params)
-        if event:
-            result = nblyzer[notebook_name].execute_event(event)
-        else:
-            client.send("Server is stopping...\n".encode())
-            nblyzer_socket.close()
-            break
-        if result and result.dumps():
-            server_message = '{"status":"success","result":' + result.dumps() + '}'
-        else:
-            server_message = '{"status":"success"}'
+    params = msg_json.get("params")
+    notebook_name = msg_json.get("notebook_name")
+    message_id = msg_json.get("id")
+    result_format = msg_json.get("format")
+    return event, params, notebook_name, message_id, result_format
 
-        if event_str == "open_notebook":
-            shutdown_condition = True
+def check_format(result_format):
+    if result_format not in (None, JSON, MSGPACK) or (result_format == MSGPACK and msgpack is None):
+        raise ValueError(f"Unsupported format {result_format}")
 
-        if event_str == "close_notebook":
-            nblyzer.pop(notebook_name)
-            if shutdown_condition and not len(nblyzer.keys()):
-                client.send('{"status":"terminated"}'.encode())
-                nblyzer_socket.close()
-                break
-                
-        client.send(server_message.encode())
+class NotebookSession:
+    '''
+    NBLyzer instance of one notebook together with its ordered event queue.
 
-def get_event(event_str, params):
-    if event_str == "run_cell":
+    Events of a notebook run one at a time in a worker thread, so that connections
+    and other notebooks are served while an analysis is running. A newer event that
+    supersedes the event in flight (Event.supersedes), e.g. a newer run of the analyses
+    or a change of the cell the run started from, cancels its analysis, whose result
+    would be stale by the time it is shown. Other events wait, so that the results of
+    a run are not lost while the user keeps editing. Consecutive changes of the same
+    cell are coalesced while they wait in the queue.
+    '''
+    def __init__(self, server, notebook_name) -> None:
+        self.server = server
+        self.notebook_name = notebook_name
+        self.nblyzer: NBLyzer = NBLyzer()
+        self.queue: deque = deque()
+        self.has_events: asyncio.Event = asyncio.Event()
+        self.cancellation: CancellationToken = None
+        self.running: Event = None
+        self.worker: asyncio.Task = asyncio.create_task(self.run())
+
+    async def submit(self, event_str, event, message_id, writer) -> None:
+        if self.cancellation and event.supersedes(self.running):
+            self.cancellation.cancel()
+        if self.queue:
+            last_str, last_event, last_id, last_writer = self.queue[-1]
+            coalesced = last_event.coalesce(event)
+            if coalesced:
+                self.queue[-1] = (event_str, coalesced, message_id, writer)
+                await self.server.send(last_writer, "coalesced", last_id)
+                return
+        self.queue.append((event_str, event, message_id, writer))
+        self.has_events.set()
+
+    def execute(self, event, cancellation: CancellationToken, result_format: str):
+        '''
+        Runs the event and encodes its result for the client, as a JSON string or as the records packed
+        into a msgpack message.
+        '''
+        result = self.nblyzer.execute_event(event, cancellation)
+        if not result:
+            return None
+        if result_format == MSGPACK:
+            return result.records(positions=self.nblyzer.positions())
+        return self.nblyzer.serialize(result)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.has_events.wait()
+            event_str, event, message_id, writer = self.queue.popleft()
+            if not self.queue:
+                self.has_events.clear()
+
+            self.cancellation = CancellationToken()
+            self.running = event
+            result_format = self.server.formats.get(writer, JSON)
+            try:
+                result = await loop.run_in_executor(None, self.execute, event, self.cancellation, result_format)
+            except AnalysisCancelled:
+                await self.server.send(writer, "cancelled", message_id)
+                continue
+            except Exception as e:
+                await self.server.send(writer, "error", message_id, error=f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                self.cancellation = None
+                self.running = None
+
+            if event_str == "close_notebook":
+                await self.server.close_session(self, writer, message_id)
+                return
+            await self.server.send(writer, "success", message_id, result, result_format=result_format)
+
+class NBLyzerServer:
+    def __init__(self) -> None:
+        self.sessions: dict[str, NotebookSession] = {}
+        self.shutdown_condition = False
+        self.stopped: asyncio.Event = None
+        self.clients: dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.formats: dict[asyncio.StreamWriter, str] = {}
+
+    async def start(self, host = hostname, port = port_no) -> asyncio.AbstractServer:
+        self.stopped = asyncio.Event()
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def serve_forever(self, host = hostname, port = port_no) -> None:
+        async with await self.start(host, port):
+            await self.stopped.wait()
+            for writer in self.clients.values():
+                writer.close()
+            await asyncio.gather(*self.clients.keys(), return_exceptions=True)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients[asyncio.current_task()] = writer
         try:
-            return RunCellEvent(params["changed_cell_id"])
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "open_notebook":
+            while not self.stopped.is_set():
+                payload = await read_message(reader)
+                if payload is None:
+                    break
+                await self.dispatch(payload, writer)
+        finally:
+            self.clients.pop(asyncio.current_task(), None)
+            self.formats.pop(writer, None)
+            writer.close()
+
+    async def dispatch(self, payload: bytes, writer: asyncio.StreamWriter) -> None:
+        message_id = None
         try:
-            return OpenNotebookEvent(params["notebook_json"])
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "add_active_analyses":
+            event_str, params, notebook_name, message_id, result_format = parse_client_message(payload.decode())
+            # Checked once the id is known, so that the client can match the error with its request.
+            check_format(result_format)
+            event = get_event(event_str, params)
+        except Exception as e:
+            await self.send(writer, "error", message_id, error=str(e))
+            return
+
+        if result_format:
+            self.formats[writer] = result_format
+        if not event:
+            await self.send(writer, "stopping", message_id)
+            self.stopped.set()
+            return
+
+        if event_str == "open_notebook":
+            self.shutdown_condition = True
+        if notebook_name not in self.sessions:
+            self.sessions[notebook_name] = NotebookSession(self, notebook_name)
+        await self.sessions[notebook_name].submit(event_str, event, message_id, writer)
+
+    async def close_session(self, session: NotebookSession, writer: asyncio.StreamWriter, message_id) -> None:
+        self.sessions.pop(session.notebook_name, None)
+        if self.shutdown_condition and not len(self.sessions):
+            await self.send(writer, "terminated", message_id)
+            self.stopped.set()
+        else:
+            await self.send(writer, "success", message_id)
+
+    async def send(self, writer: asyncio.StreamWriter, status: str, message_id = None, result = None, error: str = None, result_format: str = None) -> None:
+        '''
+        Sends a message in the format the client asked for, or in the format the result was encoded in by
+        NotebookSession.execute.
+        '''
+        if writer.is_closing():
+            return
+        if (result_format or self.formats.get(writer)) == MSGPACK:
+            payload = packed_server_message(status, message_id, result, error)
+        else:
+            payload = server_message(status, message_id, result, error).encode()
         try:
+            writer.write(frame_message(payload))
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+def get_event(event_str, params):
+    if isinstance(params, dict) and params.get("workers", 1) != 1:
+        # Events run in threads of the server, worker processes can not be forked from it safely (process_pool).
+        raise ValueError("The server does not start worker processes, workers must be 1")
+    try:
+        if event_str == "run_cell":
+            return RunCellEvent(params["changed_cell_id"])
+        elif event_str == "run_all_starts":
+            return RunAllStartsEvent(params.get("workers", 1))
+        elif event_str == "open_notebook":
+            return OpenNotebookEvent(params["notebook_json"], params.get("workers", 1))
+        elif event_str == "add_active_analyses":
             return AddActiveAnalysesEvent(params["active_analyses"])
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "add_cell":
-        try:
+        elif event_str == "add_cell":
             return AddCellEvent(params["position"], params["kind"], params["content"])
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "remove_cell":
-        try:
+        elif event_str == "remove_cell":
             return RemoveCellEvent(params["position"])
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "change_cell":
-        try:
+        elif event_str == "change_cell":
             return ChangeCellCodeEvent(str(params["new_code"]), int(params["cell_index"]), bool(params["with_result"]))
-        except:
-            Exception("Wrong parameters were given")
-    elif event_str == "close_notebook":
-        try:
+        elif event_str == "close_notebook":
             return CloseNotebookEvent()
-        except:
-            Exception("Wrong parameters were given")
-    else:
-        return
+        else:
+            return
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Wrong parameters were given")
+
+def serve(host = hostname, port = port_no):
+    asyncio.run(NBLyzerServer().serve_forever(host, port))
 
 if __name__ == "__main__":
-    serve()
\ No newline at end of file
+    serve()
@@ -0,0 +1,79 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Phases timed while an event runs.
+PARSE = "parse"
+CFG = "cfg"
+BENIGET = "beniget"
+UDA = "uda"
+NECESSARY = "necessary cells"
+INTRA_FIXPOINT = "intra fixpoint"
+PHI = "phi"
+SUMMARIZE = "summarize"
+SERIALIZE = "serialize"
+PHASES = [PARSE, CFG, BENIGET, UDA, NECESSARY, INTRA_FIXPOINT, PHI, SUMMARIZE, SERIALIZE]
+
+_local = threading.local()
+
+class Timings:
+    '''
+    Time in nanoseconds (perf_counter_ns), number of calls and number of processed items (CFG nodes
+    visited by the intra cell fixpoint) of every phase of an event.
+    '''
+    def __init__(self) -> None:
+        self.phases: dict[str, list[int]] = {}
+
+    def add(self, phase: str, ns: int, items: int = 0) -> None:
+        entry = self.phases.setdefault(phase, [0, 0, 0])
+        entry[0] += ns
+        entry[1] += 1
+        entry[2] += items
+
+    def merge(self, other: "Timings") -> None:
+        for phase, (ns, calls, items) in other.phases.items():
+            entry = self.phases.setdefault(phase, [0, 0, 0])
+            entry[0] += ns
+            entry[1] += calls
+            entry[2] += items
+
+    def ns(self, phase: str) -> int:
+        return self.phases.get(phase, [0, 0, 0])[0]
+
+    def to_dict(self) -> dict[str, dict[str, int]]:
+        return {phase: {"ns": ns, "calls": calls, "items": items} for phase, (ns, calls, items) in self.phases.items()}
+
+    def get_row(self) -> list[int]:
+        '''
+        Time of every phase of PHASES in nanoseconds, followed by the number of visited CFG nodes.
+        '''
+        return [self.ns(phase) for phase in PHASES] + [self.phases.get(INTRA_FIXPOINT, [0, 0, 0])[2]]
+
+def current_timings() -> Timings:
+    '''
+    Timings of the event running in this thread, None outside of events.
+    '''
+    return getattr(_local, "timings", None)
+
+def set_timings(timings: Timings) -> Timings:
+    '''
+    Makes the timings the ones phases of this thread are recorded in, returns the previous ones.
+    '''
+    previous = current_timings()
+    _local.timings = timings
+    return previous
+
+@contextmanager
+def timed(phase: str):
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter_ns() - start)
@@ -0,0 +1,75 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from nblyzer.src import benchmarker
+from nblyzer.src.benchmarker import benchmark, status_path, stats_path
+from nblyzer.src.timing import Timings
+from nblyzer.src.resource_utils.utils import TEST_RES_PATH
+from nblyzer.src.constants import *
+
+class TestBenchmarker(unittest.TestCase):
+    def read(self, path):
+        with open(path, newline="") as f:
+            return list(csv.reader(f))[1:]
+
+    def test_corpus(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for notebook in ["dataleak_true.ipynb", "Test.ipynb"]:
+                shutil.copy(TEST_RES_PATH + notebook, folder)
+            with open(os.path.join(folder, "broken.ipynb"), "w") as f:
+                f.write("{")
+            with open(os.path.join(folder, "syntax.ipynb"), "w") as f:
+                f.write('{"cells": [{"cell_type": "code", "source": "x = ("}]}')
+            output = os.path.join(folder, "out_")
+
+            benchmark(folder + os.sep, [DATA_LEAK, STALE], 10, output, notebooks_to_run=["dataleak_true.ipynb", "broken.ipynb"], workers=2)
+            statuses = {row[0]: row[1] for row in self.read(status_path(output))}
+            self.assertEqual(statuses, {"dataleak_true.ipynb": "ok", "broken.ipynb": "decode error"})
+            stale_rows = self.read(stats_path(output, STALE))
+            self.assertEqual([(row[0], row[1]) for row in stale_rows], [("dataleak_true.ipynb", str(start)) for start in range(5)])
+
+            benchmark(folder + os.sep, [DATA_LEAK, STALE], 10, output, workers=2, timeout=60, resume=True)
+            statuses = {row[0]: row[1] for row in self.read(status_path(output))}
+            self.assertEqual(statuses, {"dataleak_true.ipynb": "ok", "broken.ipynb": "decode error", "Test.ipynb": "ok", "syntax.ipynb": "syntax error"})
+            stale_rows = self.read(stats_path(output, STALE))
+            self.assertEqual(stale_rows[:5], [row for row in stale_rows if row[0] == "dataleak_true.ipynb"])
+            self.assertTrue(any(row[0] == "Test.ipynb" for row in stale_rows))
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "the notebook processes inherit the patch when forked")
+    def test_failing_notebooks(self):
+        def failing_analyze_notebook(path, *args):
+            name = os.path.basename(path)
+            if name == "hang.ipynb":
+                time.sleep(60)
+            elif name == "crash.ipynb":
+                os._exit(3)
+            elif name == "oom.ipynb":
+                raise MemoryError()
+            return benchmarker.OK, "", {}, Timings()
+
+        with tempfile.TemporaryDirectory() as folder:
+            for notebook in ["hang.ipynb", "crash.ipynb", "oom.ipynb", "ok.ipynb"]:
+                shutil.copy(TEST_RES_PATH + "dataleak_true.ipynb", os.path.join(folder, notebook))
+            output = os.path.join(folder, "out_")
+
+            with mock.patch.object(benchmarker, "analyze_notebook", failing_analyze_notebook):
+                benchmark(folder + os.sep, [DATA_LEAK], 10, output, workers=2, timeout=1)
+            rows = {row[0]: (row[1], row[3]) for row in self.read(status_path(output))}
+            self.assertEqual(rows, {"hang.ipynb": ("timeout", ""), "crash.ipynb": ("crash", "exit code 3"), "oom.ipynb": ("out of memory", ""), "ok.ipynb": ("ok", "")})
+
+            # Resuming does not run the recorded notebooks again, whatever their status.
+            with mock.patch.object(benchmarker, "analyze_notebook", lambda *args: (benchmarker.OK, "", {}, Timings())):
+                benchmark(folder + os.sep, [DATA_LEAK], 10, output, workers=2, timeout=1, resume=True)
+            self.assertEqual({row[0]: (row[1], row[3]) for row in self.read(status_path(output))}, rows)
+            self.assertEqual(len(self.read(status_path(output))), 4)
+
+if __name__ == "__main__":
+    unittest.main()
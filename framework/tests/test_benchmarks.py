@@ -0,0 +1,80 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import ast
+import os
+import tempfile
+import unittest
+from nblyzer.src.benchmarks.notebook_generator import generate_notebook
+from nblyzer.src.benchmarks.scaling import fit_power, fit_exponential, prepare, measure, run_suite, compare, curves_baseline, DEFAULT_SHAPE
+from nblyzer.src.benchmarks import save_baseline, load_baseline
+from nblyzer.src.events import RunAllStartsEvent
+from nblyzer.src.benchmarks import lattice
+from nblyzer.src.constants import *
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generator(self):
+        notebook = generate_notebook(cells=12, variables=2, fan_out=2, chain=4, loops=2, tts_density=0.5, seed=3)
+        self.assertEqual(notebook, generate_notebook(cells=12, variables=2, fan_out=2, chain=4, loops=2, tts_density=0.5, seed=3))
+        code_cells = [cell for cell in notebook["cells"] if cell["cell_type"] == "code"]
+        self.assertEqual(len(code_cells), 12)
+        for cell in code_cells:
+            ast.parse("".join(cell["source"]))
+
+    def test_fits(self):
+        xs = [1, 2, 4, 8]
+        self.assertAlmostEqual(fit_power(xs, [3 * x ** 2 for x in xs]), 2)
+        self.assertAlmostEqual(fit_exponential(xs, [5 * 3 ** x for x in xs]), 3)
+
+    def test_suite(self):
+        curves = run_suite([STALE, IDLE], {"cells": [2, 4], "level": [1, 2]}, {"cells": 4, "chain": 2}, level=2, repeat=1)
+        self.assertEqual([curve.key for curve in curves], [STALE + "|cells", STALE + "|level", IDLE + "|cells"])
+        self.assertEqual(set(curves[0].gated()), {"visits_growth", "phi_growth", "memory_growth"})
+        self.assertEqual(set(curves[2].gated()), {"memory_growth"})
+        # The gated work is counted, so it is the same on every run.
+        rerun = run_suite([STALE], {"cells": [2, 4]}, {"cells": 4, "chain": 2}, level=2, repeat=1)
+        self.assertEqual((rerun[0].visits, rerun[0].phi_tests), (curves[0].visits, curves[0].phi_tests))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "scaling.json")
+            save_baseline(curves_baseline(curves), path)
+            baseline = load_baseline(path)
+        self.assertFalse(any(row[-1] for row in compare(curves, baseline)))
+
+        baseline[STALE + "|cells"]["memory_growth"] -= 2
+        baseline[STALE + "|level"]["visits_growth"] -= 2
+        baseline[IDLE + "|cells"]["time_growth"] -= 2
+        regressed = {row[0] for row in compare(curves, baseline) if row[-1]}
+        self.assertEqual(regressed, {STALE + "|cells", STALE + "|level"})
+
+    def test_data_leak_point(self):
+        shape = dict(DEFAULT_SHAPE, cells=8)
+        notebook = generate_notebook(**shape)
+        model_cells = {position for position, cell in enumerate(notebook["cells"]) if "train_test_split(" in cell["source"]}
+        self.assertTrue(model_cells)
+        nblyzer = prepare(DATA_LEAK, notebook, 2)
+        result = nblyzer.execute_event(RunAllStartsEvent())
+        self.assertGreater(len(nblyzer.all_analyses[DATA_LEAK].stats), 1)
+        leaks = {error.cell_id for path_result in result.path_results for error in path_result.error_infos if "data leak" in error.error_message}
+        self.assertEqual(leaks, {nblyzer.notebook_IR.cell_id_at(position) for position in model_cells})
+        # The measured run propagates from the analyzed starts into the following cells.
+        self.assertGreater(measure(DATA_LEAK, shape, 2, repeat=1)[3], 0)
+
+    def test_lattice_cases(self):
+        for name in ["data frame set cartesian overlap", "data frame set weak overlap"]:
+            setup, operation = lattice.CASES[name]
+            self.assertFalse(operation(*setup()))
+        setup, operation = lattice.CASES["data frame set join"]
+        joined = operation(*setup())
+        self.assertEqual(len(joined["s0"]), lattice.INTERVALS * 3 // 2)
+
+    def test_lattice_suite(self):
+        results = lattice.run_suite(["rows join", "state contains"], number=1)
+        self.assertEqual(list(results["cases"]), ["rows join", "state contains"])
+        self.assertFalse(any(row[-1] for row in lattice.compare(results, results)))
+        self.assertFalse(any(row[-1] for row in lattice.compare(results, {})))
+
+        baseline = {"cases": {name: {"relative": case["relative"] / 3} for name, case in results["cases"].items()}}
+        self.assertEqual([row[0] for row in lattice.compare(results, baseline) if row[-1]], ["rows join", "state contains"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,12 @@
 # Licensed under the MIT license.
 
 from ast import Assert
+from copy import deepcopy
 import unittest
 
 from nblyzer.src.IR.intermediate_representations import IntermediateRepresentations
 from nblyzer.src.analyses.abs_states.dataleak_abs_state import DataLeakAbstractDomain, DataLeakAbstractState, Usage
+from nblyzer.src.analyses.abs_states.code_impact_abs_state import CodeImpactAS
 from nblyzer.src.analyses.abs_domains.dataleak_lattice.data_frame_sets import DataFrameSet
 from nblyzer.src.analyses.abs_domains.dataleak_lattice.data_frame import DataFrame
 from nblyzer.src.analyses.abs_domains.dataleak_lattice.columns import Columns
@@ -213,6 +215,32 @@ class TestDataFrames(unittest.TestCase):
 
         self.assertEqual(dfs1 | dfs2, ref_dfs)
 
+    def test_copy_on_write(self):
+        a_state: CodeImpactAS = CodeImpactAS({'x': 0})
+        copied: CodeImpactAS = deepcopy(a_state)
+        self.assertTrue(copied.impacted_variables.shares(a_state.impacted_variables))
+        self.assertEqual(copied, a_state)
+        self.assertTrue(a_state.contains(copied))
+
+        copied.set_var_level('x', 0)
+        self.assertTrue(copied.impacted_variables.shares(a_state.impacted_variables))
+        copied.set_var_level('y', 1)
+        self.assertFalse(copied.impacted_variables.shares(a_state.impacted_variables))
+        self.assertEqual(dict(a_state.impacted_variables.items()), {'x': 0})
+        self.assertEqual(dict(copied.impacted_variables.items()), {'x': 0, 'y': 1})
+
+        dl_state: DataLeakAbstractState = DataLeakAbstractState()
+        dl_state.state['df'] = DataLeakAbstractDomain(DataFrameSet(), False, set())
+        dl_copied: DataLeakAbstractState = deepcopy(dl_state)
+        del dl_copied.state['df']
+        self.assertIn('df', dl_state.state)
+        self.assertNotIn('df', dl_copied.state)
+
+        dfs1: DataFrameSet = DataFrameSet({'file1': [DataFrame('file1', Columns({'id': True}), Rows(1, 6))]})
+        dfs2: DataFrameSet = DataFrameSet({'file1': [DataFrame('file1', Columns({'id': True}), Rows(9, 12))]})
+        dfs1 | dfs2
+        self.assertEqual(len(dfs1.frames['file1']), 1)
+
     def test_condition_detection(self):
 
         dfs1: DataFrameSet = DataFrameSet({
@@ -2,12 +2,23 @@
 # Licensed under the MIT license.
 import unittest
 import json
+import threading
+import time
+from copy import deepcopy
+from unittest import mock
 from nblyzer.src.events import *
 from nblyzer.src.nblyzer import NBLyzer
 from nblyzer.src.resource_utils.utils import TEST_RES_PATH
 from nblyzer.src.resource_utils.rsrc_mngr import mngr
 from nblyzer.src.constants import *
+from nblyzer.src.analyses.runner.cancellation import CancellationToken, AnalysisCancelled
+from nblyzer.src import timing
+from nblyzer.src.analyses.runner.analysis_results import Result, PathResult, ErrorInfo, ErrorType
+from nblyzer.src.IR.notebook_IR import variable_consumers, symbol_table
 
+def slow_chunk(starts, states):
+    time.sleep(10)
+    return []
 
 class TestEvents(unittest.TestCase):
     def setUp(self):
@@ -32,5 +43,176 @@ class TestEvents(unittest.TestCase):
         #self.assertEqual(results, '[{"cell_id":4,"errors":[{"line":2,"label":"X_selected_test", "error_type":"ErrorType.TERMINAL", "message":"Training model with data leak."}],"path":[0, 1, 2, 3, 4]},{"cell_id":2,"errors":[{"line":2,"label":"y_test", "error_type":"ErrorType.CRITICAL", "message":"Variable uses outdated values."},{"line":2,"label":"X_selected_test", "error_type":"ErrorType.CRITICAL", "message":"Variable uses outdated values."},{"line":2,"label":"y_train", "error_type":"ErrorType.CRITICAL", "message":"Variable uses outdated values."},{"line":2,"label":"X_selected_train", "error_type":"ErrorType.CRITICAL", "message":"Variable uses outdated values."}],"path":[0, 1, 2]},{"cell_id":3,"errors":[{"line":3,"label":"a", "error_type":"ErrorType.CRITICAL", "message":"Variable uses outdated values."}],"path":[0, 1, 2, 3]},{"cell_id":4,"errors":[{"line":2,"label":"y_pred", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}],"path":[4]}]')
         self.assertTrue(True)
 
+    def test_structural_edits_keep_ids(self):
+        notebook_IR = self.nblyzer.notebook_IR
+        cells_before = {cell_id: notebook_IR[cell_id] for cell_id in notebook_IR}
+        AddCellEvent(1, 2, "unused_var = 1").execute(self.nblyzer)
+        AddCellEvent(0, 1, "# markdown").execute(self.nblyzer)
+        RemoveCellEvent(3).execute(self.nblyzer)
+
+        for cell_id, cell_IR in cells_before.items():
+            if cell_id != 1:
+                self.assertIs(notebook_IR[cell_id], cell_IR)
+                self.assertEqual(cell_IR.cell_id, cell_id)
+        self.assertNotIn(1, notebook_IR)
+        self.assertEqual(notebook_IR.order, [6, 0, 5, 2, 3, 4])
+        self.assertEqual(notebook_IR.code_cells(), [0, 5, 2, 3, 4])
+
+        results = RunBatchEvent(1).execute(self.nblyzer)
+        self.assertEqual(self.nblyzer.serialize(results, True), results.dumps(True, {6: 0, 0: 1, 5: 2, 2: 3, 3: 4, 4: 5}))
+        self.assertIn('{"cell_id":2,"errors":[{"line":1,"label":"unused_var", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}],"path":[2]}', self.nblyzer.serialize(results, True))
+
+    def test_start_without_code(self):
+        for event in [RunBatchEvent(7), RunCellEvent(7)]:
+            with self.assertRaisesRegex(ValueError, "Cannot start from cell with no code"):
+                self.nblyzer.execute_event(event)
+
+        AddCellEvent(0, 1, "# markdown").execute(self.nblyzer)
+        records = json.loads(self.nblyzer.serialize(RunBatchEvent(0).execute(self.nblyzer)))
+        self.assertEqual([(record["cell_id"], record["errors"][0]["message"]) for record in records], [(0, "Cannot start from cell with no code")])
+
+    def test_serialization(self):
+        results = Result()
+        results.add_path_results([
+            PathResult([0, 2], [ErrorInfo(2, 1, 'df["a"]', ErrorType.CRITICAL, "Path: c:\\data\n"), ErrorInfo(2, 3, "é", ErrorType.TERMINAL, "ok")]),
+            PathResult([1], [ErrorInfo(1, 2, "x", ErrorType.TERMINAL, "ok")]),
+        ])
+        dumped = results.dumps(True)
+        self.assertEqual(json.loads(dumped), results.records(True))
+        self.assertEqual(results.records(True)[0]["errors"][0], {"line": 1, "label": 'df["a"]', "error_type": "ErrorType.CRITICAL", "message": "Path: c:\\data\n"})
+        self.assertIn('{"line":3,"label":"é", "error_type":"ErrorType.TERMINAL", "message":"ok"}],"path":[0, 2]}', dumped)
+
+        lines = results.dumps(True, {0: 0, 2: 1}, ndjson=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], results.records(True, {0: 0, 2: 1}))
+        self.assertEqual(results.dumps(positions={}), "")
+
+    def test_result_indexes(self):
+        errors = [ErrorInfo(cell_id, line, "x", ErrorType.CRITICAL, "m") for cell_id in range(3) for line in range(2)]
+        path_results = [
+            PathResult([0, 1], errors[2:4]), PathResult([0], errors[0:1]), PathResult([2, 1], errors[2:3] + errors[4:5]),
+            PathResult([1, 2], errors[4:6]), PathResult([2], errors[0:2]), PathResult([0, 1], errors[3:4] * 2)
+        ]
+        results = Result()
+        for path_result in path_results:
+            for other in [PathResult([9], errors[i:j]) for i in range(6) for j in range(i + 1, 7)]:
+                self.assertEqual(other in results, other in results.path_results)
+            results.add_path_result(path_result)
+
+        self.assertIs(results.has_path_with_error_cell(1), path_results[0])
+        self.assertIsNone(results.has_path_with_error_cell(5))
+        self.assertEqual([path_result.path for path_result in results.distinct_errors().path_results], [(0, 1), (0,), (1, 2)])
+        joined = results.join_by_cell_id()
+        self.assertEqual([path_result.error_infos for path_result in joined.path_results], [
+            tuple(errors[2:4] + errors[2:3] + errors[4:5] + errors[3:4] * 2), tuple(errors[0:1]), tuple(errors[4:6] + errors[0:2])
+        ])
+        self.assertIn(PathResult([9], errors[2:5]), joined)
+        self.assertEqual(path_results[0].error_infos, tuple(errors[2:4]))
+        self.assertIs(deepcopy(results).path_results[0], path_results[0])
+        self.assertEqual(errors[0].with_message("n"), ErrorInfo(0, 0, "x", ErrorType.CRITICAL, "n"))
+
+    def test_consumer_index(self):
+        notebook_IR = self.nblyzer.notebook_IR
+        self.assertEqual(notebook_IR.consumers()["X_selected_train"], {3})
+        AddCellEvent(2, 2, "print(X_selected, y)").execute(self.nblyzer)
+        ChangeCellCodeEvent("lr = LogisticRegression()\na = lr.fit(X_selected_test, y_test)", 4, False).execute(self.nblyzer)
+        RemoveCellEvent(1).execute(self.nblyzer)
+        self.assertEqual(dict(notebook_IR.consumers()), dict(variable_consumers(dict(notebook_IR))))
+        self.assertEqual(notebook_IR.consumers()["X_selected"], {2, 5})
+        self.assertNotIn("X_selected_train", notebook_IR.consumers())
+
+    def test_symbol_table(self):
+        notebook_IR = self.nblyzer.notebook_IR
+        symbols = notebook_IR.symbols()
+        unbound_names = symbols.unbound_names()
+        AddCellEvent(2, 2, "import numpy as np\nprint(np.zeros(3), y)").execute(self.nblyzer)
+        ChangeCellCodeEvent("lr = LogisticRegression()\na = lr.fit(X_selected_test, y_test)", 4, False).execute(self.nblyzer)
+        RemoveCellEvent(1).execute(self.nblyzer)
+        rebuilt = symbol_table(dict(notebook_IR))
+        self.assertEqual(symbols.definitions, rebuilt.definitions)
+        self.assertEqual(symbols.unbound, rebuilt.unbound)
+        self.assertEqual(symbols.imports, rebuilt.imports)
+        self.assertIn("np", symbols.imported_names())
+        self.assertNotIn("X_selected_train", unbound_names)
+
+    def test_cancelled_run_cell_event(self):
+        cancellation = CancellationToken()
+        cancellation.cancel()
+        with self.assertRaises(AnalysisCancelled):
+            self.nblyzer.execute_event(RunCellEvent(0), cancellation)
+        self.assertEqual(self.nblyzer.notebook_IR[0].last_ran_code, self.nblyzer.notebook_IR[0].cell_code)
+        self.assertIsNone(self.nblyzer.all_analyses[STALE].cancellation)
+        self.assertTrue(self.nblyzer.execute_event(RunCellEvent(1), CancellationToken()).path_results)
+
+    def test_run_all_starts(self):
+        self.nblyzer.cache_results = False
+        RunCellEvent(0).execute(self.nblyzer)
+        dataleak, stale = self.nblyzer.all_analyses[DATA_LEAK], self.nblyzer.all_analyses[STALE]
+        tts_count = dataleak.tts_count
+        starts = self.nblyzer.notebook_IR.code_cells()
+        expected = Result()
+        for start in starts:
+            dataleak.tts_count = tts_count
+            expected.join_results(self.nblyzer.run_analyses(start, detailed=True))
+        dataleak.tts_count = tts_count
+        self.assertTrue(expected.path_results)
+
+        for workers in [1, 3]:
+            logged = len(stale.stats)
+            results = self.nblyzer.execute_event(RunAllStartsEvent(workers))
+            self.assertEqual(self.nblyzer.serialize(results, True), self.nblyzer.serialize(expected, True))
+            self.assertEqual(dataleak.tts_count, tts_count)
+            self.assertEqual([stat.start_cell for stat in stale.stats[logged:]], starts)
+
+    def test_cancelled_run_all_starts(self):
+        # The pool is left as soon as the token is cancelled, not after the running chunks.
+        cancellation = CancellationToken()
+        threading.Timer(0.2, cancellation.cancel).start()
+        start = time.perf_counter()
+        with mock.patch("nblyzer.src.nblyzer._run_starts_in_worker", slow_chunk):
+            with self.assertRaises(AnalysisCancelled):
+                self.nblyzer.execute_event(RunAllStartsEvent(2), cancellation)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_timings(self):
+        nblyzer = NBLyzer()
+        nblyzer.execute_event(OpenNotebookEvent([{"cell_type": "code", "source": "timed_df = load()\ntimed_x = timed_df.head()"}, {"cell_type": "code", "source": "print(timed_x)"}]))
+        self.assertGreater(nblyzer.timings.ns(timing.PARSE), 0)
+        nblyzer.add_analyses([STALE])
+        results = nblyzer.execute_event(RunBatchEvent(0))
+        self.assertEqual(set(nblyzer.timings.phases), {timing.PARSE, timing.CFG, timing.BENIGET, timing.UDA, timing.NECESSARY, timing.INTRA_FIXPOINT, timing.PHI})
+        run_stats = nblyzer.all_analyses[STALE].stats[-1]
+        self.assertEqual(nblyzer.timings.phases[timing.INTRA_FIXPOINT][1:], [len(run_stats.cell_times), sum(run_stats.node_visits)])
+        self.assertGreater(sum(run_stats.node_visits), 0)
+        nblyzer.serialize(results)
+        self.assertEqual(nblyzer.timings.phases[timing.SERIALIZE][1], 1)
+        nblyzer.execute_event(RunCellEvent(0))
+        self.assertIn(timing.SUMMARIZE, nblyzer.timings.phases)
+        self.assertEqual(len(nblyzer.timings.get_row()), len(timing.PHASES) + 1)
+
+    def test_result_cache(self):
+        uncached = NBLyzer(cache_results=False)
+        uncached.load_notebook(mngr.grab_local_json(TEST_RES_PATH + "dataleak_true.ipynb")["cells"])
+        uncached.add_analyses([DATA_LEAK, STALE, IDLE])
+        code = self.nblyzer.notebook_IR[2].cell_code
+        events = [
+            RunBatchEvent(0), RunBatchEvent(0),
+            ChangeCellCodeEvent(code + "\n# unchanged", 2, False), RunBatchEvent(0),
+            RunCellEvent(0), RunCellEvent(0), RunBatchEvent(1), RunBatchEvent(1)
+        ]
+        hits = []
+        for event in events:
+            results, uncached_results = event.execute(self.nblyzer), event.execute(uncached)
+            if results is not None:
+                self.assertEqual(self.nblyzer.serialize(results, True), uncached.serialize(uncached_results, True))
+            self.assertEqual(self.nblyzer.all_analyses[DATA_LEAK].tts_count, uncached.all_analyses[DATA_LEAK].tts_count)
+            hits.append(self.nblyzer.result_cache.hits)
+        self.assertEqual(hits, [0, 2, 2, 2, 4, 4, 4, 6])
+
+    def test_coalesce_change_cell_events(self):
+        event = ChangeCellCodeEvent("a = 1", 2, True).coalesce(ChangeCellCodeEvent("a = 2", 2, False))
+        self.assertEqual((event.new_code, event.cell_index, event.with_result), ("a = 2", 2, True))
+        self.assertIsNone(ChangeCellCodeEvent("a = 1", 2, True).coalesce(ChangeCellCodeEvent("a = 2", 3, False)))
+        self.assertIsNone(RunCellEvent(2).coalesce(ChangeCellCodeEvent("a = 2", 2, False)))
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,13 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import gc
 import unittest
 from nblyzer.src.analyses.idle_cell_analysis import IdleCellAnalysis
 from nblyzer.src.resource_utils.utils import load_notebook, TEST_RES_PATH
 from nblyzer.src.resource_utils.rsrc_mngr import mngr
+from nblyzer.src.IR.intermediate_representations import IntermediateRepresentations
+from nblyzer.src.IR.notebook_IR import NotebookIR
 
 
 class TestIdleCellAnalysis(unittest.TestCase):
@@ -21,5 +24,42 @@ class TestIdleCellAnalysis(unittest.TestCase):
         analyzer_basic = IdleCellAnalysis()
         self.assertEqual(analyzer_basic.analyze_notebook(basic_IR).dumps(), '[{"cell_id":0,"errors":[{"line":1,"label":"x", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}]},{"cell_id":1,"errors":[{"line":1,"label":"y", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}]}]')
 
+    def test_incremental(self):
+        notebook_IR = NotebookIR()
+        for code in ["# x is unused\nx = 1", "y = 2", "z = y", "w = 1\nw = w + 1"]:
+            cell_id = notebook_IR.add_cell()
+            notebook_IR[cell_id] = IntermediateRepresentations(code, cell_id)
+        analyzer = IdleCellAnalysis()
+        checked = []
+        check_cell = analyzer.check_cell
+        analyzer.check_cell = lambda cell_id, cell_IR, unbound_vars: checked.append(cell_id) or check_cell(cell_id, cell_IR, unbound_vars)
+
+        self.assertEqual(analyzer.analyze_notebook(notebook_IR).dumps(), '[{"cell_id":0,"errors":[{"line":2,"label":"x", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}]},{"cell_id":2,"errors":[{"line":1,"label":"z", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}]},{"cell_id":3,"errors":[{"line":2,"label":"w", "error_type":"ErrorType.TERMINAL", "message":"Variable is not used outside this cell."}]}]')
+        self.assertEqual(checked, [0, 1, 2, 3])
+
+        checked.clear()
+        notebook_IR[2] = IntermediateRepresentations("z = x", 2)
+        result = analyzer.analyze_notebook(notebook_IR)
+        self.assertEqual(sorted(checked), [0, 1, 2])
+        self.assertEqual(result.dumps(), IdleCellAnalysis().analyze_notebook(dict(notebook_IR)).dumps())
+
+        checked.clear()
+        notebook_IR.remove_cell(2)
+        result = analyzer.analyze_notebook(notebook_IR)
+        self.assertEqual(sorted(checked), [0])
+        self.assertEqual(result.dumps(), IdleCellAnalysis().analyze_notebook(dict(notebook_IR)).dumps())
+
+        # Pending changes are kept per analysis, as a set of names that is emptied by every run.
+        symbols = notebook_IR.symbols()
+        for _ in range(100):
+            notebook_IR[3] = IntermediateRepresentations("w = x", 3)
+            notebook_IR[3] = IntermediateRepresentations("w = 1\nw = w + 1", 3)
+        self.assertEqual(symbols.unbound_changes[analyzer], {"x"})
+        analyzer.analyze_notebook(notebook_IR)
+        self.assertEqual(symbols.unbound_changes[analyzer], set())
+        del analyzer, check_cell
+        gc.collect()
+        self.assertEqual(len(symbols.unbound_changes), 0)
+
 if __name__ == "__main__":
     unittest.main()
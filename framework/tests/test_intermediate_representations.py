@@ -0,0 +1,153 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import ast
+import sys
+import unittest
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import gast
+from nblyzer.src.IR.intermediate_representations import IntermediateRepresentations
+from nblyzer.src.IR.code_representations import CodeRepresentations
+from nblyzer.src.IR.ir_cache import IRCache, ir_cache
+from nblyzer.src.IR import serialization
+from nblyzer.src.analyses.idle_cell_analysis import IdleCellAnalysis
+from nblyzer.src.analyses.isolated_cell_analysis import IsolatedCellAnalysis
+from nblyzer.src.analyses.runner.queue import RankedQueue
+from nblyzer.src.analyses.runner.analyses_utils import find_changed_vars
+
+CELL_CODE = """import numpy as np
+x = np.zeros(10)
+for i in range(3):
+    y = x[i] + z
+df2 = df.dropna().head()
+"""
+
+class TestIntermediateRepresentations(unittest.TestCase):
+    def test_single_parse(self):
+        cell_IR = IntermediateRepresentations(CELL_CODE, 0)
+        self.assertEqual(gast.dump(cell_IR.AST), gast.dump(gast.parse(CELL_CODE)))
+        self.assertEqual(cell_IR.UDA.def_use_chains.unbound_names, {"z", "df"})
+        self.assertEqual(cell_IR.UDA.unbound_final, {"z", "df"})
+        self.assertEqual(set(cell_IR.UDA.defined_vars.keys()), {"x", "y", "df2"})
+
+        reparsed_IR = CodeRepresentations(CELL_CODE)
+        reparsed_IR.update_cfg()
+        self.assertEqual(
+            [node.label for node in cell_IR.CFG.nodes],
+            [node.label for node in reparsed_IR.CFG.nodes]
+        )
+
+    def test_ir_cache(self):
+        cache = IRCache(maxsize=2)
+        first = cache.get("a = 1")
+        self.assertIs(cache.get("a = 1"), first)
+        self.assertEqual(cache.cache_info(), (1, 1, 2, 1, 0))
+
+        cache.get("b = a")
+        cache.get("c = b")
+        self.assertIsNot(cache.get("a = 1"), first)
+        self.assertEqual(cache.cache_info().currsize, 2)
+
+    def test_shared_code_IR(self):
+        cell_IR = IntermediateRepresentations("%matplotlib inline\ny = x", 3, "y = 1")
+        other_IR = IntermediateRepresentations("y = x", 7)
+        self.assertIs(cell_IR.code_IR, other_IR.code_IR)
+        self.assertIs(cell_IR.CFG, ir_cache.get("y = x").CFG)
+        self.assertEqual((cell_IR.cell_id, cell_IR.last_ran_code), (3, "y = 1"))
+        self.assertEqual((other_IR.cell_id, other_IR.last_ran_code), (7, ""))
+
+    def test_concurrent_lazy_builds(self):
+        expected = CodeRepresentations(CELL_CODE)
+        expected_labels = [node.label for node in expected.CFG.nodes]
+        # Switch threads as often as possible, so builds of the same tree interleave.
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for _ in range(20):
+                code_IR = CodeRepresentations(CELL_CODE)
+                readers = [lambda: gast.dump(code_IR.AST), lambda: [node.label for node in code_IR.CFG.nodes], lambda: code_IR.UDA.unbound_final]
+                with ThreadPoolExecutor(max_workers=6) as pool:
+                    results = list(pool.map(lambda i: readers[i % 3](), range(12)))
+                self.assertEqual(results[0::3], [gast.dump(expected.AST)] * 4)
+                self.assertEqual(results[1::3], [expected_labels] * 4)
+                self.assertEqual(results[2::3], [{"z", "df"}] * 4)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(serialization.loads(serialization.dumps(code_IR)).UDA.unbound_final, {"z", "df"})
+
+    def test_lazy_CFG(self):
+        notebook_IR = {
+            0: IntermediateRepresentations("lazy_a = 1\nlazy_b = lazy_a", 0),
+            1: IntermediateRepresentations("lazy_c = lazy_b + 1", 1),
+        }
+        IdleCellAnalysis().analyze_notebook(notebook_IR)
+        IsolatedCellAnalysis().analyze_notebook(notebook_IR)
+        for cell_IR in notebook_IR.values():
+            self.assertIsNone(cell_IR.code_IR._CFG)
+
+        self.assertEqual([node.label for node in notebook_IR[1].CFG.nodes][1], "lazy_c = lazy_b + 1")
+        self.assertIs(notebook_IR[1].CFG, notebook_IR[1].CFG)
+
+    def test_serialization(self):
+        long_cell = "\n".join(f"x{i} = x{i - 1} + 1" for i in range(1, 1000))
+        code_IR = CodeRepresentations(long_cell)
+        loaded_IR = serialization.loads(serialization.dumps(code_IR))
+        self.assertEqual(len(loaded_IR.CFG.nodes), len(code_IR.CFG.nodes))
+        for node, loaded_node in zip(code_IR.CFG.nodes, loaded_IR.CFG.nodes):
+            self.assertEqual(node.label, loaded_node.label)
+            self.assertEqual([n.label for n in node.outgoing], [n.label for n in loaded_node.outgoing])
+            self.assertTrue(all(n in loaded_IR.CFG.nodes for n in loaded_node.ingoing))
+        self.assertEqual(loaded_IR.UDA.def_use_chains.unbound_names, {"x0"})
+        self.assertEqual(loaded_IR.UDA.defined_vars, code_IR.UDA.defined_vars)
+
+    def test_reverse_postorder(self):
+        code_IR = CodeRepresentations("a = 1\nwhile a:\n    if b:\n        c = a\n    else:\n        c = b\n    a = c\nd = a")
+        order = sorted(code_IR.CFG.nodes, key=code_IR.RPO.__getitem__)
+        self.assertEqual(
+            [node.label for node in order],
+            ["Entry module", "a = 1", "cond a:", "cond b:", "c = a", "c = b", "a = c", "d = a", "Exit module"]
+        )
+        self.assertIs(code_IR.RPO, code_IR.RPO)
+        self.assertIsNone(serialization.loads(serialization.dumps(code_IR))._RPO)
+
+        transform_order = RankedQueue(code_IR.RPO)
+        transform_order.populate(reversed(order[1:]))
+        transform_order.push(order[3])
+        popped = []
+        while not transform_order.empty():
+            popped.append(transform_order.pop())
+        self.assertEqual(popped, order[1:])
+
+    def test_assign_summaries(self):
+        code_IR = CodeRepresentations("a, b = f(x)\ny[i] = x.mean()\nprint(a)")
+        summaries = {node.label: summary for node, summary in code_IR.ASSIGNS.items()}
+        self.assertEqual(summaries["a = ~call_1"], (frozenset({"a", "b"}), frozenset({"f", "x"})))
+        self.assertEqual(summaries["y[i] = ~call_3"], (frozenset({"y"}), frozenset({"x"})))
+        self.assertEqual(len(summaries), 3)
+        self.assertIs(code_IR.ASSIGNS, code_IR.ASSIGNS)
+        self.assertIsNone(serialization.loads(serialization.dumps(code_IR))._ASSIGNS)
+
+    def test_statement_hashes(self):
+        old_IR = CodeRepresentations(CELL_CODE + "y = 1\nz = 1.0\nw = True")
+        new_IR = CodeRepresentations("x = np.zeros(10)\nfor i in range(3):\n    y = x[i] + z\n    x[i] = 1\ny = 1\nz = 1\nw = 1")
+        for node in new_IR.CFG.nodes:
+            for old_node in old_IR.CFG.nodes:
+                if node.ast_node is not None and old_node.ast_node is not None:
+                    self.assertEqual(
+                        new_IR.HASHES[node] == old_IR.HASHES[old_node],
+                        ast.dump(node.ast_node) == ast.dump(old_node.ast_node)
+                    )
+        self.assertEqual(find_changed_vars(new_IR, old_IR), {"x", "z", "w"})
+        self.assertEqual(find_changed_vars(old_IR, old_IR), set())
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            IRCache(directory=directory).get(CELL_CODE)
+            warm_cache = IRCache(directory=directory)
+            code_IR = warm_cache.get(CELL_CODE)
+            self.assertEqual(warm_cache.cache_info(), (0, 0, 2048, 1, 1))
+            self.assertEqual(code_IR.UDA.unbound_final, {"z", "df"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,17 @@
 
 import unittest
 import json
+from unittest import mock
 from nblyzer.src.analyses.dataleak_analysis import DataLeakAnalysis
 from nblyzer.src.analyses.stale_cell_analysis import StaleCellAnalysis
 from nblyzer.src.resource_utils.utils import load_notebook, TEST_RES_PATH
 from nblyzer.src.resource_utils.rsrc_mngr import mngr
 from nblyzer.src.nblyzer import NBLyzer
+from nblyzer.src.events import RunBatchEvent, ChangeCellCodeEvent
 from nblyzer.src.constants import *
+from nblyzer.src.IR.ir_cache import ir_cache
+from nblyzer.src.IR.notebook_IR import variable_consumers
+from nblyzer.src.analyses.runner import phi_index
 
 
 class Testnblyzer(unittest.TestCase):
@@ -25,6 +30,19 @@ class Testnblyzer(unittest.TestCase):
         for i in reference_notebook.keys():
             self.assertEqual(reference_notebook[i], self.nblyzer.notebook_IR[i])
 
+    def test_parallel_load_notebook(self):
+        ir_cache.clear()
+        self.nblyzer.load_notebook(self.notebook_json, workers=2)
+        self.assertEqual(self.nblyzer.notebook_IR.keys(), self.reference_notebook_IR.keys())
+        for i, cell_IR in self.reference_notebook_IR.items():
+            self.assertEqual(cell_IR, self.nblyzer.notebook_IR[i])
+            self.assertEqual(cell_IR.UDA.defined_vars, self.nblyzer.notebook_IR[i].UDA.defined_vars)
+            self.assertEqual(cell_IR.UDA.unbound_final, self.nblyzer.notebook_IR[i].UDA.unbound_final)
+            self.assertEqual(
+                [node.label for node in cell_IR.CFG.nodes],
+                [node.label for node in self.nblyzer.notebook_IR[i].CFG.nodes]
+            )
+
     def test_add_analyses(self):
         self.nblyzer.add_analyses([DATA_LEAK])
         self.assertIn(DATA_LEAK, self.nblyzer.active_analyses)
@@ -69,6 +87,46 @@ class Testnblyzer(unittest.TestCase):
         # as_4 = pickle.loads(mngr.grab_remote("abstract_state_4.pickle"))
         # self.assertEqual(as_4, self.nblyzer.active_analyses[constants.DATA_LEAK].abstract_state)
 
+    def test_worklist_engine(self):
+        for notebook in ["dataleak_true.ipynb", "dataleak_false.ipynb", "Test.ipynb"]:
+            notebook_json = mngr.grab_local_json(TEST_RES_PATH + notebook)["cells"]
+            for level in [2, 4, 6]:
+                for start in load_notebook(notebook_json).keys():
+                    results = []
+                    for worklist in [False, True]:
+                        nblyzer = NBLyzer(level=level, worklist=worklist)
+                        nblyzer.load_notebook(notebook_json)
+                        nblyzer.add_analyses([DATA_LEAK, STALE])
+                        results.append(nblyzer.serialize(nblyzer.execute_event(RunBatchEvent(start)), True))
+                    self.assertEqual(results[0], results[1])
+
+    def test_phi_index(self):
+        analysis = StaleCellAnalysis()
+        notebook_IR = load_notebook(mngr.grab_local_json(TEST_RES_PATH + "Test.ipynb")["cells"])
+        analysis._find_all_imports(notebook_IR)
+        cells = list(notebook_IR.keys())
+        pre_summaries = [analysis.calculate_pre(notebook_IR[c]) for c in cells]
+        enabled = [c % 3 != 1 for c in cells]
+        for projection in [set(), set.union(*pre_summaries), pre_summaries[1] | pre_summaries[2], {"unknown_var"}]:
+            expected = [c for c, pre, enable in zip(cells, pre_summaries, enabled) if pre and enable and pre <= projection and c != 2]
+            index = phi_index.PhiIndex(cells, pre_summaries, enabled, variable_consumers(notebook_IR))
+            self.assertEqual(index.enabled_cells(projection, 2), expected)
+            with mock.patch.object(phi_index, "np", None):
+                index = phi_index.PhiIndex(cells, pre_summaries, enabled, variable_consumers(notebook_IR))
+                self.assertEqual(index.enabled_cells(projection, 2), expected)
+
+    def test_cached_phi_index(self):
+        self.nblyzer.load_notebook(self.notebook_json)
+        self.nblyzer.add_analyses([STALE])
+        with mock.patch("nblyzer.src.analyses.runner.runners.PhiIndex", wraps=phi_index.PhiIndex) as built:
+            self.nblyzer.execute_event(RunBatchEvent(0))
+            self.nblyzer.execute_event(RunBatchEvent(1))
+            self.assertEqual(built.call_count, 1)
+
+            self.nblyzer.execute_event(ChangeCellCodeEvent("unrelated = 1", 2, False))
+            self.nblyzer.execute_event(RunBatchEvent(0))
+            self.assertEqual(built.call_count, 2)
+
 if __name__ == "__main__":
     unittest.main()
     
\ No newline at end of file
@@ -0,0 +1,186 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import unittest
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+from unittest import mock
+from nblyzer.src import nblyzer_server
+from nblyzer.src.nblyzer_server import NBLyzerServer, read_message, frame_message
+from nblyzer.src.nblyzer import NBLyzer
+from nblyzer.src.events import AddActiveAnalysesEvent, OpenNotebookEvent, RunCellEvent
+from nblyzer.src.analyses.runner import analysis_results
+from nblyzer.src.resource_utils.utils import TEST_RES_PATH
+from nblyzer.src.resource_utils.rsrc_mngr import mngr
+from nblyzer.src.constants import *
+
+# Stands in for msgpack, which is optional: it packs messages as JSON behind a zero byte, which no JSON
+# message starts with.
+fake_msgpack = SimpleNamespace(packb=lambda obj: b"\0" + json.dumps(obj).encode(), unpackb=lambda packed: json.loads(packed[1:]))
+
+class TestNBLyzerServer(unittest.TestCase):
+    def setUp(self):
+        self.notebook_json = mngr.grab_local_json(TEST_RES_PATH + "dataleak_true.ipynb")["cells"]
+        self.packed = set()
+
+    async def read_response(self, reader):
+        '''
+        Reads and decodes a message of the server, the ids of packed messages are kept in self.packed.
+        '''
+        payload = await read_message(reader)
+        if not payload.startswith(b"\0"):
+            return json.loads(payload)
+        response = fake_msgpack.unpackb(payload)
+        self.packed.add(response.get("id"))
+        return response
+
+    async def session(self, messages, in_turn = False):
+        '''
+        Sends the messages on one connection, all at once or each after the response to the one before.
+        '''
+        server = NBLyzerServer()
+        tcp_server = await server.start("localhost", 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("localhost", port)
+        responses = []
+        for message in messages:
+            writer.write(frame_message(json.dumps(message).encode()))
+            if in_turn:
+                await writer.drain()
+                responses.append(await self.read_response(reader))
+        await writer.drain()
+        responses += [await self.read_response(reader) for _ in messages[len(responses):]]
+        writer.close()
+        tcp_server.close()
+        await tcp_server.wait_closed()
+        return server, responses
+
+    def test_persistent_connection(self):
+        messages = []
+        for notebook_name in ["first", "second"]:
+            messages += [
+                {"id": len(messages), "event": "open_notebook", "notebook_name": notebook_name, "params": {"notebook_json": self.notebook_json}},
+                {"id": len(messages) + 1, "event": "add_active_analyses", "notebook_name": notebook_name, "params": {"active_analyses": [DATA_LEAK, STALE]}},
+                {"id": len(messages) + 2, "event": "run_cell", "notebook_name": notebook_name, "params": {"changed_cell_id": 0}},
+            ]
+        messages.append({"id": "bad", "event": "run_cell", "notebook_name": "first", "params": {}})
+        messages.append({"id": "workers", "event": "run_all_starts", "notebook_name": "first", "params": {"workers": 2}})
+        server, responses = asyncio.run(self.session(messages))
+
+        nblyzer = NBLyzer()
+        for event in [OpenNotebookEvent(self.notebook_json), AddActiveAnalysesEvent([DATA_LEAK, STALE])]:
+            nblyzer.execute_event(event)
+        expected = json.loads(nblyzer.serialize(nblyzer.execute_event(RunCellEvent(0))))
+
+        responses = {response["id"]: response for response in responses}
+        self.assertEqual(set(server.sessions.keys()), {"first", "second"})
+        self.assertEqual(responses[2], {"id": 2, "status": "success", "result": expected})
+        self.assertEqual(responses[5], responses[2] | {"id": 5})
+        self.assertEqual(responses["bad"]["status"], "error")
+        self.assertEqual(responses["workers"]["status"], "error")
+
+    async def blocked_run(self, follow_up, result_format = None):
+        '''
+        Sends a run_cell and, while its analysis is blocked, the follow-up message. Returns the responses of both.
+        Messages are in result_format from the start if given.
+        '''
+        server = NBLyzerServer()
+        tcp_server = await server.start("localhost", 0)
+        reader, writer = await asyncio.open_connection("localhost", tcp_server.sockets[0].getsockname()[1])
+
+        async def send(message):
+            writer.write(frame_message(json.dumps(message).encode()))
+            await writer.drain()
+
+        await send({"id": 0, "event": "open_notebook", "notebook_name": "nb", "params": {"notebook_json": self.notebook_json}, "format": result_format})
+        await send({"id": 1, "event": "add_active_analyses", "notebook_name": "nb", "params": {"active_analyses": [DATA_LEAK, STALE]}})
+        for _ in range(2):
+            await read_message(reader)
+
+        session = server.sessions["nb"]
+        release = threading.Event()
+        execute_event = session.nblyzer.execute_event
+        def blocking_execute_event(event, cancellation = None):
+            if isinstance(event, RunCellEvent):
+                release.wait()
+            return execute_event(event, cancellation)
+        session.nblyzer.execute_event = blocking_execute_event
+
+        await send({"id": 2, "event": "run_cell", "notebook_name": "nb", "params": {"changed_cell_id": 0}})
+        while not isinstance(session.running, RunCellEvent):
+            await asyncio.sleep(0.01)
+        await send(follow_up)
+        while not session.queue:
+            await asyncio.sleep(0.01)
+        release.set()
+        responses = [await self.read_response(reader) for _ in range(2)]
+
+        writer.close()
+        tcp_server.close()
+        await tcp_server.wait_closed()
+        return {response["id"]: response for response in responses}
+
+    def test_cancellation(self):
+        nblyzer = NBLyzer()
+        for event in [OpenNotebookEvent(self.notebook_json), AddActiveAnalysesEvent([DATA_LEAK, STALE])]:
+            nblyzer.execute_event(event)
+        expected = json.loads(nblyzer.serialize(nblyzer.execute_event(RunCellEvent(0))))
+
+        responses = asyncio.run(self.blocked_run({"id": 3, "event": "add_cell", "notebook_name": "nb", "params": {"position": 1, "kind": 2, "content": "a = 1"}}))
+        self.assertEqual(responses[2], {"id": 2, "status": "success", "result": expected})
+        self.assertEqual(responses[3]["status"], "success")
+
+        responses = asyncio.run(self.blocked_run({"id": 3, "event": "change_cell", "notebook_name": "nb", "params": {"new_code": "a = 1", "cell_index": 2, "with_result": 0}}))
+        self.assertEqual(responses[2]["status"], "success")
+
+        responses = asyncio.run(self.blocked_run({"id": 3, "event": "change_cell", "notebook_name": "nb", "params": {"new_code": "a = 1", "cell_index": 0, "with_result": 0}}))
+        self.assertEqual(responses[2], {"id": 2, "status": "cancelled"})
+
+        responses = asyncio.run(self.blocked_run({"id": 3, "event": "run_cell", "notebook_name": "nb", "params": {"changed_cell_id": 1}}))
+        self.assertEqual(responses[2], {"id": 2, "status": "cancelled"})
+        self.assertEqual(responses[3]["status"], "success")
+
+    def test_formats(self):
+        nblyzer = NBLyzer()
+        for event in [OpenNotebookEvent(self.notebook_json), AddActiveAnalysesEvent([DATA_LEAK, STALE])]:
+            nblyzer.execute_event(event)
+        result = nblyzer.execute_event(RunCellEvent(0))
+        expected = json.loads(nblyzer.serialize(result))
+        with mock.patch.object(analysis_results, "msgpack", fake_msgpack):
+            self.assertEqual(fake_msgpack.unpackb(result.packb(positions=nblyzer.positions())), expected)
+
+        messages = [
+            {"id": 0, "event": "open_notebook", "notebook_name": "nb", "params": {"notebook_json": self.notebook_json}},
+            {"id": 1, "event": "add_active_analyses", "notebook_name": "nb", "params": {"active_analyses": [DATA_LEAK, STALE]}, "format": "msgpack"},
+            {"id": 2, "event": "run_cell", "notebook_name": "nb", "params": {"changed_cell_id": 0}},
+            {"id": 3, "event": "run_cell", "notebook_name": "nb", "params": {"changed_cell_id": 0}, "format": "json"},
+            {"id": "xml", "event": "run_cell", "notebook_name": "nb", "params": {"changed_cell_id": 0}, "format": "xml"},
+        ]
+        with mock.patch.object(nblyzer_server, "msgpack", fake_msgpack):
+            _, responses = asyncio.run(self.session(messages, in_turn=True))
+        responses = {response["id"]: response for response in responses}
+        self.assertEqual(self.packed, {1, 2})
+        self.assertEqual(responses[2], {"id": 2, "status": "success", "result": expected})
+        self.assertEqual(responses[3], responses[2] | {"id": 3})
+        self.assertEqual(responses["xml"]["status"], "error")
+
+        # Without msgpack, asking for it is an error the client can still match with its request.
+        with mock.patch.object(nblyzer_server, "msgpack", None):
+            _, responses = asyncio.run(self.session(messages[:2], in_turn=True))
+        self.assertEqual(responses[1]["id"], 1)
+        self.assertEqual(responses[1]["status"], "error")
+
+        # A result is sent in the format it was encoded in, also if the client switches while it runs.
+        for first, then in [(None, "msgpack"), ("msgpack", "json")]:
+            self.packed = set()
+            follow_up = {"id": 3, "event": "add_cell", "notebook_name": "nb", "params": {"position": 1, "kind": 2, "content": "a = 1"}, "format": then}
+            with mock.patch.object(nblyzer_server, "msgpack", fake_msgpack):
+                responses = asyncio.run(self.blocked_run(follow_up, first))
+            self.assertEqual(responses[2], {"id": 2, "status": "success", "result": expected})
+            self.assertEqual(2 in self.packed, first == "msgpack")
+            self.assertEqual(3 in self.packed, then == "msgpack")
+
+if __name__ == "__main__":
+    unittest.main()
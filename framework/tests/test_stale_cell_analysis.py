@@ -2,10 +2,16 @@
 # Licensed under the MIT license.
 
 import unittest
+import json
+from unittest import mock
 from nblyzer.src.analyses.stale_cell_analysis import StaleCellAnalysis
 from nblyzer.src.IR.intermediate_representations import IntermediateRepresentations
 from nblyzer.src.resource_utils.utils import load_notebook, TEST_RES_PATH
 from nblyzer.src.resource_utils.rsrc_mngr import mngr
+from nblyzer.src.analyses.runner.queue import FifoQueue
+from nblyzer.src.nblyzer import NBLyzer
+from nblyzer.src.events import RunBatchEvent
+from nblyzer.src.constants import STALE
 
 
 class TestStaleCellAnalysis(unittest.TestCase):
@@ -43,6 +49,24 @@ class TestStaleCellAnalysis(unittest.TestCase):
             ''
         )
 
+    def stale_errors(self, cells):
+        nblyzer = NBLyzer()
+        nblyzer.load_notebook([{"cell_type": "code", "source": cell} for cell in cells])
+        nblyzer.add_analyses([STALE])
+        result = json.loads(nblyzer.serialize(nblyzer.execute_event(RunBatchEvent(0))) or "[]")
+        return {(cell["cell_id"], error["line"], error["label"]) for cell in result for error in cell["errors"]}
+
+    def test_levels_converge(self):
+        # Cells 1 and 2 read each other's variables, so each is stale on the path through the other.
+        # The second visit of a cell only raises levels and must still propagate.
+        crossed = ["a = 1\nb = 1\nc = 1\nd = 1", "d = b", "for i in range(2):\n    b = d\na = c", "d = b + d"]
+        # c is raised inside the loop, after the code behind the loop was reached with its lower level.
+        loop = ["a = 1\nb = 1\nc = 1", "a = c + a", "while b > 0:\n    for i in range(2):\n        c = a\nb = c + b\nc = b + a"]
+        for cells, expected in [(crossed, {(1, 1, "d"), (2, 2, "b"), (3, 1, "d")}), (loop, {(1, 1, "a"), (2, 4, "b"), (2, 5, "c")})]:
+            self.assertEqual(self.stale_errors(cells), expected)
+            with mock.patch("nblyzer.src.analyses.runner.runners.RankedQueue", lambda rank: FifoQueue()):
+                self.assertEqual(self.stale_errors(cells), expected)
+
 
 if __name__ == "__main__":
     unittest.main()